@@ -0,0 +1,8 @@
+"""
+Package: benchmarks
+Stand-alone performance benchmarks for the Promotion service
+
+Each module can be run with ``python -m benchmarks.<name>``. They use the
+database in DATABASE_URI (a scratch SQLite file by default), so never point
+them at a database whose data you want to keep.
+"""
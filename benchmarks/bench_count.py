@@ -0,0 +1,45 @@
+"""
+Benchmark: counting the promotions that match a filter, by downloading the
+list against ?count_only=1, exact and estimated
+
+Usage:
+    python -m benchmarks.bench_count [ROWS ...]
+"""
+import sys
+
+from benchmarks.common import app, create_indexes, load_promotions, print_table, reset_table, timed
+
+URL = "/api/promotions?whole_store=true"
+
+
+def main(sizes):
+    """Times the three ways of counting at every table size"""
+    client = app.test_client()
+    rows = []
+    for size in sizes:
+        reset_table()
+        load_promotions(size)
+        create_indexes()
+        listed = len(client.get(URL).get_json())
+        counted = int(client.get(f"{URL}&count_only=1").headers["X-Total-Count"])
+        if listed != counted:
+            raise AssertionError(f"Listed {listed} promotions but counted {counted}")
+        estimate = client.get(f"{URL}&count_only=1&estimate=1")
+        list_ms = timed(lambda: len(client.get(URL).get_json()))
+        count_ms = timed(lambda: client.get(f"{URL}&count_only=1"))
+        estimate_ms = timed(lambda: client.get(f"{URL}&count_only=1&estimate=1"))
+        rows.append(
+            [
+                size,
+                counted,
+                f"{list_ms:.1f}",
+                f"{count_ms:.1f}",
+                f"{estimate_ms:.1f}",
+                estimate.headers["X-Total-Count"],
+            ]
+        )
+    print_table(["rows", "matches", "list ms", "count ms", "estimate ms", "estimated"], rows)
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
@@ -0,0 +1,43 @@
+"""
+Benchmark: listing every column of the promotions against a sparse
+fieldset, ?fields=id,name,end_date
+
+Usage:
+    python -m benchmarks.bench_fields [ROWS ...]
+"""
+import sys
+
+from benchmarks.common import app, create_indexes, load_promotions, print_table, reset_table, timed
+
+URL = "/api/promotions"
+FIELDS = "id,name,end_date"
+
+
+def main(sizes):
+    """Times the full and the sparse list, and sizes their bodies, at every table size"""
+    client = app.test_client()
+    rows = []
+    for size in sizes:
+        reset_table()
+        load_promotions(size)
+        create_indexes()
+        full = client.get(URL)
+        sparse = client.get(URL, query_string={"fields": FIELDS})
+        if [row["id"] for row in full.get_json()] != [row["id"] for row in sparse.get_json()]:
+            raise AssertionError("The full and the sparse list disagree")
+        full_ms = timed(lambda: client.get(URL).data)
+        sparse_ms = timed(lambda: client.get(URL, query_string={"fields": FIELDS}).data)
+        rows.append(
+            [
+                size,
+                f"{full_ms:.1f}",
+                f"{sparse_ms:.1f}",
+                f"{len(full.data) / 1024:.0f}",
+                f"{len(sparse.data) / 1024:.0f}",
+            ]
+        )
+    print_table(["rows", "full ms", "sparse ms", "full KiB", "sparse KiB"], rows)
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
@@ -0,0 +1,49 @@
+"""
+Benchmark: find_by_* lookup latency against table size, with and without
+the secondary indexes declared on Promotion
+
+Usage:
+    python -m benchmarks.bench_indexes [ROWS ...]
+"""
+import sys
+from datetime import date
+
+from benchmarks.common import (
+    Promotion,
+    create_indexes,
+    load_promotions,
+    print_table,
+    reset_table,
+    timed,
+)
+
+LOOKUPS = {
+    "find_by_name": lambda: Promotion.find_by_name("Promotion 42").all(),
+    "find_by_message": lambda: Promotion.find_by_message("Message 42").all(),
+    "find_by_start_date": lambda: Promotion.find_by_start_date(date(2024, 2, 29)).all(),
+    "find_by_end_date": lambda: Promotion.find_by_end_date(date(2024, 2, 29)).all(),
+    "find_by_original_end_date": lambda: Promotion.find_by_original_end_date(
+        date(2024, 2, 29)
+    ).all(),
+}
+
+
+def main(sizes):
+    """Runs every lookup at every table size before and after indexing"""
+    rows = []
+    for size in sizes:
+        reset_table(with_indexes=False)
+        load_promotions(size)
+        before = {name: timed(lookup) for name, lookup in LOOKUPS.items()}
+        create_indexes()
+        after = {name: timed(lookup) for name, lookup in LOOKUPS.items()}
+        for name in LOOKUPS:
+            speedup = before[name] / after[name] if after[name] else float("inf")
+            rows.append(
+                [size, name, f"{before[name]:.2f}", f"{after[name]:.2f}", f"{speedup:.1f}x"]
+            )
+    print_table(["rows", "lookup", "no index ms", "indexed ms", "speedup"], rows)
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
@@ -0,0 +1,51 @@
+"""
+Benchmark: the list read path, ORM all() + serialize() + marshal() against
+the Core column projection used by GET /api/promotions
+
+Usage:
+    python -m benchmarks.bench_list [ROWS ...]
+"""
+import json
+import sys
+
+from flask_restx import marshal
+
+from benchmarks.common import Promotion, load_promotions, print_table, reset_table, timed
+from service.helpers import convert_row
+from service.models import db
+from service.routes import promotion_model
+
+
+def orm_path():
+    """Builds the response body the way the list endpoint used to"""
+    db.session.expunge_all()
+    results = [promotion.serialize() for promotion in Promotion.all()]
+    return json.dumps(marshal(results, promotion_model))
+
+
+def row_path():
+    """Builds the response body from plain rows"""
+    return json.dumps([convert_row(row) for row in Promotion.select_rows()])
+
+
+def by_id(body):
+    """Returns the promotions of a response body in id order"""
+    return sorted(json.loads(body), key=lambda row: int(row["id"]))
+
+
+def main(sizes):
+    """Times both read paths at every table size"""
+    rows = []
+    for size in sizes:
+        reset_table()
+        load_promotions(size)
+        if by_id(orm_path()) != by_id(row_path()):
+            raise AssertionError("The two read paths disagree")
+        orm_ms = timed(orm_path)
+        row_ms = timed(row_path)
+        rows.append([size, f"{orm_ms:.1f}", f"{row_ms:.1f}", f"{orm_ms / row_ms:.1f}x"])
+    print_table(["rows", "orm + marshal ms", "core rows ms", "speedup"], rows)
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
@@ -0,0 +1,65 @@
+"""
+Benchmark: Promotion.find_overlapping against a full scan, with and without
+the date window indexes (the GiST period index on PostgreSQL, the
+(start_date, end_date) index on SQLite)
+
+Usage:
+    python -m benchmarks.bench_overlap [ROWS ...]
+"""
+import sys
+from datetime import date
+
+from benchmarks.common import (
+    Promotion,
+    create_indexes,
+    load_promotions,
+    print_table,
+    reset_table,
+    timed,
+)
+
+WINDOW = (date(2024, 2, 26), date(2024, 3, 4))
+
+
+def python_scan():
+    """Finds the overlapping promotions the way clients had to: read all, filter here"""
+    start, end = WINDOW
+    return [
+        row
+        for row in Promotion.select_rows()
+        if row["start_date"] < end and row["end_date"] > start and row["start_date"] < row["end_date"]
+    ]
+
+
+def overlap_query():
+    """Finds the overlapping promotions in the database"""
+    return Promotion.select_rows(Promotion.find_overlapping(*WINDOW))
+
+
+def main(sizes):
+    """Times the scan and the query at every table size before and after indexing"""
+    rows = []
+    for size in sizes:
+        reset_table(with_indexes=False)
+        load_promotions(size)
+        scan = timed(python_scan, repeat=3)
+        unindexed = timed(overlap_query)
+        create_indexes()
+        indexed = timed(overlap_query)
+        matches = len(overlap_query())
+        assert matches == len(python_scan())
+        rows.append(
+            [
+                size,
+                matches,
+                f"{scan:.1f}",
+                f"{unindexed:.1f}",
+                f"{indexed:.1f}",
+                f"{scan / indexed:.0f}x",
+            ]
+        )
+    print_table(["rows", "matches", "scan ms", "no index ms", "indexed ms", "vs scan"], rows)
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [100000, 1000000])
@@ -0,0 +1,127 @@
+"""
+Benchmark: requests per second and latency of plain sync gunicorn workers,
+gunicorn sized by gunicorn.conf.py, and the ASGI app (service.asgi) under
+uvicorn
+
+The sync gunicorn and uvicorn servers get BENCH_WORKERS worker processes;
+gunicorn.conf.py sizes its own (set WEB_CONCURRENCY and GUNICORN_THREADS to
+mimic a container). All of them serve the same database. The load is a mix of single reads (half of them for promotions
+not in the cache) and paged list requests, sent by CONCURRENCY clients
+that each wait for their last response before sending the next request.
+
+Usage:
+    python -m benchmarks.bench_serving [CONCURRENCY ...]
+
+Environment:
+    BENCH_WORKERS   worker processes of the sync and uvicorn servers (default 1)
+    BENCH_SECONDS   length of each run (default 10)
+    BENCH_ROWS      promotions loaded before the runs (default 10000)
+"""
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.common import load_promotions, print_table, reset_table
+
+WORKERS = int(os.getenv("BENCH_WORKERS", "1"))
+SECONDS = float(os.getenv("BENCH_SECONDS", "10"))
+ROWS = int(os.getenv("BENCH_ROWS", "10000"))
+PORT = 8099
+
+SERVERS = {
+    "gunicorn (sync)": [
+        "gunicorn", "--workers", str(WORKERS), "--worker-class", "sync", "--threads", "1",
+        "--bind", f"127.0.0.1:{PORT}", "service:app",
+    ],
+    "gunicorn (gunicorn.conf.py)": ["gunicorn", "--bind", f"127.0.0.1:{PORT}", "service:app"],
+    "uvicorn (asgi)": [
+        "uvicorn", "--workers", str(WORKERS), "--port", str(PORT), "--log-level", "warning", "service.asgi:app",
+    ],
+}
+
+
+def next_path():
+    """Returns the path of a random request of the mix"""
+    if random.random() < 0.8:
+        return f"/api/promotions/{random.randint(1, ROWS)}"
+    return f"/api/promotions?limit=20&sort=start_date&name=Promotion%20{random.randrange(5000)}"
+
+
+async def client(http, deadline, latencies, errors):
+    """Sends requests one after another until the deadline
+
+    A worker restarted by max_requests closes its idle keep-alive
+    connections, so a request can fail with a reset; those are counted.
+    """
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            resp = await http.get(next_path())
+        except httpx.TransportError:
+            errors.append(started)
+            continue
+        resp.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+
+
+async def run_load(concurrency):
+    """Runs the load against the server on PORT
+
+    Returns:
+        tuple: requests/s, p50 ms, p99 ms and the number of failed requests
+    """
+    limits = httpx.Limits(max_connections=concurrency)
+    latencies = []
+    errors = []
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}", limits=limits, timeout=60) as http:
+        started = time.perf_counter()
+        deadline = started + SECONDS
+        await asyncio.gather(*(client(http, deadline, latencies, errors) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return (
+        len(latencies) / elapsed,
+        latencies[len(latencies) // 2] * 1000,
+        latencies[int(len(latencies) * 0.99)] * 1000,
+        len(errors),
+    )
+
+
+def start_server(command):
+    """Starts a server and waits until it answers /health"""
+    # The servers inherit DATABASE_URI from benchmarks.common
+    process = subprocess.Popen(command)  # pylint: disable=consider-using-with
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{PORT}/health", timeout=1)
+            return process
+        except httpx.TransportError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{command[0]} did not start")
+
+
+def main(levels):
+    """Loads the table, then measures each server at every concurrency level"""
+    reset_table()
+    load_promotions(ROWS)
+    rows = []
+    for name, command in SERVERS.items():
+        process = start_server(command)
+        try:
+            for concurrency in levels:
+                rate, p50, p99, errors = asyncio.run(run_load(concurrency))
+                rows.append([name, concurrency, f"{rate:.0f}", f"{p50:.1f}", f"{p99:.1f}", errors])
+        finally:
+            process.terminate()
+            process.wait()
+    print_table(["server", "clients", "req/s", "p50 ms", "p99 ms", "errors"], rows)
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1, 16, 64])
@@ -0,0 +1,99 @@
+"""
+Benchmark: how long the service takes to start
+
+Two measurements, each the median of RUNS fresh processes:
+
+- import time of the service package from `python -X importtime`, with the
+  modules that take longest to import, so a new heavy dependency shows up
+- time to first request: from starting a single gunicorn worker until it
+  answers GET /api/promotions, with and without DB_CREATE_ALL
+
+Usage:
+    python -m benchmarks.bench_startup [RUNS]
+
+Environment:
+    BENCH_STARTUP_BUDGET_MS  exit with status 1 when the median import of
+                             the service package takes longer than this
+"""
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.common import print_table, reset_table
+
+PORT = 8098
+TOP_MODULES = 10
+
+
+def import_times():
+    """Imports the service in a new interpreter and returns {module: (self us, cumulative us)}"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import service"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(own), int(cumulative))
+    return times
+
+
+def first_request_ms(create_all):
+    """Starts one gunicorn worker and returns the milliseconds until its first response"""
+    env = dict(os.environ, DB_CREATE_ALL=str(create_all), WEB_CONCURRENCY="1", GUNICORN_THREADS="1")
+    started = time.perf_counter()
+    process = subprocess.Popen(  # pylint: disable=consider-using-with
+        ["gunicorn", "--bind", f"127.0.0.1:{PORT}", "--log-level", "warning", "service:app"],
+        env=env,
+    )
+    try:
+        # Probe with bare connects, which cost the machine little CPU, until
+        # the port is open, then time the first request
+        while process.poll() is None:
+            try:
+                socket.create_connection(("127.0.0.1", PORT)).close()
+            except ConnectionRefusedError:
+                time.sleep(0.01)
+                continue
+            httpx.get(f"http://127.0.0.1:{PORT}/api/promotions", timeout=30).raise_for_status()
+            return (time.perf_counter() - started) * 1000
+        raise RuntimeError("gunicorn exited before answering")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main(runs):
+    """Prints the import and first request times and checks the import budget"""
+    reset_table()
+    samples = [import_times() for _ in range(runs)]
+    total = statistics.median(sample["service"][1] for sample in samples) / 1000
+    slowest = sorted(samples[0], key=lambda name: samples[0][name][0], reverse=True)[:TOP_MODULES]
+    rows = [
+        [name, f"{statistics.median(sample[name][0] for sample in samples) / 1000:.1f}"]
+        for name in slowest
+    ]
+    print_table(["module", "self ms"], rows)
+    print()
+    rows = [["import service", f"{total:.0f}"]]
+    for create_all in (True, False):
+        ready = statistics.median(first_request_ms(create_all) for _ in range(runs))
+        rows.append([f"first request, DB_CREATE_ALL={create_all}", f"{ready:.0f}"])
+    print_table(["startup", "ms"], rows)
+    budget = os.getenv("BENCH_STARTUP_BUDGET_MS")
+    if budget and total > float(budget):
+        print(f"import service took {total:.0f} ms, over the {budget} ms budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,91 @@
+"""
+Benchmark: validating write payloads with the compiled promotion schema
+against the old convert_data + isinstance checks in deserialize
+
+Usage:
+    python -m benchmarks.bench_validation [CALLS]
+"""
+import sys
+from datetime import date, datetime
+
+from benchmarks.common import app, print_table, timed
+from service.models import DataValidationError, validate_promotion
+
+DATES = ("start_date", "end_date", "original_end_date")
+BOOLS = ("whole_store", "has_been_extended", "promotion_changes_price")
+
+VALID = {
+    "name": "Summer Sale",
+    "start_date": "2023-06-01",
+    "end_date": "2023-08-31",
+    "whole_store": "True",
+    "has_been_extended": "False",
+    "original_end_date": "2023-08-31",
+    "message": "Everything must go",
+    "promotion_changes_price": "True",
+}
+INVALID = dict(VALID, end_date="2023-05-01")
+
+
+def convert_data(data):
+    """Converts the dates and booleans of a payload the way the routes used to"""
+    try:
+        for key in data.keys():
+            if key in DATES:
+                data[key] = datetime.strptime(data[key], "%Y-%m-%d").date()
+            if key in BOOLS:
+                data[key] = data[key] == "True"
+    except (TypeError, ValueError) as exc:
+        raise DataValidationError(f"Could not convert {key}") from exc
+
+
+def legacy_validate(data):
+    """Converts and checks a payload the way the routes and deserialize used to"""
+    data = dict(data)
+    convert_data(data)
+    for key in DATES:
+        if not isinstance(data[key], date):
+            app.logger.warning("Tripped in %s", key)
+            raise DataValidationError(f"Invalid type for date [{key}]")
+    if data["start_date"] > data["end_date"]:
+        raise DataValidationError(f"Start Date {data['start_date']} > End Date: {data['end_date']}")
+    for key in BOOLS:
+        if not isinstance(data[key], bool):
+            app.logger.warning("Tripped in %s", key)
+            raise DataValidationError(f"Invalid type for bool [{key}]")
+    return data
+
+
+def run(validate, payload, calls):
+    """Returns a function that validates payload calls times"""
+
+    def loop():
+        for _ in range(calls):
+            try:
+                validate(payload)
+            except DataValidationError:
+                pass
+
+    return loop
+
+
+def main(calls):
+    """Times both validators on a valid and an invalid payload"""
+    rows = []
+    for label, payload in (("valid", VALID), ("invalid", INVALID)):
+        legacy = timed(run(legacy_validate, payload, calls))
+        compiled = timed(run(validate_promotion, payload, calls))
+        per_call = 1000 / calls
+        rows.append(
+            [
+                label,
+                f"{legacy * per_call:.2f}",
+                f"{compiled * per_call:.2f}",
+                f"{legacy / compiled:.1f}x",
+            ]
+        )
+    print_table(["payload", "legacy us/call", "compiled us/call", "speedup"], rows)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
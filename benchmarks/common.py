@@ -0,0 +1,94 @@
+"""
+Shared helpers for the benchmarks
+
+The service connects to DATABASE_URI when it is imported, so this module
+must be imported before anything from the service package.
+"""
+import os
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+from sqlalchemy.schema import CreateIndex, DropIndex
+
+os.environ.setdefault("DATABASE_URI", "sqlite:////tmp/promotions-bench.db")
+
+# pylint: disable=wrong-import-position
+from service import app  # noqa: E402
+from service.models import Promotion, builds_on, db  # noqa: E402
+
+BATCH_SIZE = 10000
+FIRST_DAY = date(2020, 1, 1)
+
+
+def reset_table(with_indexes=True):
+    """Recreates an empty promotion table, optionally without secondary indexes"""
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    if not with_indexes:
+        drop_indexes()
+
+
+def drop_indexes():
+    """Drops every secondary index declared on the promotion table"""
+    with db.engine.begin() as conn:
+        for index in Promotion.__table__.indexes:
+            if builds_on(index, conn):
+                conn.execute(DropIndex(index, if_exists=True))
+
+
+def create_indexes():
+    """Creates every secondary index declared on the promotion table"""
+    with db.engine.begin() as conn:
+        for index in Promotion.__table__.indexes:
+            if builds_on(index, conn):
+                conn.execute(CreateIndex(index, if_not_exists=True))
+        if conn.dialect.name == "postgresql":
+            conn.exec_driver_sql("ANALYZE promotion")
+
+
+def fake_row(number):
+    """Returns a random but plausible promotion row"""
+    start = FIRST_DAY + timedelta(days=random.randrange(3650))
+    end = start + timedelta(days=random.randrange(1, 90))
+    return {
+        "name": f"Promotion {number % 5000}",
+        "start_date": start,
+        "end_date": end,
+        "whole_store": random.random() < 0.5,
+        "has_been_extended": False,
+        "original_end_date": end,
+        "message": f"Message {number % 2000}",
+        "promotion_changes_price": random.random() < 0.5,
+    }
+
+
+def load_promotions(count):
+    """Inserts count random promotions in large multi-row batches"""
+    table = Promotion.__table__
+    with db.engine.begin() as conn:
+        for first in range(0, count, BATCH_SIZE):
+            rows = [fake_row(n) for n in range(first, min(first + BATCH_SIZE, count))]
+            conn.execute(table.insert(), rows)
+
+
+def timed(func, repeat=5):
+    """Calls func repeat times and returns the median run time in milliseconds"""
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        runs.append((time.perf_counter() - started) * 1000)
+    return statistics.median(runs)
+
+
+def print_table(headers, rows):
+    """Prints rows as a plain text table"""
+    widths = [max(len(str(cell)) for cell in column) for column in zip(headers, *rows)]
+    for row in [headers] + rows:
+        print("  ".join(str(cell).rjust(width) for cell, width in zip(row, widths)))
+
+
+__all__ = ["app", "Promotion", "db"]
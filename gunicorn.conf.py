@@ -0,0 +1,143 @@
+"""
+Gunicorn settings for the Promotion service
+
+Gunicorn reads ./gunicorn.conf.py by default, so both the Procfile and the
+Docker image pick these up.
+
+The worker processes and threads are sized from the container's cgroup
+limits rather than the host's CPUs: 2 x CPUs + 1 workers, as few as the
+memory limit fits, each with enough threads to keep about THREADS_PER_CPU
+requests per CPU in flight while others wait on the database. For the
+0.5 CPU / 128Mi pods in deploy/deployment_prod.yaml that is 2 gthread
+workers with 2 threads each. WEB_CONCURRENCY and GUNICORN_THREADS override
+the computed values.
+"""
+import math
+import os
+import shutil
+import tempfile
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+# Memory of the master process with the preloaded app, and the extra memory
+# each worker takes once it has served requests
+MASTER_MEMORY = int(os.getenv("GUNICORN_MASTER_MEMORY_MB", "48")) * 2**20
+WORKER_MEMORY = int(os.getenv("GUNICORN_WORKER_MEMORY_MB", "40")) * 2**20
+
+# Requests in flight per CPU; most of a request is spent waiting on PostgreSQL
+THREADS_PER_CPU = 8
+
+
+def read_limit(path):
+    """Returns the first line of a cgroup file split into fields, or None"""
+    try:
+        with open(path, encoding="utf-8") as file:
+            return file.readline().split()
+    except OSError:
+        return None
+
+
+def cgroup_cpus(root=CGROUP_ROOT):
+    """Returns the CPU quota of the container in CPUs, or None when unlimited"""
+    fields = read_limit(os.path.join(root, "cpu.max"))  # cgroup v2
+    if fields is None:
+        quota = read_limit(os.path.join(root, "cpu", "cpu.cfs_quota_us"))  # cgroup v1
+        period = read_limit(os.path.join(root, "cpu", "cpu.cfs_period_us"))
+        fields = quota and period and [quota[0], period[0]]
+    if not fields or fields[0] in ("max", "-1"):
+        return None
+    return int(fields[0]) / int(fields[1])
+
+
+def cgroup_memory(root=CGROUP_ROOT):
+    """Returns the memory limit of the container in bytes, or None when unlimited"""
+    fields = read_limit(os.path.join(root, "memory.max"))  # cgroup v2
+    if fields is None:
+        fields = read_limit(os.path.join(root, "memory", "memory.limit_in_bytes"))  # cgroup v1
+    if not fields or fields[0] == "max":
+        return None
+    limit = int(fields[0])
+    # cgroup v1 reports "no limit" as a number close to 2**63
+    return limit if limit < 2**60 else None
+
+
+def worker_count(cpus, memory):
+    """Returns how many worker processes the CPU and memory limits allow"""
+    count = int(2 * cpus) + 1
+    if memory is not None:
+        count = min(count, (memory - MASTER_MEMORY) // WORKER_MEMORY)
+    return max(1, count)
+
+
+def thread_count(cpus, processes):
+    """Returns the threads of each worker that keep THREADS_PER_CPU requests per CPU in flight"""
+    return max(1, math.ceil(THREADS_PER_CPU * cpus / processes))
+
+
+CPUS = cgroup_cpus() or os.cpu_count() or 1
+MEMORY = cgroup_memory()
+
+# Gunicorn settings are lower case module variables
+# pylint: disable=invalid-name
+
+# config.py splits the database connections between WEB_CONCURRENCY workers,
+# so the computed count is exported before the app is loaded
+workers = int(os.environ.setdefault("WEB_CONCURRENCY", str(worker_count(CPUS, MEMORY))))
+threads = int(os.getenv("GUNICORN_THREADS", str(thread_count(CPUS, workers))))
+worker_class = "gthread" if threads > 1 else "sync"
+
+# Import the app once in the master; the workers share its memory pages
+preload_app = True
+
+# Restart workers now and then so slow leaks cannot grow without bound;
+# the jitter keeps them from all restarting at once
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+
+# Every worker writes its Prometheus samples here so /metrics can add them up.
+# This must be set before the service (and prometheus_client) is imported,
+# and with preload_app that happens before on_starting(), so the directory
+# is emptied as the settings load. A reload (HUP) restarts every worker, and
+# starts the counters from zero as well.
+PROMETHEUS_MULTIPROC_DIR = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "promotions-metrics")
+)
+shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+
+def dispose_engine(close):
+    """Empties the connection pools of the preloaded app"""
+    # pylint: disable=import-outside-toplevel
+    from service import app
+    from service.models import db
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=close)
+
+
+def when_ready(server):
+    """Closes the connections the master opened while loading the app"""
+    if server.cfg.preload_app:
+        dispose_engine(close=True)
+
+
+def post_fork(server, worker):  # pylint: disable=unused-argument
+    """Gives each worker a pool of its own instead of the master's connections
+
+    close=False drops the inherited connections without closing them, since
+    closing a socket shared with another process would break it there too.
+    """
+    if server.cfg.preload_app:
+        dispose_engine(close=False)
+
+
+def child_exit(server, worker):  # pylint: disable=unused-argument
+    """Drops the live gauges of a worker that exited"""
+    # pylint: disable=import-outside-toplevel
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
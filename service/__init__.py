@@ -8,7 +8,7 @@ import sys
 from flask import Flask
 from flask_restx import Api
 from service import config
-from service.common import log_handlers
+from service.common import log_handlers, metrics
 
 # Create Flask application
 app = Flask(__name__)
@@ -46,6 +46,7 @@ app.logger.info(70 * "*")
 
 try:
     models.init_db(app)  # make our SQLAlchemy tables
+    metrics.init_metrics(app, models.db.engine, models.cache)
 except Exception as error:  # pylint: disable=broad-except
     app.logger.critical("%s: Cannot continue", error)
     # gunicorn requires exit code 4 to stop spawning workers when they die
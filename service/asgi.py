@@ -0,0 +1,421 @@
+"""
+ASGI entry point for the Promotion service
+
+Run it with:
+    uvicorn service.asgi:app
+
+The hot read endpoints, GET /api/promotions/{id}, GET /api/promotions and
+GET /api/promotions/active, are answered by coroutines that query through
+an async SQLAlchemy engine. While one of them waits on the database the
+event loop serves other requests, so one process handles many concurrent
+reads. They reuse the Promotion model's statements and the promotion
+cache, and return the same bodies, ETags and paging headers as the Flask
+routes. With DATABASE_REPLICA_URI they read from the replica, and leave
+requests with an X-Consistency-Token to Flask, which knows when the
+replica is behind.
+
+GET /api/promotions/stream pushes the change feed to clients as
+Server-Sent Events. One hub task per process reads each new change once,
+woken by PostgreSQL NOTIFY or by a commit in this process, and fans it out
+to every open stream. An open stream costs a coroutine, not a thread, so
+the stream is only served here.
+
+Every other request, and any read that uses an option the async routes do
+not handle (search, overlaps, NDJSON, or arguments that fail to parse),
+is passed to the Flask app in a worker thread. So the API, its error
+responses and the Swagger docs stay exactly as in service/routes.py.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+from contextlib import asynccontextmanager
+from datetime import date
+from urllib.parse import urlencode
+
+from a2wsgi import WSGIMiddleware
+from flask_restx import inputs
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.http import parse_etags, quote_etag
+
+from service import app as flask_app
+from service.common import status
+from service.common.cache import MISSING
+from service.common.hub import Hub
+from service.helpers import (
+    CONSISTENCY_TOKEN,
+    convert_change,
+    convert_row,
+    decode_cursor,
+    encode_cursor,
+    fields_variant,
+    parse_date,
+    parse_fields,
+)
+from service.models import (
+    CHANGE_CHANNEL,
+    FILTERS,
+    SORTABLE,
+    DataValidationError,
+    Promotion,
+    PromotionChange,
+    PromotionChangeHorizon,
+    PromotionRevision,
+    activations,
+    cache,
+    cache_key,
+    change_notifier,
+    db,
+)
+
+logger = logging.getLogger(__name__)
+
+# Drivers used for each database by the async engine
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+# List arguments the async route understands; any other sends the request to Flask
+LIST_ARGUMENTS = set(FILTERS) | {"sort", "order", "limit", "cursor", "fields"}
+
+
+def async_engine_options(uri, options):
+    """Returns the engine options of an async engine for a database URI
+
+    The pool sizes apply to PostgreSQL only; aiosqlite opens a connection
+    per checkout.
+    """
+    url = make_url(uri)
+    if url.get_backend_name() != "postgresql":
+        return {"pool_pre_ping": options.get("pool_pre_ping", False)}
+    return {name: value for name, value in options.items() if name != "poolclass"}
+
+
+def make_engine(uri, options):
+    """Creates the async engine for a database URI"""
+    url = make_url(uri)
+    url = url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+    return create_async_engine(url, **async_engine_options(url, options))
+
+
+engine = make_engine(
+    flask_app.config["SQLALCHEMY_DATABASE_URI"], flask_app.config["SQLALCHEMY_ENGINE_OPTIONS"]
+)
+# Reads without a consistency token go to the read replica when there is one
+replica = (
+    make_engine(
+        flask_app.config["DATABASE_REPLICA_URI"], flask_app.config["SQLALCHEMY_ENGINE_OPTIONS"]
+    )
+    if flask_app.config.get("DATABASE_REPLICA_URI")
+    else engine
+)
+
+
+######################################################################
+# A S Y N C   R O U T E S
+######################################################################
+
+
+def not_modified(request, etag):
+    """Returns an empty 304 response if the request already has etag, else None"""
+    if parse_etags(request.headers.get("if-none-match")).contains_weak(etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": quote_etag(etag)})
+    return None
+
+
+async def read_promotion(request):
+    """Returns a single Promotion, like PromotionResource.get"""
+    key = cache_key(request.path_params["promotion_id"])
+    if key is None or CONSISTENCY_TOKEN in request.headers:
+        return None
+    try:
+        fields = parse_fields(request.query_params["fields"]) if "fields" in request.query_params else None
+    except ValueError:
+        return None
+    data = cache.get(key)
+    if data is MISSING:
+        table = Promotion.__table__
+        statement = Promotion.select_columns().add_columns(table.c.version).where(table.c.id == key)
+        async with replica.connect() as conn:
+            row = (await conn.execute(statement)).mappings().first()
+        data = dict(row) if row else None
+        # A lagging replica must not refill the entry a write just invalidated
+        if replica is engine:
+            cache.set(key, data)
+    if not data:
+        message = f"Promotion with id '{request.path_params['promotion_id']}' was not found."
+        return JSONResponse({"message": message}, status_code=status.HTTP_404_NOT_FOUND)
+    data = dict(data)
+    etag = f"{data['id']}-{data.pop('version')}{fields_variant(fields)}"
+    return not_modified(request, etag) or JSONResponse(
+        convert_row(data, fields), headers={"ETag": quote_etag(etag)}
+    )
+
+
+def parse_list_arguments(request):
+    """Reads the arguments of a list request, or returns None if Flask should answer it"""
+    params = request.query_params
+    if (
+        not set(params) <= LIST_ARGUMENTS
+        or "ndjson" in request.headers.get("accept", "")
+        or CONSISTENCY_TOKEN in request.headers
+    ):
+        return None
+    try:
+        filters = {}
+        for name, value in params.items():
+            if name in FILTERS:
+                column = FILTERS[name][0]
+                if column in ("start_date", "end_date"):
+                    value = parse_date(value)
+                elif column in ("whole_store", "has_been_extended", "promotion_changes_price"):
+                    value = inputs.boolean(value)
+                filters[name] = value
+        limit = params.get("limit")
+        if limit is not None:
+            limit = inputs.int_range(1, flask_app.config["PAGE_SIZE_MAX"])(limit)
+        after = decode_cursor(params["cursor"]) if "cursor" in params else None
+        fields = parse_fields(params["fields"]) if "fields" in params else None
+    except (ValueError, DataValidationError):
+        return None
+    sort = params.get("sort", "id")
+    order = params.get("order", "asc")
+    if sort not in SORTABLE or order not in ("asc", "desc"):
+        return None
+    return filters, {"sort": sort, "descending": order == "desc"}, limit, after, fields
+
+
+def next_page_headers(request, limit, next_key):
+    """Returns the X-Next-Cursor and Link headers pointing at the next page"""
+    next_cursor = encode_cursor(next_key)
+    params = dict(request.query_params)
+    params.update(limit=limit, cursor=next_cursor)
+    base_url = str(request.url.replace(query=""))
+    return {"X-Next-Cursor": next_cursor, "Link": f'<{base_url}?{urlencode(params)}>; rel="next"'}
+
+
+async def list_promotions(request):
+    """Returns the Promotions matching the filters, like PromotionCollection.get"""
+    arguments = parse_list_arguments(request)
+    if arguments is None:
+        return None
+    filters, order, limit, after, fields = arguments
+    async with replica.connect() as conn:
+        etag = f"r{(await conn.execute(PromotionRevision.select_current())).scalar() or 0}"
+        etag += fields_variant(fields)
+        response = not_modified(request, etag)
+        if response:
+            return response
+        # Pages also need the sort column, which their next key is made of
+        statement = Promotion.select_columns(
+            fields=None if fields is None else {*fields, order["sort"]}
+        ).where(*Promotion.filter_conditions(filters))
+        headers = {"ETag": quote_etag(etag)}
+        if limit is None and after is None:
+            statement = statement.order_by(*Promotion.ordering(**order))
+            rows = (await conn.execute(statement)).mappings().all()
+        else:
+            limit = limit or flask_app.config["PAGE_SIZE_DEFAULT"]
+            try:
+                statement = Promotion.select_page(statement, limit, after, **order)
+            except DataValidationError:
+                return None
+            rows, next_key = Promotion.split_page(
+                (await conn.execute(statement)).mappings().all(), limit, order["sort"]
+            )
+            if next_key is not None:
+                headers.update(next_page_headers(request, limit, next_key))
+    return JSONResponse([convert_row(row, fields) for row in rows], headers=headers)
+
+
+async def list_active_promotions(request):
+    """Returns the Promotions running on a day, like ActivePromotions.get
+
+    Today's Promotions come from the activation schedule when it is up to
+    date; loading it is left to Flask.
+    """
+    if not set(request.query_params) <= {"as_of"}:
+        return None
+    try:
+        as_of = parse_date(request.query_params["as_of"]) if "as_of" in request.query_params else None
+    except ValueError:
+        return None
+    if as_of in (None, date.today()):
+        async with engine.connect() as conn:
+            revision = (await conn.execute(PromotionRevision.select_current())).scalar() or 0
+        if activations.active.version != revision:
+            return None
+        return JSONResponse([convert_row(row) for row in activations.current().rows])
+    with flask_app.app_context():
+        query = Promotion.find_active(as_of)
+    statement = Promotion.select_columns(query).order_by(Promotion.id)
+    async with engine.connect() as conn:
+        rows = (await conn.execute(statement)).mappings().all()
+    return JSONResponse([convert_row(row) for row in rows])
+
+
+async def fetch_changes(seq, until=None):
+    """Returns up to PAGE_SIZE_MAX changes numbered above seq, and up to until if given"""
+    table = PromotionChange.__table__
+    statement = table.select().where(table.c.seq > seq)
+    if until is not None:
+        statement = statement.where(table.c.seq <= until)
+    statement = statement.order_by(table.c.seq).limit(flask_app.config["PAGE_SIZE_MAX"])
+    async with engine.connect() as conn:
+        return (await conn.execute(statement)).mappings().all()
+
+
+async def latest_change():
+    """Returns the seq of the newest change in the feed"""
+    table = PromotionChange.__table__
+    async with engine.connect() as conn:
+        return (await conn.execute(db.select(db.func.max(table.c.seq)))).scalar() or 0
+
+
+async def change_horizon():
+    """Returns the seq of the newest deletion compacted out of the feed"""
+    async with engine.connect() as conn:
+        return (await conn.execute(PromotionChangeHorizon.select_current())).scalar() or 0
+
+
+async def listen_for_changes(wake):
+    """Calls wake() on every NOTIFY the change feed sends, on PostgreSQL"""
+    if engine.dialect.name != "postgresql":
+        return
+    try:
+        async with engine.connect() as conn:
+            connection = (await conn.get_raw_connection()).driver_connection
+            await connection.add_listener(CHANGE_CHANNEL, lambda *args: wake())
+            await asyncio.Future()  # until the hub stops
+    except Exception:  # pylint: disable=broad-except
+        logger.exception("Listening for changes failed; the hub polls instead")
+
+
+# One reader of the change feed for all the SSE clients of this process
+hub = Hub(
+    fetch_changes,
+    latest_change,
+    flask_app.config["CHANGES_POLL_INTERVAL"],
+    flask_app.config["SSE_QUEUE_SIZE"],
+    listen=listen_for_changes,
+)
+# Changes committed by Flask requests in this process wake the hub at once
+change_notifier.add_listener(hub.wake_threadsafe)
+
+
+def server_sent_event(row):
+    """Formats a change of the feed as a Server-Sent Event"""
+    data = json.dumps(convert_change(row), separators=(",", ":"))
+    return f"id: {row['seq']}\nevent: {row['kind']}\ndata: {data}\n\n"
+
+
+async def change_events(subscription, after, start):
+    """Yields the events of one SSE client until the stream's time is up
+
+    The changes between the client's Last-Event-ID and the seq the hub
+    subscription starts at are read from the database first.
+    """
+    config = flask_app.config
+    try:
+        yield f"retry: {int(config['CHANGES_POLL_INTERVAL'] * 1000)}\n\n"
+        while after is not None and after < start:
+            rows = await fetch_changes(after, start)
+            for row in rows:
+                yield server_sent_event(row)
+            after = rows[-1]["seq"] if rows else start
+        deadline = asyncio.get_running_loop().time() + config["SSE_MAX_SECONDS"]
+        while not subscription.dropped:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                row = await asyncio.wait_for(
+                    subscription.queue.get(), min(config["SSE_KEEPALIVE_SECONDS"], remaining)
+                )
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield server_sent_event(row)
+    finally:
+        hub.unsubscribe(subscription)
+
+
+async def stream_changes(request):
+    """Streams the change feed as Server-Sent Events, like GET /changes pushed
+
+    A client that sends Last-Event-ID (or ?last_event_id=) gets every
+    change after that event first; without one the stream starts now. Like
+    GET /changes, an event older than the newest compacted deletion answers
+    410 Gone.
+    """
+    last_id = request.headers.get("last-event-id", request.query_params.get("last_event_id"))
+    if last_id is not None and not last_id.isdigit():
+        message = f"Invalid Last-Event-ID: {last_id}"
+        return JSONResponse({"message": message}, status_code=status.HTTP_400_BAD_REQUEST)
+    if last_id is not None and 0 < int(last_id) < await change_horizon():
+        message = f"Changes after {last_id} were compacted away; read the whole list again."
+        return JSONResponse(
+            {"message": message}, status_code=status.HTTP_410_GONE, headers={"X-Next-Since": str(await latest_change())}
+        )
+    subscription, start = await hub.subscribe()
+    return StreamingResponse(
+        change_events(subscription, None if last_id is None else int(last_id), start),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+class AsyncRoute:  # pylint: disable=too-few-public-methods
+    """ASGI app that answers GET requests with a coroutine and passes
+    everything else, or anything the coroutine declines, to Flask"""
+
+    def __init__(self, handler, fallback):
+        self.handler = handler
+        self.fallback = fallback
+
+    async def __call__(self, scope, receive, send):
+        if scope["method"] == "GET":
+            response = await self.handler(Request(scope, receive))
+            if response is not None:
+                await response(scope, receive, send)
+                return
+        await self.fallback(scope, receive, send)
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    """Closes the async connection pools when the server stops"""
+    yield
+    await hub.stop()
+    await engine.dispose()
+    if replica is not engine:
+        await replica.dispose()
+
+
+def isolated_flask(environ, start_response):
+    """Runs a Flask request in an empty context
+
+    WSGIMiddleware copies the event loop's context into its worker threads,
+    and that context holds the app context init_db() pushed. Flask would
+    reuse it, and so would every thread's Flask-SQLAlchemy session, which
+    is scoped to the app context. In an empty context each request pushes,
+    and tears down, an app context and session of its own.
+    """
+    return contextvars.Context().run(flask_app, environ, start_response)
+
+
+wsgi = WSGIMiddleware(isolated_flask)
+
+app = Starlette(
+    routes=[
+        Route("/api/promotions", AsyncRoute(list_promotions, wsgi)),
+        Route("/api/promotions/active", AsyncRoute(list_active_promotions, wsgi)),
+        Route("/api/promotions/stream", stream_changes),
+        Route("/api/promotions/{promotion_id}", AsyncRoute(read_promotion, wsgi)),
+        Mount("/", app=wsgi),
+    ],
+    lifespan=lifespan,
+)
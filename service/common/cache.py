@@ -0,0 +1,94 @@
+"""
+Module: cache
+
+A small thread-safe LRU cache whose entries expire after a time to live.
+
+Every worker process has its own cache, so a write in one worker only
+invalidates that worker's copy. The time to live bounds how long other
+workers can serve the old value.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+# Returned by get() when a key is not cached. None is a valid cached value
+# (it records that a row does not exist), so it cannot mean "not cached".
+MISSING = object()
+
+
+class LRUCache:
+    """Least recently used cache with a time to live and hit/miss counters"""
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, maxsize=1024, ttl=30.0, negative_ttl=5.0, clock=time.monotonic):
+        """
+        Args:
+            maxsize (int): the most entries kept before the oldest is evicted
+            ttl (float): seconds a cached value stays fresh
+            negative_ttl (float): seconds a cached None (not found) stays fresh
+            clock (callable): returns the current time in seconds
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, maxsize, ttl, negative_ttl):
+        """Changes the size and lifetimes, dropping everything cached so far"""
+        with self._lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            self.negative_ttl = negative_ttl
+            self._entries.clear()
+
+    def get(self, key):
+        """Returns the fresh value cached under key, or MISSING"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self.clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        """Caches value under key, evicting the least recently used entry if full"""
+        if self.maxsize <= 0:
+            return
+        ttl = self.negative_ttl if value is None else self.ttl
+        with self._lock:
+            self._entries[key] = (self.clock() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Forgets whatever is cached under key"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Forgets every cached entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Returns the cache counters as a dictionary"""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -1,8 +1,12 @@
 """
 Flask CLI Command Extensions
 """
+from datetime import date, timedelta
+import click
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn, CreateIndex
 from service import app
-from service.models import db
+from service.models import RETIRED_INDEXES, Promotion, PromotionChange, builds_on, db, utcnow
 
 
 ######################################################################
@@ -19,3 +23,134 @@ def db_create():
     db.drop_all()
     db.create_all()
     db.session.commit()
+
+
+######################################################################
+# Command to create the missing tables before the service starts
+# Usage:
+#   flask db-init
+######################################################################
+@app.cli.command("db-init")
+def db_init():
+    """
+    Creates any table (and its indexes) missing from the database, adds
+    the columns missing from existing tables, and leaves their data alone.
+    Indexes declared after a table was created are only reported: flask
+    db-index builds them. Run both once per deploy when the service starts
+    with DB_CREATE_ALL turned off.
+    """
+    with db.engine.begin() as conn:
+        add_missing_columns(conn)
+    db.create_all()
+    db.session.commit()
+    with db.engine.connect() as conn:
+        missing = missing_indexes(conn)
+    if missing:
+        app.logger.warning("Missing indexes %s; run flask db-index to build them", ", ".join(missing))
+
+
+def missing_indexes(conn):
+    """Returns the names of the declared indexes that the database lacks"""
+    inspector = inspect(conn)
+    names = []
+    for table in db.metadata.sorted_tables:
+        present = {index["name"] for index in inspector.get_indexes(table.name)}
+        names += sorted(
+            index.name for index in table.indexes if index.name not in present and builds_on(index, conn)
+        )
+    return names
+
+
+def add_missing_columns(conn):
+    """Adds the declared columns that the existing tables lack
+
+    create_all() skips the tables that exist, so a column declared after a
+    table was created, such as promotion.version, is added here. A column
+    that is NOT NULL needs a server default to fill the rows already there.
+    """
+    inspector = inspect(conn)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        present = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in present:
+                continue
+            if not column.nullable and column.server_default is None:
+                raise click.ClickException(
+                    f"Cannot add {table.name}.{column.name}: it is NOT NULL without a server default"
+                )
+            app.logger.info("Adding column %s.%s", table.name, column.name)
+            spec = CreateColumn(column).compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {spec}"))
+
+
+######################################################################
+# Command to build missing indexes on a live database
+# Usage:
+#   flask db-index
+######################################################################
+@app.cli.command("db-index")
+def db_index():
+    """
+    Builds any declared index that is missing from the database, and
+    drops the retired ones. On PostgreSQL the indexes are built and
+    dropped CONCURRENTLY so the tables stay writable meanwhile.
+    """
+    engine = db.engine
+    concurrently = engine.dialect.name == "postgresql"
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for table in db.metadata.sorted_tables:
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                if not builds_on(index, conn):
+                    continue
+                ddl = str(
+                    CreateIndex(index, if_not_exists=True).compile(dialect=engine.dialect)
+                )
+                if concurrently:
+                    ddl = ddl.replace(" INDEX ", " INDEX CONCURRENTLY ", 1)
+                app.logger.info("Building index %s", index.name)
+                conn.execute(text(ddl))
+        for name in RETIRED_INDEXES:
+            app.logger.info("Dropping retired index %s", name)
+            conn.execute(text(f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}IF EXISTS {name}"))
+
+
+######################################################################
+# Command to keep the change feed from growing without bound
+# Usage:
+#   flask changes-compact
+######################################################################
+@app.cli.command("changes-compact")
+def changes_compact():
+    """
+    Removes the changes that a newer change of the same promotion
+    supersedes once they are CHANGES_COMPACT_AFTER_HOURS old, and
+    deletions once they are CHANGES_RETENTION_DAYS old. Run it on a
+    schedule, as deploy/cronjob.yaml does every hour.
+    """
+    now = utcnow()
+    PromotionChange.compact(
+        now - timedelta(hours=app.config["CHANGES_COMPACT_AFTER_HOURS"]),
+        now - timedelta(days=app.config["CHANGES_RETENTION_DAYS"]),
+    )
+    db.session.commit()
+
+
+######################################################################
+# Command to report the promotions that start and end running today
+# Usage:
+#   flask activations-run [--day YYYY-MM-DD]
+######################################################################
+@app.cli.command("activations-run")
+@click.option("--day", type=click.DateTime(formats=["%Y-%m-%d"]), help="The day to report, today by default")
+def activations_run(day):
+    """
+    Records the promotions that start and stop running on the day in the
+    change feed, and calls the activation and expiry hooks, once for the
+    whole service. Run it just after midnight, as deploy/cronjob.yaml does,
+    and with --day for any day a run was missed.
+    """
+    activated, expired = Promotion.run_transitions(day.date() if day else date.today())
+    app.logger.info("%d promotions started and %d ended", len(activated), len(expired))
@@ -0,0 +1,142 @@
+"""
+Module: hub
+
+Fans the rows of a feed out to many subscribers of one event loop.
+
+A Hub runs a single task that fetches the rows added to the feed since the
+last one it saw, each time it is woken and at least every interval
+seconds, and puts them on the queue of every subscriber. However many
+clients listen, the feed is read once per change rather than once per
+client. A subscriber that falls queue_size rows behind is dropped: it
+stops receiving rows, and is expected to come back and resume from the
+last row it got.
+"""
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:  # pylint: disable=too-few-public-methods
+    """The rows waiting for one subscriber"""
+
+    __slots__ = ("queue", "dropped")
+
+    def __init__(self, queue_size):
+        self.queue = asyncio.Queue(queue_size)
+        self.dropped = False
+
+
+class Hub:
+    """Reads a feed of rows numbered by seq once for all its subscribers"""
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, fetch, latest, interval, queue_size=1000, listen=None):
+        """
+        Args:
+            fetch (coroutine function): fetch(seq) returns the next rows
+                numbered above seq, oldest first
+            latest (coroutine function): latest() returns the seq of the
+                newest row, where the hub starts reading
+            interval (float): seconds between reads when nothing wakes the hub
+            queue_size (int): the most rows a subscriber may fall behind
+            listen (coroutine function): optional listen(wake) that calls
+                wake() whenever the feed grows, until it is cancelled
+        """
+        self.fetch = fetch
+        self.latest = latest
+        self.interval = interval
+        self.queue_size = queue_size
+        self.listen = listen
+        self.seq = None
+        self.subscribers = set()
+        self._loop = None
+        self._task = None
+        self._wakeup = None
+        self._lock = None
+
+    async def subscribe(self):
+        """Adds a subscriber, starting the hub first if it is not running
+
+        Returns:
+            tuple: the Subscription, and the seq after which its rows start
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._task = None
+        async with self._lock:
+            if self._task is None or self._task.done():
+                self.subscribers = set()
+                self._wakeup = asyncio.Event()
+                self.seq = await self.latest()
+                self._task = loop.create_task(self._run())
+        subscription = Subscription(self.queue_size)
+        self.subscribers.add(subscription)
+        return subscription, self.seq
+
+    def unsubscribe(self, subscription):
+        """Removes a subscriber"""
+        self.subscribers.discard(subscription)
+
+    def wake(self):
+        """Makes the hub read the feed now; call it from the hub's event loop"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def wake_threadsafe(self):
+        """Makes the hub read the feed now; safe to call from any thread"""
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(self.wake)
+        except RuntimeError:  # the loop has closed
+            pass
+
+    async def stop(self):
+        """Stops the hub and forgets its subscribers"""
+        task, self._task = self._task, None
+        self.subscribers = set()
+        if task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    def publish(self, row):
+        """Puts a row on the queue of every subscriber, dropping those that are full"""
+        for subscription in list(self.subscribers):
+            try:
+                subscription.queue.put_nowait(row)
+            except asyncio.QueueFull:
+                logger.warning("Dropping a subscriber that fell %d rows behind", self.queue_size)
+                subscription.dropped = True
+                self.subscribers.discard(subscription)
+
+    async def _run(self):
+        """Reads the feed whenever it is woken, or every interval seconds"""
+        listener = self._loop.create_task(self.listen(self.wake)) if self.listen else None
+        try:
+            while True:
+                self._wakeup.clear()
+                await self._read()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if listener is not None:
+                listener.cancel()
+
+    async def _read(self):
+        """Publishes every row added since the last read"""
+        try:
+            rows = await self.fetch(self.seq)
+            while rows:
+                for row in rows:
+                    self.publish(row)
+                    self.seq = row["seq"]
+                rows = await self.fetch(self.seq)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Reading the feed after %s failed", self.seq)
@@ -0,0 +1,169 @@
+"""
+Module: metrics
+
+Prometheus metrics for the service, served in the text format by /metrics.
+
+Gunicorn runs several worker processes, each with its own counters. When
+PROMETHEUS_MULTIPROC_DIR is set (gunicorn.conf.py sets it) every process
+writes its samples to files in that directory and /metrics adds them up,
+so whichever worker answers the scrape reports the whole service.
+"""
+import os
+import time
+
+from flask import g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+
+from service.common import query_log
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+OPERATIONS = ("SELECT", "INSERT", "UPDATE", "DELETE")
+
+REQUESTS = Counter(
+    "promotions_http_requests",
+    "HTTP requests handled",
+    ["resource", "method", "status"],
+)
+REQUEST_SECONDS = Histogram(
+    "promotions_http_request_duration_seconds",
+    "Time spent handling HTTP requests",
+    ["resource", "method"],
+    buckets=LATENCY_BUCKETS,
+)
+QUERIES = Counter("promotions_db_queries", "SQL statements executed", ["operation"])
+QUERY_SECONDS = Histogram(
+    "promotions_db_query_duration_seconds",
+    "Time spent executing SQL statements",
+    ["operation"],
+    buckets=QUERY_BUCKETS,
+)
+CACHE_EVENTS = Counter("promotions_cache_events", "Promotion cache lookups and evictions", ["event"])
+CACHE_ENTRIES = Gauge(
+    "promotions_cache_entries", "Promotions in the cache", multiprocess_mode="livesum"
+)
+POOL_CHECKED_OUT = Gauge(
+    "promotions_db_pool_checked_out",
+    "Pooled database connections in use",
+    multiprocess_mode="livesum",
+)
+POOL_EVENTS = Counter("promotions_db_pool_events", "Connection pool checkouts and timeouts", ["event"])
+POOL_WAIT_SECONDS = Counter(
+    "promotions_db_pool_wait_seconds", "Time spent waiting for a pooled connection"
+)
+
+
+class CounterSync:  # pylint: disable=too-few-public-methods
+    """Turns the running totals kept by this process into counter increments"""
+
+    def __init__(self):
+        self.seen = {}
+
+    def __call__(self, counter, key, total):
+        """Increments counter by how much total grew since the last call"""
+        delta = total - self.seen.get(key, 0)
+        if delta > 0:
+            counter.inc(delta)
+        # Totals start again from zero when a pool is recreated
+        self.seen[key] = total
+
+
+def resource_name(app):
+    """Returns the flask-restx Resource (or view function) handling the request"""
+    if request.url_rule is None:
+        return "unmatched"
+    view = app.view_functions.get(request.endpoint)
+    view_class = getattr(view, "view_class", None)
+    return view_class.__name__ if view_class else request.endpoint
+
+
+def operation_name(statement):
+    """Returns the SQL verb of a statement, or OTHER"""
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return verb if verb in OPERATIONS else "OTHER"
+
+
+def record_query(statement, seconds):
+    """Counts and times one SQL statement reported by the query log"""
+    operation = operation_name(statement)
+    QUERIES.labels(operation).inc()
+    QUERY_SECONDS.labels(operation).observe(seconds)
+
+
+def instrument_engine(engine):
+    """Tracks how many connections of the engine are checked out"""
+
+    @event.listens_for(engine, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):  # pylint: disable=unused-argument
+        POOL_CHECKED_OUT.inc()
+
+    @event.listens_for(engine, "checkin")
+    def checkin(dbapi_connection, connection_record):  # pylint: disable=unused-argument
+        POOL_CHECKED_OUT.dec()
+
+
+def record_cache(cache, sync):
+    """Copies the cache counters of this process into the metrics"""
+    stats = cache.stats()
+    CACHE_ENTRIES.set(stats["size"])
+    for name in ("hits", "misses", "evictions"):
+        sync(CACHE_EVENTS.labels(name), ("cache", name), stats[name])
+
+
+def record_pool(pool, sync):
+    """Copies the counters of an InstrumentedQueuePool into the metrics"""
+    if hasattr(pool, "checkouts"):
+        sync(POOL_EVENTS.labels("checkouts"), ("pool", "checkouts"), pool.checkouts)
+        sync(POOL_EVENTS.labels("timeouts"), ("pool", "timeouts"), pool.timeouts)
+        sync(POOL_WAIT_SECONDS, ("pool", "wait_seconds"), pool.wait_seconds)
+
+
+def init_metrics(app, engine, cache):
+    """Times every request of the app and every statement of the engine
+
+    The statements are timed by the query log, so init_query_log() must be
+    called for the engine as well.
+
+    Args:
+        app (Flask): the application
+        engine (Engine): the SQLAlchemy engine of the application
+        cache (LRUCache): the promotion cache whose counters are exported
+    """
+    sync = CounterSync()
+    instrument_engine(engine)
+    query_log.observers.append(record_query)
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop("metrics_started", None)
+        if started is not None:
+            resource = resource_name(app)
+            REQUESTS.labels(resource, request.method, str(response.status_code)).inc()
+            REQUEST_SECONDS.labels(resource, request.method).observe(time.perf_counter() - started)
+        record_cache(cache, sync)
+        record_pool(engine.pool, sync)
+        return response
+
+
+def render():
+    """Returns the body and content type of a /metrics response"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
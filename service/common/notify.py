@@ -0,0 +1,41 @@
+"""
+Module: notify
+
+Lets threads wait for the next change made in this process.
+
+A Notifier only wakes threads of the process whose transaction committed.
+Writes in other worker processes are not seen, so waiters also poll the
+database every now and then.
+"""
+import threading
+
+
+class Notifier:
+    """Wakes every thread waiting for the next change"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._generation = 0
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Calls callback() on every notify(), in the thread that notifies"""
+        self._listeners.append(callback)
+
+    def notify(self):
+        """Wakes the threads waiting now and calls the listeners"""
+        with self._condition:
+            self._generation += 1
+            self._condition.notify_all()
+        for callback in self._listeners:
+            callback()
+
+    def wait(self, timeout):
+        """Waits until notify() is called or timeout seconds have passed
+
+        Returns:
+            bool: True if notify() was called
+        """
+        with self._condition:
+            generation = self._generation
+            return self._condition.wait_for(lambda: self._generation != generation, timeout)
@@ -0,0 +1,97 @@
+"""
+Module: pool
+
+Database connection pool settings and statistics.
+
+Each gunicorn worker has its own pool, so the defaults in config.py split
+DB_MAX_CONNECTIONS between the WEB_CONCURRENCY workers. InstrumentedQueuePool
+counts checkouts and how long they waited for a free connection, which shows
+when a worker's pool is too small for its load.
+"""
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+# Options that only a QueuePool understands
+QUEUE_POOL_OPTIONS = ("pool_size", "max_overflow", "pool_timeout")
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that counts checkouts, waits and timeouts"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self._stats_lock = threading.Lock()
+        self._getting = threading.local()
+
+    def _do_get(self):
+        # QueuePool._do_get calls itself when it loses a race for an
+        # overflow slot, which must not count as a second checkout
+        if getattr(self._getting, "active", False):
+            return super()._do_get()
+        self._getting.active = True
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            self._getting.active = False
+            waited = time.perf_counter() - started
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+
+def engine_options(uri, options):
+    """Returns the SQLAlchemy engine options to use for a database URI
+
+    In-memory SQLite databases live in a single connection, so the queue
+    pool settings are left out for them. Every other database gets an
+    InstrumentedQueuePool.
+
+    Args:
+        uri (str): the database URI
+        options (dict): the configured SQLALCHEMY_ENGINE_OPTIONS
+    """
+    options = dict(options)
+    url = make_url(uri)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        for name in QUEUE_POOL_OPTIONS:
+            options.pop(name, None)
+        return options
+    options.setdefault("poolclass", InstrumentedQueuePool)
+    return options
+
+
+def pool_stats(pool):
+    """Returns the live state and counters of a connection pool as a dictionary"""
+    stats = {"class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+            max_overflow=pool._max_overflow,  # pylint: disable=protected-access
+            timeout=pool.timeout(),
+        )
+    if isinstance(pool, InstrumentedQueuePool):
+        with pool._stats_lock:  # pylint: disable=protected-access
+            stats.update(
+                checkouts=pool.checkouts,
+                timeouts=pool.timeouts,
+                wait_seconds=round(pool.wait_seconds, 6),
+                max_wait_seconds=round(pool.max_wait_seconds, 6),
+            )
+    return stats
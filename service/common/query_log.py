@@ -0,0 +1,125 @@
+"""
+Module: query_log
+
+Times every SQL statement the engine executes.
+
+Statements slower than SLOW_QUERY_MS are logged with their parameters.
+Each response reports how many statements its request issued, and how
+long they took, in the X-Query-Count and Server-Timing headers.
+count_queries() counts the statements of any block of code, which lets
+tests hold an endpoint to a query budget.
+"""
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+from sqlalchemy import event
+
+# Longest parameter listing written to the slow query log
+MAX_PARAMETERS_LENGTH = 500
+
+# Functions called with (statement, seconds) after every statement
+observers = []
+
+# QueryStats of the count_queries() blocks that are running
+_collectors = []
+
+
+class QueryStats:
+    """Number and total time of the statements run during a request or block"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def add(self, seconds):
+        """Records one statement"""
+        self.count += 1
+        self.seconds += seconds
+
+    def server_timing(self):
+        """Returns the statements as a Server-Timing header metric"""
+        return f'db;dur={self.seconds * 1000:.2f};desc="{self.count} queries"'
+
+
+@contextmanager
+def count_queries():
+    """Counts the statements executed inside the with block
+
+    Example:
+        with count_queries() as queries:
+            Promotion.find(1)
+        assert queries.count <= 1
+    """
+    stats = QueryStats()
+    _collectors.append(stats)
+    try:
+        yield stats
+    finally:
+        _collectors.remove(stats)
+
+
+def format_parameters(parameters):
+    """Returns the parameters of a statement, shortened for the log"""
+    text = repr(parameters)
+    if len(text) > MAX_PARAMETERS_LENGTH:
+        return text[:MAX_PARAMETERS_LENGTH] + "..."
+    return text
+
+
+def init_query_log(app, engine, slow_ms):
+    """Times the statements of the engine and reports them on each response
+
+    Args:
+        app (Flask): the application whose responses get the headers
+        engine (Engine): the SQLAlchemy engine to watch
+        slow_ms (float): statements at least this slow are logged
+    """
+    watch_engine(app, engine, slow_ms)
+
+    @app.before_request
+    def start_query_stats():
+        g.query_stats = QueryStats()
+
+    @app.after_request
+    def add_query_headers(response):
+        stats = g.pop("query_stats", None)
+        if stats is not None:
+            response.headers["X-Query-Count"] = str(stats.count)
+            response.headers.add("Server-Timing", stats.server_timing())
+        return response
+
+
+def watch_engine(app, engine, slow_ms):
+    """Times the statements of one more engine of an app set up by init_query_log()"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # pylint: disable=unused-argument, too-many-arguments
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # pylint: disable=unused-argument, too-many-arguments
+        seconds = time.perf_counter() - conn.info["query_started"].pop()
+        if has_request_context() and "query_stats" in g:
+            g.query_stats.add(seconds)
+        for stats in _collectors:
+            stats.add(seconds)
+        if seconds * 1000 >= slow_ms:
+            app.logger.warning(
+                "Slow query (%.1f ms): %s; parameters: %s",
+                seconds * 1000,
+                statement,
+                format_parameters(parameters),
+            )
+        for observer in observers:
+            observer(statement, seconds)
+
+    @event.listens_for(engine, "handle_error")
+    def forget_failed_statement(context):
+        # A failed statement never reaches after_cursor_execute; drop its
+        # start time so the pooled connection times its next one correctly
+        started = context.connection.info.get("query_started") if context.connection else None
+        if started and context.statement is not None:
+            started.pop()
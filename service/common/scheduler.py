@@ -0,0 +1,200 @@
+"""
+Module: scheduler
+
+Keeps the set of running promotions up to date as the days go by.
+
+A promotion runs from its start_date up to, but not including, its
+end_date, so the running set only changes at midnight. ActivationSchedule
+holds that set for one day together with a heap of the start and end dates
+still to come. advance() pops the transitions that are due, publishes the
+new set as an immutable ActiveSet and calls the activation and expiry
+hooks. A background thread advances the schedule at every midnight, and
+readers advance it themselves when it is behind, so the set is right even
+when the thread wakes up late.
+
+A schedule runs its hooks in the process that advances it. To report each
+transition once, advance one schedule in one process.
+"""
+import heapq
+import logging
+import os
+import threading
+from datetime import date, datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Kinds of transition; ends sort first so a day's expiries are applied
+# before its activations
+END = 0
+START = 1
+
+
+class ActiveSet:  # pylint: disable=too-few-public-methods
+    """The Promotions running on one day, as loaded at one revision"""
+
+    __slots__ = ("day", "version", "rows", "ids")
+
+    def __init__(self, day, version, rows):
+        """
+        Args:
+            day (date): the day the promotions are running on
+            version: the revision of the Promotion table the rows come from
+            rows (iterable): the running promotions, as mappings with an id
+        """
+        self.day = day
+        self.version = version
+        self.rows = tuple(sorted(rows, key=lambda row: row["id"]))
+        self.ids = frozenset(row["id"] for row in self.rows)
+
+
+def seconds_to_midnight(now):
+    """Returns the seconds from the datetime now to the start of the next day"""
+    tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return (tomorrow - now).total_seconds()
+
+
+class ActivationSchedule:
+    """Heap of upcoming start and end dates, and the promotions running today"""
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, today=date.today):
+        """
+        Args:
+            today (callable): returns the current day
+        """
+        self.today = today
+        self.active = ActiveSet(None, None, ())
+        self._heap = []
+        self._rows = {}
+        self._activate_hooks = []
+        self._expire_hooks = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+
+    def on_activate(self, hook):
+        """Calls hook(row, day) for every promotion that starts running; usable as a decorator"""
+        self._activate_hooks.append(hook)
+        return hook
+
+    def on_expire(self, hook):
+        """Calls hook(row, day) for every promotion that stops running; usable as a decorator"""
+        self._expire_hooks.append(hook)
+        return hook
+
+    def load(self, rows, version=None, day=None):
+        """Replaces the promotions the schedule knows about
+
+        Promotions that have ended are left out, and loading does not run
+        the hooks: they report what the passing of time changes.
+
+        Args:
+            rows (iterable): mappings with id, start_date and end_date
+            version: any value that identifies this set of promotions
+            day (date): the day of the running set, today when omitted
+        """
+        day = day or self.today()
+        heap = []
+        pending = {}
+        running = []
+        for row in rows:
+            row = dict(row)
+            start, end = row["start_date"], row["end_date"]
+            if end <= day or start >= end:
+                continue
+            pending[row["id"]] = row
+            heap.append((end, END, row["id"]))
+            if start <= day:
+                running.append(row)
+            else:
+                heap.append((start, START, row["id"]))
+        heapq.heapify(heap)
+        with self._lock:
+            self._heap = heap
+            self._rows = pending
+            self.active = ActiveSet(day, version, running)
+
+    def advance(self, day=None):
+        """Applies the transitions due by day, today when omitted
+
+        Returns:
+            tuple: the rows that started running and the rows that stopped
+        """
+        day = day or self.today()
+        activated = []
+        expired = []
+        with self._lock:
+            current = self.active
+            if current.day is None or day <= current.day:
+                return activated, expired
+            running = {row["id"]: row for row in current.rows}
+            while self._heap and self._heap[0][0] <= day:
+                _, kind, key = heapq.heappop(self._heap)
+                row = self._rows[key]
+                if kind == END:
+                    del self._rows[key]
+                    if running.pop(key, None) is not None:
+                        expired.append(row)
+                elif row["end_date"] > day:
+                    running[key] = row
+                    activated.append(row)
+            self.active = ActiveSet(day, current.version, running.values())
+        self.notify(activated, expired, day)
+        return activated, expired
+
+    def notify(self, activated, expired, day):
+        """Calls the expiry hooks for the rows that stopped running on day, then
+        the activation hooks for the rows that started"""
+        self._run_hooks(self._expire_hooks, expired, day)
+        self._run_hooks(self._activate_hooks, activated, day)
+
+    def _run_hooks(self, hooks, rows, day):
+        """Calls every hook for every row; a failing hook is logged and skipped"""
+        for row in rows:
+            for hook in hooks:
+                try:
+                    hook(row, day)
+                except Exception:  # pylint: disable=broad-except
+                    logger.exception("Promotion hook %r failed for %s", hook, row["id"])
+
+    def current(self):
+        """Returns the ActiveSet of today, advancing the schedule first if a day has passed"""
+        active = self.active
+        if active.day is not None and active.day < self.today():
+            self.advance()
+            active = self.active
+        return active
+
+    def next_transition(self):
+        """Returns the next day the running set changes on, or None"""
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def ensure_running(self):
+        """Starts the midnight thread of this process unless it runs already
+
+        A forked worker inherits the schedule but not its thread, so the
+        thread is started again in every new process.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._wakeup = threading.Event()
+            thread = threading.Thread(
+                target=self._run, args=(self._wakeup,), name="activation-schedule", daemon=True
+            )
+            thread.start()
+
+    def stop(self):
+        """Stops the midnight thread"""
+        self._pid = None
+        self._wakeup.set()
+
+    def _run(self, wakeup):
+        """Advances the schedule every midnight until wakeup is set"""
+        while not wakeup.wait(seconds_to_midnight(datetime.now()) + 0.5):
+            self.advance()
@@ -0,0 +1,128 @@
+"""
+Module: schema
+
+Compiles a list of field declarations into one validation function.
+
+The declarations are turned into a tuple of small per-field coercers once,
+at import time. The function that comes out makes a single pass over the
+payload: each field is looked up, coerced to its Python type and checked,
+and the first problem raises the given error class.
+"""
+from datetime import date
+
+TRUE_STRINGS = ("True", "true")
+FALSE_STRINGS = ("False", "false")
+
+
+class Field:  # pylint: disable=too-few-public-methods
+    """Declares one field of a schema"""
+
+    def __init__(self, name, kind, nullable=False, max_length=None):
+        """
+        Args:
+            name (str): the key of the field in the payload
+            kind (str): one of "string", "date" or "bool"
+            nullable (bool): if None is an accepted value
+            max_length (int): the longest accepted string
+        """
+        self.name = name
+        self.kind = kind
+        self.nullable = nullable
+        self.max_length = max_length
+
+
+def _coerce_string(field, fail):
+    max_length = field.max_length
+
+    def coerce(value):
+        if not isinstance(value, str):
+            fail(f"Invalid type for string [{field.name}]: {type(value)}")
+        if max_length is not None and len(value) > max_length:
+            fail(f"[{field.name}] is longer than {max_length} characters")
+        return value
+
+    return coerce
+
+
+def _coerce_date(field, fail):
+    def coerce(value):
+        if isinstance(value, date):
+            return value
+        if isinstance(value, str):
+            try:
+                return date.fromisoformat(value)
+            except ValueError:
+                pass
+        return fail(f"Invalid type for date [{field.name}]: {value!r}")
+
+    return coerce
+
+
+def _coerce_bool(field, fail):
+    def coerce(value):
+        if isinstance(value, bool):
+            return value
+        if value in TRUE_STRINGS:
+            return True
+        if value in FALSE_STRINGS:
+            return False
+        return fail(f"Invalid type for bool [{field.name}]: {value!r}")
+
+    return coerce
+
+
+COERCERS = {"string": _coerce_string, "date": _coerce_date, "bool": _coerce_bool}
+
+
+def _compile_field(field, fail, label):
+    """Returns a function that reads, coerces and checks one field of a payload"""
+    name = field.name
+    nullable = field.nullable
+    coerce = COERCERS[field.kind](field, fail)
+
+    def read(data):
+        try:
+            value = data[name]
+        except KeyError:
+            fail(f"Invalid {label}: missing {name}")
+        if value is None:
+            if not nullable:
+                fail(f"Invalid {label}: [{name}] can not be null")
+            return None
+        return coerce(value)
+
+    return read
+
+
+def compile_schema(fields, checks=(), error=ValueError, label="data"):
+    """Compiles field declarations into a single validation function
+
+    Args:
+        fields (list): the Field declarations, all of which are required
+        checks (tuple): functions called with the coerced dictionary that
+            return an error message, or None when the data is fine
+        error (type): the exception raised with the message of the first
+            problem found
+        label (str): what the payload is called in error messages
+
+    Returns:
+        function: takes a payload dictionary and returns a new dictionary
+        holding only the declared fields, coerced to their Python types
+    """
+
+    def fail(message):
+        raise error(message)
+
+    plan = tuple((field.name, _compile_field(field, fail, label)) for field in fields)
+
+    def validate(data):
+        if not isinstance(data, dict):
+            fail(f"Invalid {label}: expected an object, not {type(data).__name__}")
+        result = {name: read(data) for name, read in plan}
+        for check in checks:
+            message = check(result)
+            if message:
+                fail(message)
+        return result
+
+    return validate
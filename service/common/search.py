@@ -0,0 +1,108 @@
+"""
+Module: search
+
+An in-memory n-gram index for prefix and substring search.
+
+Databases without trigram indexes (SQLite) can only answer a substring
+search by scanning every row. This index maps every string of up to n
+characters found in the indexed text to the documents that contain it, so
+a query only checks documents that contain all of its n-grams.
+
+Matches are ranked field by field: a prefix match on the first field comes
+first, then a substring match on it, then a prefix match on the second
+field, and so on.
+"""
+import threading
+
+
+def rank(fields, text, prefix_only=False):
+    """Returns how well text matches the fields of a document, or None
+
+    Args:
+        fields (tuple): the lower case text of each field
+        text (str): the lower case search text
+        prefix_only (bool): if only matches at the start of a field count
+
+    Returns:
+        int: 2 * i for a prefix match on field i, 2 * i + 1 for a substring
+        match on it, or None when no field matches
+    """
+    for position, field in enumerate(fields):
+        if field.startswith(text):
+            return 2 * position
+        if not prefix_only and text in field:
+            return 2 * position + 1
+    return None
+
+
+class NgramIndex:
+    """Substring index over the text fields of a set of documents"""
+
+    def __init__(self, size=3):
+        """
+        Args:
+            size (int): the longest n-gram indexed; queries up to this long
+                are looked up directly, longer ones by their n-grams
+        """
+        self.size = size
+        self.version = None
+        self._postings = {}
+        self._documents = {}
+        self._lock = threading.Lock()
+
+    def grams(self, text, lengths):
+        """Returns the set of substrings of text with one of the given lengths"""
+        return {
+            text[start:start + length]
+            for length in lengths
+            for start in range(len(text) - length + 1)
+        }
+
+    def rebuild(self, documents, version=None):
+        """Replaces the indexed documents
+
+        Args:
+            documents (iterable): (key, fields) pairs, where fields is a tuple
+                of strings or None
+            version: any value that identifies this set of documents
+        """
+        postings = {}
+        stored = {}
+        lengths = range(1, self.size + 1)
+        for key, fields in documents:
+            fields = tuple((field or "").lower() for field in fields)
+            stored[key] = fields
+            for gram in set().union(*(self.grams(field, lengths) for field in fields)):
+                postings.setdefault(gram, set()).add(key)
+        with self._lock:
+            self._postings = postings
+            self._documents = stored
+            self.version = version
+
+    def search(self, text, prefix_only=False):
+        """Returns the keys of the documents matching text, best match first
+
+        Documents with the same rank keep key order.
+        """
+        text = text.lower()
+        if not text:
+            return []
+        with self._lock:
+            postings = self._postings
+            documents = self._documents
+        if len(text) <= self.size:
+            candidates = postings.get(text, set())
+        else:
+            grams = sorted(self.grams(text, [self.size]), key=lambda gram: len(postings.get(gram, ())))
+            candidates = set(postings.get(grams[0], set()))
+            for gram in grams[1:]:
+                candidates &= postings.get(gram, set())
+                if not candidates:
+                    break
+        ranked = []
+        for key in candidates:
+            match = rank(documents[key], text, prefix_only)
+            if match is not None:
+                ranked.append((match, key))
+        ranked.sort()
+        return [key for _, key in ranked]
@@ -12,5 +12,76 @@ DATABASE_URI = os.getenv(
 SQLALCHEMY_DATABASE_URI = DATABASE_URI
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+# Optional read replica of DATABASE_URI that GET requests read from
+DATABASE_REPLICA_URI = os.getenv("DATABASE_REPLICA_URI") or None
+
+# Connection pool of each worker process. By default the WEB_CONCURRENCY
+# gunicorn workers share DB_MAX_CONNECTIONS: half of each worker's share is
+# kept open and the rest is overflow opened only under load.
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "80"))
+_WORKER_CONNECTIONS = max(2, DB_MAX_CONNECTIONS // WEB_CONCURRENCY)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", str(_WORKER_CONNECTIONS // 2)))
+DB_MAX_OVERFLOW = int(
+    os.getenv("DB_MAX_OVERFLOW", str(_WORKER_CONNECTIONS - _WORKER_CONNECTIONS // 2))
+)
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "True").lower() in ("true", "1", "yes")
+SQLALCHEMY_ENGINE_OPTIONS = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+    "pool_pre_ping": DB_POOL_PRE_PING,
+}
+
+# Create any missing tables when the service starts. Turn it off where the
+# schema is created once by `flask db-init` before the workers start.
+DB_CREATE_ALL = os.getenv("DB_CREATE_ALL", "True").lower() in ("true", "1", "yes")
+
+# Statements at least this slow (in milliseconds) are logged; empty disables it
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100") or "inf")
+
+# Keyset pagination for the promotion list
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", "100"))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "1000"))
+
+# With ?estimate=1, PostgreSQL counts of at least this many rows come from
+# the planner's estimate instead of a scan
+COUNT_ESTIMATE_MIN = int(os.getenv("COUNT_ESTIMATE_MIN", "10000"))
+
+# Results of a ?q= search when no limit is given
+SEARCH_LIMIT_DEFAULT = int(os.getenv("SEARCH_LIMIT_DEFAULT", "20"))
+
+# Rows fetched per round trip when streaming the promotion list as NDJSON
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+
+# In-process cache of serialized promotions in front of Promotion.find
+PROMOTION_CACHE_SIZE = int(os.getenv("PROMOTION_CACHE_SIZE", "1024"))
+PROMOTION_CACHE_TTL = float(os.getenv("PROMOTION_CACHE_TTL", "30"))
+PROMOTION_CACHE_NEGATIVE_TTL = float(os.getenv("PROMOTION_CACHE_NEGATIVE_TTL", "5"))
+
+# Bulk writes: most items per request and rows per INSERT statement
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "10000"))
+BULK_INSERT_BATCH = int(os.getenv("BULK_INSERT_BATCH", "1000"))
+
+# Change feed: the longest a request may wait for a change, how many
+# requests of one worker process may wait at once (each holds a thread),
+# how often a waiting request looks for changes made by other workers, and
+# how long superseded changes and deletions stay in the feed
+CHANGES_WAIT_MAX = int(os.getenv("CHANGES_WAIT_MAX", "20"))
+CHANGES_WAITERS_MAX = int(os.getenv("CHANGES_WAITERS_MAX", "1"))
+CHANGES_POLL_INTERVAL = float(os.getenv("CHANGES_POLL_INTERVAL", "1"))
+CHANGES_COMPACT_AFTER_HOURS = float(os.getenv("CHANGES_COMPACT_AFTER_HOURS", "24"))
+CHANGES_RETENTION_DAYS = float(os.getenv("CHANGES_RETENTION_DAYS", "7"))
+
+# Server-Sent Events stream of the change feed (ASGI only): seconds between
+# keepalive comments, seconds before a stream ends and the client resumes
+# it with Last-Event-ID, and the most events a client may fall behind
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+SSE_MAX_SECONDS = float(os.getenv("SSE_MAX_SECONDS", "300"))
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "1000"))
+
 # Secret for session management
 SECRET_KEY = os.getenv("SECRET_KEY", "s3cr3t-key-shhhh")
@@ -1,22 +1,29 @@
 """ for mode data validation error"""
+import base64
+import binascii
 import datetime
-from service.models import DataValidationError
+import json
+from flask_restx import inputs
+from service.models import DataValidationError, Promotion
 from . import app
 
 
-def convert_data(data):
-    """Helper for routes to convert data types"""
-    try:
-        for key in data.keys():
-            if key in ["start_date", "end_date", "original_end_date"]:
-                data[key] = datetime.datetime.strptime(data[key], "%Y-%m-%d").date()
-            if key in ["whole_store", "has_been_extended", "promotion_changes_price"]:
-                data[key] = data[key] == "True"
-    # flake8: noqa: F841
-    except ValueError as exc:
-        raise DataValidationError(f"Could not convert {key}") from exc
-    except TypeError as exc:
-        raise DataValidationError(f"Could not convert {key}") from exc
+# Header that carries the PromotionRevision of a client's last write
+CONSISTENCY_TOKEN = "X-Consistency-Token"
+
+
+def consistency_token(headers):
+    """Returns the revision in the X-Consistency-Token header, or None without one
+
+    Raises:
+        DataValidationError: when the header is not a revision number
+    """
+    value = headers.get(CONSISTENCY_TOKEN)
+    if value is None:
+        return None
+    if not value.isdigit():
+        raise DataValidationError(f"Invalid {CONSISTENCY_TOKEN}: {value}")
+    return int(value)
 
 
 def convert_data_back(data):
@@ -36,3 +43,126 @@ def convert_data_back(data):
             else:
                 app.logger.warning("Convert bool: %s, %s", key, data[key])
                 raise DataValidationError(f"Could not convert bool type of {key}")
+
+
+def convert_row(row, fields=None):
+    """Helper for routes to format a selected promotion row as it is returned
+
+    The result matches marshal(row, promotion_model) without the per-field
+    marshalling overhead. With fields, from parse_fields, only those keys
+    are returned.
+    """
+    data = dict(row) if fields is None else {name: row[name] for name in fields}
+    if data.get("id") is not None:
+        data["id"] = str(data["id"])
+    for key in ["start_date", "end_date", "original_end_date"]:
+        if data.get(key) is not None:
+            data[key] = data[key].isoformat()
+    return data
+
+
+def convert_change(row):
+    """Helper for routes to format a change feed row as it is returned
+
+    The promotion is shown as GET returns it, or null after a delete.
+    """
+    promotion = row["data"]
+    if promotion is not None:
+        promotion = dict(promotion, id=str(promotion["id"]))
+    return {
+        "seq": row["seq"],
+        "id": str(row["promotion_id"]),
+        "kind": row["kind"],
+        "changed_at": row["changed_at"].isoformat() + "Z",
+        "promotion": promotion,
+    }
+
+
+def parse_date(value):
+    """Helper for routes to read an ISO 8601 date query parameter as a date
+
+    inputs.date returns a datetime, which SQLite compares as text against
+    the stored dates and so never equals one.
+    """
+    return inputs.date(value).date()
+
+
+parse_date.__schema__ = inputs.date.__schema__
+
+
+def parse_window(value):
+    """Helper for routes to read a "start,end" pair of ISO 8601 dates"""
+    parts = value.split(",")
+    if len(parts) != 2:
+        raise ValueError(f"Expected two dates separated by a comma, not {value}")
+    start, end = (parse_date(part.strip()) for part in parts)
+    if not start < end:
+        raise ValueError(f"The window must end after it starts, not {value}")
+    return start, end
+
+
+parse_window.__schema__ = {"type": "string", "example": "2023-06-01,2023-07-01"}
+
+
+def parse_fields(value):
+    """Helper for routes to read a comma separated list of Promotion fields
+
+    Returns:
+        tuple: the fields, without repeats and in the order of Promotion.FIELDS
+    """
+    names = {name.strip() for name in value.split(",")} - {""}
+    unknown = names.difference(Promotion.FIELDS)
+    if not names:
+        raise ValueError("Expected a comma separated list of fields")
+    if unknown:
+        raise ValueError(f"Unknown fields {', '.join(sorted(unknown))}; choose from {', '.join(Promotion.FIELDS)}")
+    return tuple(name for name in Promotion.FIELDS if name in names)
+
+
+parse_fields.__schema__ = {"type": "string", "example": "id,name,end_date"}
+
+
+def fields_variant(fields):
+    """Helper for routes to tell the ETags of sparse fieldsets apart"""
+    return "" if fields is None else "-" + ".".join(fields)
+
+
+def encode_cursor(key):
+    """Helper for routes to turn a keyset position into an opaque cursor token"""
+    raw = json.dumps(key, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token):
+    """Helper for routes to turn an opaque cursor token back into a keyset position"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (binascii.Error, UnicodeError, ValueError) as exc:
+        raise DataValidationError(f"Invalid cursor: {token}") from exc
+    if isinstance(key, bool) or not isinstance(key, (int, list)):
+        raise DataValidationError(f"Invalid cursor: {token}")
+    return key
+
+
+def convert_selection(data):
+    """Helper for routes to read which promotions a bulk change applies to"""
+    if not isinstance(data, dict):
+        raise DataValidationError("Bulk change expects a JSON object")
+    selection = {"ids": None, "name": None, "ending_on": None}
+    ids = data.get("ids")
+    if ids is not None:
+        if not isinstance(ids, list) or not all(
+            isinstance(promotion_id, int) and not isinstance(promotion_id, bool)
+            for promotion_id in ids
+        ):
+            raise DataValidationError("ids must be a list of integers")
+        selection["ids"] = ids
+    if data.get("name") is not None:
+        selection["name"] = str(data["name"])
+    if data.get("ending_on") is not None:
+        try:
+            selection["ending_on"] = datetime.date.fromisoformat(data["ending_on"])
+        except (TypeError, ValueError) as exc:
+            raise DataValidationError("Could not convert ending_on") from exc
+    return selection
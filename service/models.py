@@ -18,12 +18,170 @@ original_end_date: date time, get&set
 message: string, get&set
 promotion_changes_price: boolean, get&set
 """
-from datetime import date
+# pylint: disable=too-many-lines
+import operator
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import DDL, event
+from sqlalchemy.sql import Select
+from service.common.cache import LRUCache, MISSING
+from service.common.notify import Notifier
+from service.common.pool import engine_options
+from service.common.query_log import init_query_log, watch_engine
+from service.common.scheduler import ActivationSchedule
+from service.common.schema import Field, compile_schema
+from service.common.search import NgramIndex
 from . import app
 
+# Bind key of the read replica engine, configured by DATABASE_REPLICA_URI
+REPLICA = "replica"
+
+
+class RoutingSession(Session):  # pylint: disable=too-few-public-methods
+    """Session that runs the SELECTs of replica_reads() blocks on the read replica
+
+    Everything else, including the SELECTs a flush issues, uses the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and self.info.get(REPLICA)
+            and not self._flushing
+            and isinstance(clause, Select)
+        ):
+            return self._db.engines[REPLICA]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
 # Create the SQLAlchemy object to be initialized later in init_db()
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+# Session info key set while a transaction has recorded changes in the feed
+CHANGES = "changes"
+
+# Wakes the requests waiting on the change feed when this process commits changes
+change_notifier = Notifier()
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def notify_changes(session):
+    """Wakes the change feed waiters once recorded changes are committed"""
+    if session.info.pop(CHANGES, False):
+        change_notifier.notify()
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def forget_changes(session):
+    """Forgets the changes of a transaction that was rolled back"""
+    session.info.pop(CHANGES, None)
+
+
+# Serialized Promotions by id, sized in init_db()
+cache = LRUCache()
+
+# Name and message n-grams for search on databases without trigram indexes
+search_index = NgramIndex()
+
+# Promotions running today, moved on to the next day at every midnight. Every
+# worker keeps its own to serve /active, without hooks
+activations = ActivationSchedule()
+
+# The hooks called when Promotions start and stop running, once for the
+# whole service, by Promotion.run_transitions()
+transitions = ActivationSchedule()
+
+
+@transitions.on_activate
+def log_activation(row, day):
+    """Logs a Promotion that starts running"""
+    app.logger.info("Promotion %s (%s) started on %s", row["id"], row["name"], day)
+
+
+@transitions.on_expire
+def log_expiry(row, day):
+    """Logs a Promotion that stops running"""
+    app.logger.info("Promotion %s (%s) ended on %s", row["id"], row["name"], day)
+
+
+# Searched text columns, in ranking order
+SEARCHED = ("name", "message")
+
+# Suffixes of the list filters that compare a date column with a bound
+RANGE_OPERATORS = {
+    "_gt": operator.gt,
+    "_gte": operator.ge,
+    "_lt": operator.lt,
+    "_lte": operator.le,
+}
+
+# List filters: the query parameter, and the column and comparison it applies
+FILTERS = {
+    name: (name, operator.eq)
+    for name in (
+        "name",
+        "message",
+        "start_date",
+        "end_date",
+        "whole_store",
+        "has_been_extended",
+        "promotion_changes_price",
+    )
+}
+FILTERS.update(
+    (column + suffix, (column, compare))
+    for column in ("start_date", "end_date")
+    for suffix, compare in RANGE_OPERATORS.items()
+)
+
+# Columns a list can be sorted by; the id breaks ties between equal values
+SORTABLE = ("id", "name", "start_date", "end_date")
+
+
+def date_period(start_date, end_date):
+    """Returns the [start_date, end_date) window as a PostgreSQL daterange
+
+    A window that ends before it starts becomes an empty range instead of an
+    error, so such rows can still be inserted and simply overlap nothing.
+    """
+    return db.func.daterange(start_date, db.func.greatest(start_date, end_date))
+
+
+def builds_on(index, bind):
+    """Checks if an index can be built on the database of a connection
+
+    Indexes declare what they need in their info: the "dialect" of the
+    database and, optionally, an "extension" that must be installed.
+    """
+    dialect = index.info.get("dialect")
+    if dialect is None:
+        return True
+    if bind is None or bind.dialect.name != dialect:
+        return False
+    extension = index.info.get("extension")
+    if extension is None:
+        return True
+    return bind.execute(
+        db.text("SELECT 1 FROM pg_extension WHERE extname = :name"), {"name": extension}
+    ).first() is not None
+
+
+# Indexes that earlier versions declared and no query uses any more;
+# flask db-index drops them from existing databases
+RETIRED_INDEXES = ("ix_promotion_name_lower",)
+
+
+def _builds_on(ddl, target, bind, **kw):  # pylint: disable=unused-argument
+    """ddl_if() callable that creates an index only where builds_on() allows"""
+    return builds_on(target, bind)
+
+
+def escape_like(text):
+    """Escapes the LIKE wildcards in text, using a backslash as escape character"""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
 
 
 # Function to initialize the database
@@ -32,13 +190,55 @@ def init_db(app1):
     Promotion.init_db(app1)
 
 
+def utcnow():
+    """Returns the current UTC time without a time zone, as the change feed stores it"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def cache_key(by_id):
+    """Returns the cache key of a Promotion id, or None if it can not be an id"""
+    try:
+        return int(by_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def replica_revision():
+    """Returns the PromotionRevision the read replica has replayed"""
+    with db.engines[REPLICA].connect() as conn:
+        return conn.execute(PromotionRevision.select_current()).scalar() or 0
+
+
+@contextmanager
+def replica_reads(min_revision=None):
+    """Runs the SELECTs inside the with block on the read replica
+
+    Without DATABASE_REPLICA_URI the block reads from the primary as usual.
+    When min_revision is given and the replica has not replayed that
+    PromotionRevision yet, the block reads from the primary as well, so a
+    client that passes the revision of its last write sees that write.
+
+    Yields:
+        bool: True if the block reads from the replica
+    """
+    if REPLICA not in db.engines or (min_revision and replica_revision() < min_revision):
+        yield False
+        return
+    session = db.session()
+    session.info[REPLICA] = True
+    try:
+        yield True
+    finally:
+        session.info.pop(REPLICA, None)
+
+
 class DataValidationError(Exception):
     """Used for an data validation errors when deserializing"""
 
     status_code = 400  # copied format from https://flask.palletsprojects.com/en/2.3.x/errorhandling/
 
     def __init__(self, message, status_code=None, payload=None):
-        super().__init__()
+        super().__init__(message)
         self.message = message
         self.status_code = status_code
         self.payload = payload
@@ -55,21 +255,82 @@ class Promotion(db.Model):
     Class that represents a Promotion
     """
 
-    # pylint: disable=too-many-instance-attributes
+    # pylint: disable=too-many-instance-attributes, too-many-public-methods
     # Eight is reasonable in this case.
 
     app = None
 
+    # Columns that serialize() returns, in order
+    FIELDS = (
+        "id",
+        "name",
+        "start_date",
+        "end_date",
+        "whole_store",
+        "has_been_extended",
+        "original_end_date",
+        "message",
+        "promotion_changes_price",
+    )
+
     # Table Schema
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(63), nullable=False)
+    name = db.Column(db.String(63), nullable=False, index=True)
     start_date = db.Column(db.Date, nullable=False)
-    end_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False, index=True)
     whole_store = db.Column(db.Boolean, default=False)
     has_been_extended = db.Column(db.Boolean, default=False)
-    original_end_date = db.Column(db.Date)
-    message = db.Column(db.String(63))
+    original_end_date = db.Column(db.Date, index=True)
+    message = db.Column(db.String(63), index=True)
     promotion_changes_price = db.Column(db.Boolean, default=False)
+    # Bumped on every update, so id and version identify one exact state
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+
+    # What the next update() records in the change feed; update_end_date()
+    # and cancel() set it
+    change_kind = "update"
+
+    # Secondary indexes that are not tied to a single column. The active
+    # index also serves start_date lookups through its leading column, and
+    # is what SQLite uses for overlap queries. PostgreSQL answers those from
+    # a GiST index over the date period, and searches from text_pattern_ops
+    # (prefix) and pg_trgm (substring) indexes. The trigram indexes are only
+    # built where the pg_trgm extension is installed.
+    __table_args__ = (
+        db.Index("ix_promotion_active", start_date, end_date),
+        db.Index(
+            "ix_promotion_period",
+            date_period(start_date, end_date),
+            postgresql_using="gist",
+            info={"dialect": "postgresql"},
+        ).ddl_if(callable_=_builds_on),
+        db.Index(
+            "ix_promotion_name_prefix",
+            db.func.lower(name).label("name_lower"),
+            postgresql_ops={"name_lower": "text_pattern_ops"},
+            info={"dialect": "postgresql"},
+        ).ddl_if(callable_=_builds_on),
+        db.Index(
+            "ix_promotion_message_prefix",
+            db.func.lower(message).label("message_lower"),
+            postgresql_ops={"message_lower": "text_pattern_ops"},
+            info={"dialect": "postgresql"},
+        ).ddl_if(callable_=_builds_on),
+        db.Index(
+            "ix_promotion_name_trgm",
+            db.func.lower(name).label("name_lower"),
+            postgresql_using="gin",
+            postgresql_ops={"name_lower": "gin_trgm_ops"},
+            info={"dialect": "postgresql", "extension": "pg_trgm"},
+        ).ddl_if(callable_=_builds_on),
+        db.Index(
+            "ix_promotion_message_trgm",
+            db.func.lower(message).label("message_lower"),
+            postgresql_using="gin",
+            postgresql_ops={"message_lower": "gin_trgm_ops"},
+            info={"dialect": "postgresql", "extension": "pg_trgm"},
+        ).ddl_if(callable_=_builds_on),
+    )
 
     def __repr__(self):
         return f"<Promotion {self.name} id=[{self.id}]>"
@@ -82,7 +343,55 @@ class Promotion(db.Model):
         self.original_end_date = self.end_date
         self.id = None  # pylint: disable=invalid-name
         db.session.add(self)
+        PromotionRevision.bump()
+        PromotionChange.record("create", [self.serialize()])
         db.session.commit()
+        cache.invalidate(self.id)
+
+    @classmethod
+    def create_many(cls, promotions, batch_size=1000):
+        """
+        Creates many Promotions in one transaction
+
+        Rows are sent as multi-row INSERT ... RETURNING statements of up to
+        batch_size rows each, instead of one INSERT and COMMIT per Promotion.
+
+        Args:
+            promotions (list): the deserialized Promotions to add
+            batch_size (int): the most rows sent in one INSERT statement
+
+        Returns:
+            list: the ids of the new Promotions, in the order they were given
+        """
+        app.logger.info("Creating %d promotions", len(promotions))
+        if not promotions:
+            return []
+        table = cls.__table__
+        rows = []
+        for promotion in promotions:
+            row = promotion.serialize()
+            del row["id"]
+            row["original_end_date"] = row["end_date"]
+            rows.append(row)
+        ids = []
+        for first in range(0, len(rows), batch_size):
+            statement = (
+                db.insert(table)
+                .values(rows[first:first + batch_size])
+                .returning(table.c.id)
+            )
+            # RETURNING does not promise the order of VALUES, but the id
+            # sequence numbers the rows in VALUES order, so sorting the
+            # batch's ids pairs each one with its row
+            ids.extend(sorted(db.session.execute(statement).scalars()))
+        PromotionRevision.bump()
+        PromotionChange.record(
+            "create", [dict(row, id=promotion_id) for row, promotion_id in zip(rows, ids)]
+        )
+        db.session.commit()
+        for promotion_id in ids:
+            cache.invalidate(promotion_id)
+        return ids
 
     def update(self):
         """
@@ -90,104 +399,43 @@ class Promotion(db.Model):
         """
         if not self.id:
             raise DataValidationError("Update called with empty ID field")
+        self.version = Promotion.version + 1
+        PromotionRevision.bump()
+        PromotionChange.record(self.change_kind, [self.serialize()])
+        self.change_kind = "update"
         db.session.commit()
+        cache.invalidate(self.id)
 
     def delete(self):
         """Removes a YourResourceModel from the data store"""
         app.logger.info("Deleting %s", self.name)
+        promotion_id = self.id
         db.session.delete(self)
+        PromotionRevision.bump()
+        PromotionChange.record("delete", [{"id": promotion_id}])
         db.session.commit()
+        cache.invalidate(promotion_id)
 
     def serialize(self):
         """Serializes a YourResourceModel into a dictionary"""
-        return {
-            "id": self.id,
-            "name": self.name,
-            "start_date": self.start_date,
-            "end_date": self.end_date,
-            "whole_store": self.whole_store,
-            "has_been_extended": self.has_been_extended,
-            "original_end_date": self.original_end_date,
-            "message": self.message,
-            "promotion_changes_price": self.promotion_changes_price,
-        }
+        return {name: getattr(self, name) for name in self.FIELDS}
 
-    # flake8: noqa: C901
-    # pylint: disable=too-many-branches
     def deserialize(self, data):
         """
         Deserializes a Promotion from a dictionary
 
+        Dates may be date objects or ISO 8601 strings and booleans may be
+        bools or "True"/"False" strings.
+
         Args:
             data (dict): A dictionary containing the resource data
+
+        Raises:
+            DataValidationError: When a field is missing, has the wrong type
+            or is too long, or when the start date > the end date
         """
-        try:
-            self.name = data["name"]
-            if isinstance(data["start_date"], date):
-                self.start_date = data["start_date"]
-            else:
-                app.logger.warning("Tripped in Start Date")
-                raise DataValidationError(
-                    "Invalid type for date [start_date]: "
-                    + str(type(data["start_date"]))
-                )
-            if isinstance(data["end_date"], date):
-                if data["start_date"] > data["end_date"]:
-                    start_date = data["start_date"]
-                    end_date = data["end_date"]
-                    raise DataValidationError(
-                        f"Start Date {start_date} > End Date: {end_date}"
-                    )
-                self.end_date = data["end_date"]
-            else:
-                app.logger.warning("Tripped in End Date")
-                raise DataValidationError(
-                    "Invalid type for date [end_date]: " + str(type(data["end_date"]))
-                )
-            if isinstance(data["whole_store"], bool):
-                self.whole_store = data["whole_store"]
-            else:
-                app.logger.warning("Tripped in Whole Store")
-                raise DataValidationError(
-                    "Invalid type for date [whole_store]: "
-                    + str(type(data["whole_store"]))
-                )
-            if isinstance(data["has_been_extended"], bool):
-                self.has_been_extended = data["has_been_extended"]
-            else:
-                app.logger.warning("Tripped in extended")
-                raise DataValidationError(
-                    "Invalid type for date [has_been_extended]: "
-                    + str(type(data["has_been_extended"]))
-                )
-            if isinstance(data["original_end_date"], date):
-                self.original_end_date = data["original_end_date"]
-            else:
-                app.logger.warning("Tripped in original end date")
-                raise DataValidationError(
-                    "Invalid type for date [original_end_date]: "
-                    + str(type(data["original_end_date"]))
-                )
-            self.message = data["message"]
-            if isinstance(data["promotion_changes_price"], bool):
-                self.promotion_changes_price = data["promotion_changes_price"]
-            else:
-                app.logger.warning("Tripped in promotion changes price")
-                raise DataValidationError(
-                    "Invalid type for date [promotion_changes_price]: "
-                    + str(type(data["promotion_changes_price"]))
-                )
-        except KeyError as error:
-            app.logger.warning("tripped in Invalid promotion")
-            raise DataValidationError(
-                "Invalid promotion: missing " + error.args[0]
-            ) from error
-        except TypeError as error:
-            app.logger.warning("Tripped in type error")
-            raise DataValidationError(
-                "Invalid promotion: body of request contained bad or no data "
-                + str(error)
-            ) from error
+        for name, value in validate_promotion(data).items():
+            setattr(self, name, value)
         return self
 
     def update_end_date(self, data):
@@ -198,19 +446,15 @@ class Promotion(db.Model):
 
         Raises:
             DataValidationError: When the start date > the new end date
-            DataValidationError: When the end date key is missing.
-        """
-        if "end_date" in data.keys():
-            if self.start_date > data["end_date"]:
-                start_date = self.start_date
-                end_date = data["end_date"]
-                raise DataValidationError(
-                    f"Start Date {start_date} > End Date: {end_date}"
-                )
-            self.end_date = data["end_date"]
-        else:
-            app.logger.warning("Tripped in End Date")
-            raise DataValidationError("End date update does not contain end_date: ")
+            DataValidationError: When the end date key is missing or not a date.
+        """
+        end_date = validate_end_date(data)["end_date"]
+        if self.start_date > end_date:
+            raise DataValidationError(
+                f"Start Date {self.start_date} > End Date: {end_date}"
+            )
+        self.end_date = end_date
+        self.change_kind = "end_date"
 
     def cancel(self):
         """
@@ -220,22 +464,110 @@ class Promotion(db.Model):
             None
         """
         self.update_end_date({"end_date": (date.today())})
+        self.change_kind = "cancel"
 
-    def is_active(self):
-        """States if promotion is running"""
-        if self.start_date <= date.today() and self.end_date > date.today():
-            return True
-        return False
+    @classmethod
+    def change_end_dates(  # pylint: disable=too-many-arguments
+        cls, end_date, ids=None, name=None, ending_on=None, change="end_date"
+    ):
+        """Sets the end date of every selected Promotion with one UPDATE
+
+        Promotions are selected by id, by name or by their current end date;
+        when several selectors are given a Promotion must match all of them.
+        Like update_end_date(), a Promotion that starts after the new end date
+        keeps its old end date.
+
+        Args:
+            end_date (date): the new end date
+            ids (list): ids of the Promotions to change
+            name (string): name of the Promotions to change
+            ending_on (date): current end date of the Promotions to change
+            change (string): the kind of change recorded in the change feed
+
+        Returns:
+            list: the changed Promotions, serialized
+
+        Raises:
+            DataValidationError: When no selector is given
+        """
+        criteria = []
+        if ids is not None:
+            criteria.append(cls.id.in_(ids))
+        if name is not None:
+            criteria.append(cls.name == name)
+        if ending_on is not None:
+            criteria.append(cls.end_date == ending_on)
+        if not criteria:
+            raise DataValidationError("Select the promotions by ids, name or ending_on")
+        app.logger.info("Changing end dates to %s where %s", end_date, criteria)
+        table = cls.__table__
+        statement = (
+            db.update(table)
+            .where(table.c.start_date <= end_date, *criteria)
+            .values(end_date=end_date, version=table.c.version + 1)
+            .returning(*table.c)
+        )
+        rows = [dict(row) for row in db.session.execute(statement).mappings()]
+        if rows:
+            PromotionRevision.bump()
+            PromotionChange.record(change, [{name: row[name] for name in cls.FIELDS} for row in rows])
+        db.session.commit()
+        for row in rows:
+            cache.invalidate(row["id"])
+        return rows
+
+    @classmethod
+    def cancel_many(cls, ids=None, name=None, ending_on=None):
+        """Cancels every selected Promotion that has started, with one UPDATE
+
+        Args:
+            ids (list): ids of the Promotions to cancel
+            name (string): name of the Promotions to cancel
+            ending_on (date): current end date of the Promotions to cancel
+
+        Returns:
+            list: the cancelled Promotions, serialized
+        """
+        return cls.change_end_dates(date.today(), ids, name, ending_on, change="cancel")
+
+    def is_active(self, as_of=None):
+        """States if promotion is running
+
+        Args:
+            as_of (date): the day to check, when omitted the current day of
+                the activation schedule, so the answer changes at the same
+                moment as /promotions/active
+        """
+        as_of = as_of or activations.current().day or date.today()
+        return self.start_date <= as_of < self.end_date
 
     @classmethod
     def init_db(cls, app1):
         """Initializes the database session"""
         app1.logger.info("Initializing database")
         cls.app = app1
+        cache.configure(
+            app1.config["PROMOTION_CACHE_SIZE"],
+            app1.config["PROMOTION_CACHE_TTL"],
+            app1.config["PROMOTION_CACHE_NEGATIVE_TTL"],
+        )
+        options = app1.config.get("SQLALCHEMY_ENGINE_OPTIONS", {})
+        app1.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(
+            app1.config["SQLALCHEMY_DATABASE_URI"], options
+        )
+        replica_uri = app1.config.get("DATABASE_REPLICA_URI")
+        if replica_uri:
+            app1.config["SQLALCHEMY_BINDS"] = {
+                REPLICA: {"url": replica_uri, **engine_options(replica_uri, options)}
+            }
         # This is where we initialize SQLAlchemy from the Flask app
         db.init_app(app1)
         app1.app_context().push()
-        db.create_all()  # make our sqlalchemy tables
+        init_query_log(app1, db.engine, app1.config["SLOW_QUERY_MS"])
+        if replica_uri:
+            watch_engine(app1, db.engines[REPLICA], app1.config["SLOW_QUERY_MS"])
+        if app1.config["DB_CREATE_ALL"]:
+            db.create_all()  # make our sqlalchemy tables
 
     @classmethod
     def all(cls):
@@ -243,11 +575,234 @@ class Promotion(db.Model):
         app.logger.info("Processing all YourResourceModels")
         return cls.query.all()
 
+    @classmethod
+    def select_columns(cls, query=None, fields=None):
+        """Returns a Core SELECT of the serialized columns, filtered like query
+
+        Args:
+            query (Query): an optional Promotion query whose filters to apply
+            fields (iterable): only select these of FIELDS; the id is always
+                selected, as pages and search results are keyed by it
+        """
+        table = cls.__table__
+        names = cls.FIELDS
+        if fields is not None:
+            names = [name for name in cls.FIELDS if name in fields or name == "id"]
+        statement = db.select(*[table.c[name] for name in names])
+        if query is not None and query.whereclause is not None:
+            statement = statement.where(query.whereclause)
+        return statement
+
+    @classmethod
+    def count(cls, query=None, estimate_min=None):
+        """Returns how many Promotions match the filters of query
+
+        Args:
+            query (Query): an optional Promotion query whose filters to apply
+            estimate_min (int): when given, on PostgreSQL, the planner's
+                estimate of the matching rows is returned if it is at least
+                this many, so a large count costs no scan; smaller counts,
+                and counts on other databases, are exact
+
+        Returns:
+            tuple: the count, and True if it is an estimate
+        """
+        table = cls.__table__
+        condition = query.whereclause if query is not None else None
+        if estimate_min is not None and db.engine.dialect.name == "postgresql":
+            statement = db.select(table.c.id)
+            if condition is not None:
+                statement = statement.where(condition)
+            compiled = statement.compile(dialect=db.engine.dialect)
+            plan = (
+                db.session.connection(bind_arguments={"clause": statement})
+                .exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params)
+                .scalar()
+            )
+            rows = int(plan[0]["Plan"]["Plan Rows"])
+            if rows >= estimate_min:
+                return rows, True
+        statement = db.select(db.func.count()).select_from(table)
+        if condition is not None:
+            statement = statement.where(condition)
+        return db.session.execute(statement).scalar(), False
+
+    @classmethod
+    def sort_columns(cls, sort="id"):
+        """Returns the columns that sort by one of SORTABLE, ending with the id"""
+        table = cls.__table__
+        return [table.c[sort], table.c.id] if sort != "id" else [table.c.id]
+
+    @classmethod
+    def ordering(cls, sort="id", descending=False):
+        """Returns the ORDER BY clauses that sort by a column, then by id
+
+        Args:
+            sort (str): one of SORTABLE
+            descending (bool): if the largest values come first
+        """
+        columns = cls.sort_columns(sort)
+        return [column.desc() if descending else column.asc() for column in columns]
+
+    @classmethod
+    def select_rows(cls, query=None, sort="id", descending=False, fields=None):
+        """Returns the serialized columns of matching Promotions as dictionaries
+
+        This reads plain rows instead of building a Promotion per row, so
+        list reads skip object construction and identity map bookkeeping.
+
+        Args:
+            query (Query): an optional Promotion query whose filters to apply
+            sort (str): the column to sort by, one of SORTABLE
+            descending (bool): if the largest values come first
+            fields (iterable): only select these columns, see select_columns()
+        """
+        app.logger.info("Processing row query")
+        statement = cls.select_columns(query, fields).order_by(*cls.ordering(sort, descending))
+        return db.session.execute(statement).mappings().all()
+
+    @classmethod
+    def paginate(cls, query, limit, after=None, sort="id", descending=False, fields=None):
+        # pylint: disable=too-many-arguments
+        """Returns one page of a query using a keyset range scan
+
+        Pages sorted by id resume after an id. Pages sorted by another column
+        resume after a (value, id) pair, which the id makes unique.
+
+        Args:
+            query (Query): the (possibly filtered) Promotion query to page through
+            limit (int): the maximum number of Promotions on the page
+            after (int or list): the key of the last Promotion on the previous page
+            sort (str): the column to sort by, one of SORTABLE
+            descending (bool): if the largest values come first
+            fields (iterable): only select these columns, and the sort column
+                the next key is made of
+
+        Returns:
+            tuple: the rows on the page (as from select_rows) and the key to
+            resume after, or None when this is the last page
+
+        Raises:
+            DataValidationError: when after is not a key of this sort order
+        """
+        app.logger.info("Processing page of %s after %s ...", limit, after)
+        if fields is not None:
+            fields = {*fields, sort}
+        statement = cls.select_page(cls.select_columns(query, fields), limit, after, sort, descending)
+        return cls.split_page(db.session.execute(statement).mappings().all(), limit, sort)
+
+    @classmethod
+    def select_page(cls, statement, limit, after=None, sort="id", descending=False):
+        # pylint: disable=too-many-arguments
+        """Narrows a select_columns() statement to one page, plus one row that
+        tells if another page follows; see paginate()"""
+        if after is not None:
+            position = db.tuple_(*cls.sort_columns(sort))
+            bound = db.tuple_(*cls.keyset_values(after, sort))
+            statement = statement.where(position < bound if descending else position > bound)
+        return statement.order_by(*cls.ordering(sort, descending)).limit(limit + 1)
+
+    @classmethod
+    def split_page(cls, rows, limit, sort="id"):
+        """Splits the rows of a select_page() statement into the page and the
+        key to resume after, or None when this is the last page"""
+        if len(rows) > limit:
+            return rows[:limit], cls.keyset(rows[limit - 1], sort)
+        return rows, None
+
+    @classmethod
+    def keyset(cls, row, sort="id"):
+        """Returns the JSON friendly key that a page sorted by sort resumes after"""
+        if sort == "id":
+            return row["id"]
+        value = row[sort]
+        return [value.isoformat() if isinstance(value, date) else value, row["id"]]
+
+    @classmethod
+    def keyset_values(cls, key, sort="id"):
+        """Returns the column values of a key made by keyset()
+
+        Raises:
+            DataValidationError: when key does not belong to this sort order
+        """
+        if sort == "id" and isinstance(key, int):
+            return [key]
+        if sort != "id" and isinstance(key, list) and len(key) == 2:
+            value, promotion_id = key
+            if isinstance(value, str) and isinstance(promotion_id, int):
+                if not isinstance(cls.__table__.c[sort].type, db.Date):
+                    return [value, promotion_id]
+                try:
+                    return [date.fromisoformat(value), promotion_id]
+                except ValueError:
+                    pass
+        raise DataValidationError(f"Invalid cursor for sort {sort}: {key}")
+
+    @classmethod
+    def stream(cls, query, batch_size, sort="id", descending=False, fields=None):
+        # pylint: disable=too-many-arguments
+        """Iterates over the rows of a query in batches through a server-side cursor
+
+        Args:
+            query (Query): the (possibly filtered) Promotion query to stream
+            batch_size (int): the number of rows fetched per round trip
+            sort (str): the column to sort by, one of SORTABLE
+            descending (bool): if the largest values come first
+            fields (iterable): only select these columns, see select_columns()
+        """
+        app.logger.info("Processing streamed query in batches of %s", batch_size)
+        statement = cls.select_columns(query, fields).order_by(*cls.ordering(sort, descending))
+        result = db.session.execute(
+            statement, execution_options={"yield_per": batch_size}
+        )
+        return result.mappings()
+
     @classmethod
     def find(cls, by_id):
-        """Finds a YourResourceModel by it's ID"""
+        """Finds a YourResourceModel by it's ID
+
+        Ids that are not integers are answered without a database round
+        trip. Other ids always query the database, never the cache: this is
+        the lookup that writes go through, and a cached miss may be stale.
+        """
         app.logger.info("Processing lookup for id %s ...", by_id)
-        return cls.query.get(by_id)
+        key = cache_key(by_id)
+        if key is None:
+            return None
+        return db.session.get(cls, key)
+
+    @classmethod
+    def find_serialized(cls, by_id, use_cache=True):
+        """Finds a Promotion by it's ID and returns it serialized
+
+        Serialized Promotions are cached, so reads of hot Promotions do not
+        reach the database until create, update or delete invalidates them
+        or their time to live runs out. Only rows read from the primary are
+        cached: the replica may not have replayed the write that last
+        invalidated the entry yet.
+
+        Args:
+            by_id (int): the id of the Promotion to find
+            use_cache (bool): False to skip the cached copy, which may be
+                older than the database
+
+        Returns:
+            dict: the serialized Promotion plus its version, or None if it
+            does not exist
+        """
+        key = cache_key(by_id)
+        if key is None:
+            return None
+        data = cache.get(key) if use_cache else MISSING
+        if data is MISSING:
+            promotion = db.session.get(cls, key)
+            data = None
+            if promotion:
+                data = promotion.serialize()
+                data["version"] = promotion.version
+            if not db.session.info.get(REPLICA):
+                cache.set(key, data)
+        return dict(data) if data else None
 
     @classmethod
     def find_by_name(cls, name):
@@ -299,6 +854,191 @@ class Promotion(db.Model):
         app.logger.info("Processing name query for %s ...", message)
         return cls.query.filter(cls.message == message)
 
+    @classmethod
+    def find_by_filters(cls, filters):
+        """Returns all Promotions that match every one of the given filters
+
+        Args:
+            filters (dict): values keyed by the names in FILTERS, for example
+                {"name": "Sale", "start_date_gte": date(2023, 6, 1)}
+
+        Raises:
+            DataValidationError: when a filter name is not in FILTERS
+        """
+        app.logger.info("Processing filter query for %s ...", filters)
+        return cls.query.filter(*cls.filter_conditions(filters))
+
+    @classmethod
+    def filter_conditions(cls, filters):
+        """Returns the WHERE conditions of find_by_filters() as a list"""
+        conditions = []
+        for name, value in filters.items():
+            if name not in FILTERS:
+                raise DataValidationError(f"Unknown filter: {name}")
+            column, compare = FILTERS[name]
+            conditions.append(compare(cls.__table__.c[column], value))
+        return conditions
+
+    @classmethod
+    def find_active(cls, as_of=None):
+        """Returns all Promotions running on the given day
+
+        This is the database side version of is_active(), so callers do not
+        need to load every Promotion to find the live ones.
+
+        Args:
+            as_of (date): the day to check, today when omitted
+        """
+        as_of = as_of or date.today()
+        app.logger.info("Processing active query for %s ...", as_of)
+        return cls.query.filter(cls.start_date <= as_of, cls.end_date > as_of)
+
+    @classmethod
+    def active_set(cls):
+        """Returns the Promotions running today as an ActiveSet
+
+        The rows come from the in-memory activation schedule. It is loaded
+        again when the Promotions changed and moves on by itself at
+        midnight, so a read costs one primary key lookup instead of a
+        query over the Promotion table.
+        """
+        revision = PromotionRevision.current()
+        if activations.active.version != revision:
+            app.logger.info("Loading the activation schedule at revision %s", revision)
+            table = cls.__table__
+            statement = cls.select_columns().where(table.c.end_date > activations.today())
+            activations.load(db.session.execute(statement).mappings(), revision)
+        activations.ensure_running()
+        return activations.current()
+
+    @classmethod
+    def run_transitions(cls, day):
+        """Reports the Promotions that start and stop running on day
+
+        The starts and expiries are recorded in the change feed, then the
+        hooks of transitions are called for them. Run it once a day for the
+        whole service, as `flask activations-run` does. Promotions already
+        reported for day are skipped, so running it twice is harmless.
+
+        Returns:
+            tuple: the rows that started running and the rows that stopped
+        """
+        app.logger.info("Processing the transitions of %s ...", day)
+        # Taken before the reported changes are read, so reruns take turns too
+        PromotionRevision.lock()
+        table = cls.__table__
+        statement = cls.select_columns().where(db.or_(table.c.start_date == day, table.c.end_date == day))
+        rows = db.session.execute(statement).mappings().all()
+        reported = PromotionChange.reported(day, [row["id"] for row in rows])
+        # A schedule of the day before, advanced to day, applies the same
+        # rules as the running set does at midnight
+        schedule = ActivationSchedule()
+        schedule.load([row for row in rows if row["id"] not in reported], day=day - timedelta(days=1))
+        activated, expired = schedule.advance(day)
+        for kind, changed in (("expire", expired), ("activate", activated)):
+            if changed:
+                PromotionChange.record(kind, changed)
+        db.session.commit()
+        transitions.notify(activated, expired, day)
+        return activated, expired
+
+    @classmethod
+    def overlaps(cls, start, end):
+        """Returns the condition that a Promotion overlaps the window [start, end)
+
+        A Promotion overlaps when it starts before the window ends and ends
+        after the window starts. PostgreSQL checks this with the && operator
+        on the indexed date period; other databases compare the columns.
+
+        Raises:
+            DataValidationError: when the window does not end after it starts
+        """
+        if not start < end:
+            raise DataValidationError(f"Window start {start} must be before its end {end}")
+        if db.engine.dialect.name == "postgresql":
+            return date_period(cls.start_date, cls.end_date).op("&&")(
+                db.func.daterange(start, end)
+            )
+        return db.and_(
+            cls.start_date < end, cls.end_date > start, cls.start_date < cls.end_date
+        )
+
+    @classmethod
+    def find_overlapping(cls, start, end):
+        """Returns all Promotions running at some point in the window [start, end)
+
+        Args:
+            start (date): the first day of the window
+            end (date): the day after the last day of the window
+        """
+        app.logger.info("Processing overlap query for %s to %s ...", start, end)
+        return cls.query.filter(cls.overlaps(start, end))
+
+    @classmethod
+    def search(cls, text, limit, query=None, prefix_only=False, fields=None):
+        # pylint: disable=too-many-arguments
+        """Returns the Promotions whose name or message contains text, best first
+
+        Matching ignores case. Prefix matches on the name rank first, then
+        other name matches, then prefix and other matches on the message;
+        ties are broken by id. PostgreSQL searches with LIKE on lower(name)
+        and lower(message), served by the prefix and trigram indexes. Other
+        databases use the in-memory search_index.
+
+        Args:
+            text (str): the text to look for
+            limit (int): the most rows returned
+            query (Query): an optional Promotion query whose filters to apply
+            prefix_only (bool): if only fields starting with text match
+            fields (iterable): only select these columns, see select_columns()
+        """
+        app.logger.info("Processing search for %s ...", text)
+        text = text.strip().lower()
+        if not text:
+            return []
+        if db.engine.dialect.name != "postgresql":
+            return cls._search_index(text, limit, query, prefix_only, fields)
+        pattern = escape_like(text)
+        table = cls.__table__
+        conditions = []
+        ranks = []
+        for column in SEARCHED:
+            lowered = db.func.lower(table.c[column])
+            starts = lowered.like(pattern + "%", escape="\\")
+            contains = lowered.like("%" + pattern + "%", escape="\\")
+            conditions.append(starts if prefix_only else contains)
+            ranks += [(starts, len(ranks)), (contains, len(ranks) + 1)]
+        statement = (
+            cls.select_columns(query, fields)
+            .where(db.or_(*conditions))
+            .order_by(db.case(*ranks, else_=len(ranks)), table.c.id)
+            .limit(limit)
+        )
+        return db.session.execute(statement).mappings().all()
+
+    @classmethod
+    def _search_index(cls, text, limit, query, prefix_only, fields):
+        # pylint: disable=too-many-arguments
+        """Searches with the in-memory index, rebuilt whenever Promotions change"""
+        revision = PromotionRevision.current()
+        if search_index.version != revision:
+            app.logger.info("Rebuilding the search index at revision %s", revision)
+            table = cls.__table__
+            statement = db.select(table.c.id, *[table.c[column] for column in SEARCHED])
+            rows = db.session.execute(statement).all()
+            search_index.rebuild(((row[0], tuple(row[1:])) for row in rows), revision)
+        ranked = search_index.search(text, prefix_only)
+        results = []
+        # Apply the filters of query to the matches, best first, until full
+        for first in range(0, len(ranked), max(limit, 100)):
+            chunk = ranked[first:first + max(limit, 100)]
+            statement = cls.select_columns(query, fields).where(cls.__table__.c.id.in_(chunk))
+            rows = {row["id"]: row for row in db.session.execute(statement).mappings()}
+            results += [rows[key] for key in chunk if key in rows]
+            if len(results) >= limit:
+                break
+        return results[:limit]
+
     @classmethod
     def find_or_404(cls, promo_id: int):
         """Find a Promotion by it's id
@@ -312,3 +1052,276 @@ class Promotion(db.Model):
         """
         app.logger.info("Processing lookup or 404 for id %s ...", promo_id)
         return cls.query.get_or_404(promo_id)
+
+
+def check_date_order(data):
+    """Returns an error message if a Promotion would end before it starts"""
+    if data["start_date"] > data["end_date"]:
+        return f"Start Date {data['start_date']} > End Date: {data['end_date']}"
+    return None
+
+
+# Compiled once, used by deserialize() for every create and update
+validate_promotion = compile_schema(
+    [
+        Field("name", "string", max_length=Promotion.name.type.length),
+        Field("start_date", "date"),
+        Field("end_date", "date"),
+        Field("whole_store", "bool"),
+        Field("has_been_extended", "bool"),
+        Field("original_end_date", "date"),
+        Field("message", "string", nullable=True, max_length=Promotion.message.type.length),
+        Field("promotion_changes_price", "bool"),
+    ],
+    checks=(check_date_order,),
+    error=DataValidationError,
+    label="promotion",
+)
+
+# Compiled once, used by update_end_date() and the bulk end date change
+validate_end_date = compile_schema(
+    [Field("end_date", "date")], error=DataValidationError, label="end date update"
+)
+
+
+class PromotionRevision(db.Model):
+    """
+    Table wide change counter for Promotions
+
+    A single row whose value goes up by one in every transaction that
+    creates, updates or deletes Promotions. Reading it is a primary key
+    lookup, so it is a cheap way to tell if any Promotion changed.
+    """
+
+    ROW_ID = 1
+
+    id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+    @classmethod
+    def current(cls):
+        """Returns the current revision of the Promotion table"""
+        value = db.session.execute(cls.select_current()).scalar()
+        return value or 0
+
+    @classmethod
+    def select_current(cls):
+        """Returns the SELECT that reads the current revision (None before the first)"""
+        return db.select(cls.value).where(cls.id == cls.ROW_ID)
+
+    @classmethod
+    def bump(cls):
+        """Increments the revision as part of the current transaction"""
+        result = db.session.execute(
+            db.update(cls).where(cls.id == cls.ROW_ID).values(value=cls.value + 1)
+        )
+        if result.rowcount == 0:
+            db.session.add(cls(id=cls.ROW_ID, value=1))
+
+    @classmethod
+    def lock(cls):
+        """Takes the row lock that bump() takes, without changing the revision
+
+        A transaction that adds to the change feed without changing any
+        Promotion holds it, so its seq numbers commit in order too.
+        """
+        if db.session.execute(cls.select_current().with_for_update()).first() is None:
+            cls.bump()
+
+
+class PromotionChangeHorizon(db.Model):
+    """
+    How far compaction has removed deletions from the change feed
+
+    A single row holding the highest seq of a deletion that
+    PromotionChange.compact() removed. A reader whose since is below it may
+    have missed that deletion, so it must read the whole list again.
+    """
+
+    ROW_ID = 1
+
+    id = db.Column(db.Integer, primary_key=True)
+    seq = db.Column(db.BigInteger, nullable=False, default=0)
+
+    @classmethod
+    def current(cls):
+        """Returns the seq of the newest removed deletion, 0 when there is none"""
+        return db.session.execute(cls.select_current()).scalar() or 0
+
+    @classmethod
+    def select_current(cls):
+        """Returns the SELECT that reads the horizon (None before the first compaction)"""
+        return db.select(cls.seq).where(cls.id == cls.ROW_ID)
+
+    @classmethod
+    def covers(cls, since):
+        """Returns True if a reader at since may have missed a removed deletion
+
+        since 0 reads the feed from its start: it has no Promotion that a
+        removed deletion could leave behind.
+        """
+        return 0 < since < cls.current()
+
+    @classmethod
+    def advance(cls, seq):
+        """Moves the horizon up to seq as part of the current transaction"""
+        result = db.session.execute(
+            db.update(cls).where(cls.id == cls.ROW_ID, cls.seq < seq).values(seq=seq)
+        )
+        if result.rowcount == 0 and db.session.get(cls, cls.ROW_ID) is None:
+            db.session.add(cls(id=cls.ROW_ID, seq=seq))
+
+
+class PromotionChange(db.Model):
+    """
+    Change feed of the Promotions, kept as a transactional outbox
+
+    Every transaction that creates, updates or deletes Promotions adds one
+    row per changed Promotion, so the feed holds exactly the committed
+    changes. The rows are added after PromotionRevision.bump() (or lock()),
+    whose row lock makes writers take turns, so their seq numbers commit in
+    order: a reader that has seen seq n never misses a lower seq that
+    commits later.
+    """
+
+    # Kinds of change, as the feed reports them
+    KINDS = ("create", "update", "end_date", "cancel", "delete", "activate", "expire")
+
+    seq = db.Column(db.BigInteger().with_variant(db.Integer, "sqlite"), primary_key=True)
+    promotion_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(16), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, index=True)
+    # The Promotion after the change, None when it was deleted
+    data = db.Column(db.JSON)
+
+    # AUTOINCREMENT keeps SQLite from reusing the seq of a compacted row
+    __table_args__ = (
+        db.Index("ix_promotion_change_promotion", promotion_id, seq),
+        {"sqlite_autoincrement": True},
+    )
+
+    @classmethod
+    def record(cls, kind, promotions):
+        """Adds changes of one kind to the current transaction
+
+        Args:
+            kind (string): one of KINDS
+            promotions (list): the serialized Promotions after the change
+        """
+        now = utcnow()
+        rows = [
+            {
+                "promotion_id": promotion["id"],
+                "kind": kind,
+                "changed_at": now,
+                "data": None if kind == "delete" else {
+                    name: value.isoformat() if isinstance(value, date) else value
+                    for name, value in promotion.items()
+                },
+            }
+            for promotion in promotions
+        ]
+        db.session.execute(db.insert(cls.__table__), rows)
+        db.session.info[CHANGES] = True
+
+    @classmethod
+    def reported(cls, day, promotion_ids):
+        """Returns the ids, among promotion_ids, of the Promotions whose start
+        or expiry on day is in the feed already"""
+        table = cls.__table__
+        statement = db.select(table.c.promotion_id, table.c.kind, table.c.data).where(
+            table.c.kind.in_(("activate", "expire")), table.c.promotion_id.in_(promotion_ids)
+        )
+        dates = {"activate": "start_date", "expire": "end_date"}
+        return {
+            promotion_id
+            for promotion_id, kind, data in db.session.execute(statement).all()
+            if data[dates[kind]] == day.isoformat()
+        }
+
+    @classmethod
+    def since(cls, seq, limit):
+        """Returns up to limit changes numbered above seq, oldest first"""
+        table = cls.__table__
+        statement = db.select(table).where(table.c.seq > seq).order_by(table.c.seq).limit(limit)
+        return db.session.execute(statement).mappings().all()
+
+    @classmethod
+    def latest(cls):
+        """Returns the seq of the newest change, 0 when there is none"""
+        return db.session.execute(db.select(db.func.max(cls.seq))).scalar() or 0
+
+    @classmethod
+    def wait(cls, seq, timeout, interval):
+        """Waits up to timeout seconds for a change numbered above seq
+
+        A change committed by this process wakes the waiter at once; the
+        changes of other worker processes are found by checking the
+        database every interval seconds. The connection goes back to the
+        pool while the request waits.
+
+        Returns:
+            bool: True if there is such a change
+        """
+        deadline = time.monotonic() + timeout
+        while cls.latest() <= seq:
+            db.session.close()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            change_notifier.wait(min(interval, remaining))
+        return True
+
+    @classmethod
+    def compact(cls, superseded_before, deleted_before):
+        """Removes the changes the feed no longer needs
+
+        A change older than superseded_before goes when the same Promotion
+        changed again later: a reader that catches up still ends up with the
+        latest state of every Promotion, from fewer rows. Deletions older
+        than deleted_before go as well, so the feed holds about one row per
+        Promotion plus the recent changes. The seq of the newest removed
+        deletion is kept in PromotionChangeHorizon, so a reader that fell
+        further behind than that is told to read the whole list again.
+
+        Returns:
+            int: the number of changes removed
+        """
+        table = cls.__table__
+        newer = table.alias("newer")
+        superseded = db.delete(table).where(
+            table.c.changed_at < superseded_before,
+            db.exists().where(
+                newer.c.promotion_id == table.c.promotion_id, newer.c.seq > table.c.seq
+            ),
+        )
+        old_deletion = db.and_(table.c.kind == "delete", table.c.changed_at < deleted_before)
+        horizon = db.session.execute(db.select(db.func.max(table.c.seq)).where(old_deletion)).scalar()
+        if horizon is not None:
+            PromotionChangeHorizon.advance(horizon)
+        deleted = db.delete(table).where(old_deletion)
+        removed = db.session.execute(superseded).rowcount + db.session.execute(deleted).rowcount
+        app.logger.info("Removed %d changes from the change feed", removed)
+        return removed
+
+
+# On PostgreSQL every INSERT into the change feed sends a NOTIFY on this
+# channel when its transaction commits, so listeners need not poll
+CHANGE_CHANNEL = "promotion_change"
+
+event.listen(
+    PromotionChange.__table__,
+    "after_create",
+    DDL(
+        "CREATE OR REPLACE FUNCTION notify_promotion_change() RETURNS trigger AS $$ "
+        f"BEGIN PERFORM pg_notify('{CHANGE_CHANNEL}', ''); RETURN NULL; END $$ LANGUAGE plpgsql"
+    ).execute_if(dialect="postgresql"),
+)
+event.listen(
+    PromotionChange.__table__,
+    "after_create",
+    DDL(
+        "CREATE TRIGGER promotion_change_notify AFTER INSERT ON %(table)s "
+        "FOR EACH STATEMENT EXECUTE FUNCTION notify_promotion_change()"
+    ).execute_if(dialect="postgresql"),
+)
@@ -5,18 +5,41 @@ This service allows administrators to set and update promotions on our ecommerce
 
 The service has the 6 following routes: Create, Read, Update, Delete, List and the root.
 """
+import json
+import threading
 from datetime import date
-from flask import jsonify, request, make_response, abort
-from flask_restx import fields, reqparse, inputs, Resource
+from functools import wraps
+from urllib.parse import urlencode
+from flask import jsonify, request, make_response, abort, Response, stream_with_context
+from flask_restx import fields, reqparse, inputs, marshal, Resource
+from werkzeug.http import quote_etag
 from service.common import status  # HTTP Status Codes
-from service.models import Promotion  # Import Promotion Model
-from service.helpers import convert_data, convert_data_back
+from service.common import metrics
+from service.common.pool import pool_stats
+from service.models import Promotion, PromotionRevision, DataValidationError, cache  # Import Promotion Model
+from service.models import FILTERS, REPLICA, SORTABLE, PromotionChange, PromotionChangeHorizon, db, replica_reads
+from service.models import validate_end_date
+from service.helpers import (
+    CONSISTENCY_TOKEN,
+    consistency_token,
+    convert_change,
+    convert_data_back,
+    convert_row,
+    convert_selection,
+    encode_cursor,
+    decode_cursor,
+    fields_variant,
+    parse_date,
+    parse_fields,
+    parse_window,
+)
 
 
 # Import Flask application
 from . import app, api
 
 BASE_URL = "/api/promotions"
+NDJSON = "application/x-ndjson"
 
 ######################################################################
 # GET INDEX
@@ -68,6 +91,11 @@ promotion_model = api.inherit(
     },
 )
 
+FIELDS_HELP = "Only return these fields, as a comma separated list such as id,name,end_date"
+
+promotion_args = reqparse.RequestParser()
+promotion_args.add_argument("fields", type=parse_fields, location="args", required=False, help=FIELDS_HELP)
+
 # query string arguments
 promotions_args = reqparse.RequestParser()
 promotions_args.add_argument(
@@ -82,11 +110,188 @@ promotions_args.add_argument(
 )
 promotions_args.add_argument(
     "start_date",
-    type=inputs.date,
+    type=parse_date,
     location="args",
     required=False,
     help="List Promotions by start date",
 )
+promotions_args.add_argument(
+    "end_date",
+    type=parse_date,
+    location="args",
+    required=False,
+    help="List Promotions by end date",
+)
+for suffix, description in (
+    ("_gt", "after"),
+    ("_gte", "on or after"),
+    ("_lt", "before"),
+    ("_lte", "on or before"),
+):
+    for column in ("start_date", "end_date"):
+        promotions_args.add_argument(
+            column + suffix,
+            type=parse_date,
+            location="args",
+            required=False,
+            help=f"List Promotions with a {column} {description} this date",
+        )
+for flag in ("whole_store", "has_been_extended", "promotion_changes_price"):
+    promotions_args.add_argument(
+        flag,
+        type=inputs.boolean,
+        location="args",
+        required=False,
+        help=f"List Promotions by {flag}",
+    )
+promotions_args.add_argument(
+    "q",
+    type=str,
+    location="args",
+    required=False,
+    help="Search the name and message, ignoring case; results are ranked and capped by limit, without sort, order or cursor",
+)
+promotions_args.add_argument(
+    "match",
+    type=str,
+    location="args",
+    required=False,
+    default="contains",
+    choices=("contains", "prefix"),
+    help="How q matches: anywhere in the text, or only at its start",
+)
+promotions_args.add_argument(
+    "overlaps",
+    type=parse_window,
+    location="args",
+    required=False,
+    help="List Promotions running at some point between two dates, as start,end (end excluded)",
+)
+promotions_args.add_argument(
+    "sort",
+    type=str,
+    location="args",
+    required=False,
+    default="id",
+    choices=SORTABLE,
+    help="Column to sort Promotions by",
+)
+promotions_args.add_argument(
+    "order",
+    type=str,
+    location="args",
+    required=False,
+    default="asc",
+    choices=("asc", "desc"),
+    help="Sort order",
+)
+promotions_args.add_argument(
+    "limit",
+    type=inputs.int_range(1, app.config["PAGE_SIZE_MAX"]),
+    location="args",
+    required=False,
+    help="Maximum number of Promotions per page",
+)
+promotions_args.add_argument(
+    "cursor",
+    type=str,
+    location="args",
+    required=False,
+    help="Opaque cursor from the X-Next-Cursor header of the previous page",
+)
+promotions_args.add_argument(
+    "fields", type=parse_fields, location="args", required=False, help=FIELDS_HELP
+)
+promotions_args.add_argument(
+    "count_only",
+    type=inputs.boolean,
+    location="args",
+    required=False,
+    help="Only count the matching Promotions, in the X-Total-Count header (same as HEAD)",
+)
+promotions_args.add_argument(
+    "estimate",
+    type=inputs.boolean,
+    location="args",
+    required=False,
+    help="Allow a large count to be estimated from the PostgreSQL planner statistics",
+)
+promotions_args.add_argument(
+    "stream",
+    type=inputs.boolean,
+    location="args",
+    required=False,
+    help="Stream Promotions as NDJSON (same as Accept: application/x-ndjson)",
+)
+
+selection_model = api.model(
+    "PromotionSelection",
+    {
+        "ids": fields.List(fields.Integer, description="Ids of the Promotions"),
+        "name": fields.String(description="Name of the Promotions"),
+        "ending_on": fields.Date(description="Current end date of the Promotions"),
+    },
+)
+
+bulk_end_date_model = api.inherit(
+    "PromotionSelectionEndDate",
+    selection_model,
+    {
+        "end_date": fields.Date(required=True, description="The new end date"),
+    },
+)
+
+change_model = api.model(
+    "PromotionChange",
+    {
+        "seq": fields.Integer(description="Position of the change in the feed"),
+        "id": fields.String(description="The id of the changed Promotion"),
+        "kind": fields.String(
+            enum=PromotionChange.KINDS, description="What happened to the Promotion"
+        ),
+        "changed_at": fields.DateTime(description="When the change was committed (UTC)"),
+        "promotion": fields.Nested(
+            promotion_model, allow_null=True, description="The Promotion after the change"
+        ),
+    },
+)
+
+# A waiting call holds a worker thread; past this many, calls answer at once
+change_waiters = threading.BoundedSemaphore(app.config["CHANGES_WAITERS_MAX"])
+
+changes_args = reqparse.RequestParser()
+changes_args.add_argument(
+    "since",
+    type=inputs.natural,
+    location="args",
+    required=False,
+    default=0,
+    help="Return the changes after this seq, from X-Next-Since of the previous call",
+)
+changes_args.add_argument(
+    "limit",
+    type=inputs.int_range(1, app.config["PAGE_SIZE_MAX"]),
+    location="args",
+    required=False,
+    help="Maximum number of changes returned",
+)
+changes_args.add_argument(
+    "wait",
+    type=inputs.int_range(0, app.config["CHANGES_WAIT_MAX"]),
+    location="args",
+    required=False,
+    default=0,
+    help="Seconds to wait for a change when there is none yet (long polling)",
+)
+
+active_args = reqparse.RequestParser()
+active_args.add_argument(
+    "as_of",
+    type=parse_date,
+    location="args",
+    required=False,
+    help="List Promotions running on this date (defaults to today)",
+)
 
 change_end_date_model = api.model(
     "Promotion",
@@ -116,6 +321,42 @@ change_end_date_model = api.model(
 )
 
 
+######################################################################
+#  R E A D   R E P L I C A
+######################################################################
+
+
+def replica_read(func):
+    """Runs the SELECTs of a GET handler on the read replica, if there is one
+
+    A request with an X-Consistency-Token reads from the primary until the
+    replica has caught up to that revision.
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            token = consistency_token(request.headers)
+        except DataValidationError as error:
+            abort(status.HTTP_400_BAD_REQUEST, str(error))
+        with replica_reads(token):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+@app.after_request
+def add_consistency_token(response):
+    """Gives the response to a write the revision a later read must see"""
+    if (
+        REPLICA in db.engines
+        and request.method not in ("GET", "HEAD", "OPTIONS")
+        and response.status_code < 400
+    ):
+        response.headers[CONSISTENCY_TOKEN] = str(PromotionRevision.current())
+    return response
+
+
 ######################################################################
 #  R E S T   A P I   E N D P O I N T S
 ######################################################################
@@ -138,20 +379,31 @@ class PromotionResource(Resource):
     ######################################################################
 
     @api.doc("read_promotion")
+    @api.expect(promotion_args, validate=True)
+    @api.response(200, "Success", promotion_model)
+    @api.response(304, "Promotion not modified since the If-None-Match ETag")
     @api.response(404, "Pet not found")
-    @api.marshal_with(promotion_model)
+    @replica_read
     def get(self, promotion_id):
         """Retrieve a single Promotion. This endpoint will return a Promotion based on it's id"""
         app.logger.info("Request for promotion with id: %s", promotion_id)
-        promotion = Promotion.find(promotion_id)
+        fieldset = promotion_args.parse_args()["fields"]
+        # The cached copy may predate the write a consistency token waits for
+        promotion = Promotion.find_serialized(
+            promotion_id, use_cache=CONSISTENCY_TOKEN not in request.headers
+        )
         if not promotion:
             abort(
                 status.HTTP_404_NOT_FOUND,
                 f"Promotion with id '{promotion_id}' was not found.",
             )
+        etag = f"{promotion['id']}-{promotion['version']}{fields_variant(fieldset)}"
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag)
 
-        app.logger.info("Returning promotion: %s", promotion.name)
-        return promotion.serialize(), status.HTTP_200_OK
+        app.logger.info("Returning promotion: %s", promotion["name"])
+        headers = {"ETag": quote_etag(etag)}
+        return marshal(promotion, sparse_model(fieldset)), status.HTTP_200_OK, headers
 
     ######################################################################
     #  UPDATE A PROMOTION
@@ -172,7 +424,6 @@ class PromotionResource(Resource):
                 f"Promotion with id '{promotion_id} was not found.",
             )
         json_data = request.get_json()
-        convert_data(json_data)
         promo.deserialize(json_data)
         promo.update()
         data_out = promo.serialize()
@@ -211,7 +462,6 @@ class PromotionCollection(Resource):
         app.logger.warning("Create Route Called")
         promo = Promotion()
         json_data = request.get_json()
-        print(convert_data(json_data))
         promo.deserialize(json_data)
         promo.create()
         data_out = promo.serialize()
@@ -228,30 +478,178 @@ class PromotionCollection(Resource):
     ######################################################################
     @api.doc("list_promotions")
     @api.expect(promotions_args, validate=True)
-    @api.marshal_list_with(promotion_model)
+    @api.response(200, "Success", [promotion_model])
+    @api.response(304, "No Promotion changed since the If-None-Match ETag")
+    @api.produces(["application/json", NDJSON])
+    @api.header("X-Total-Count", "Number of matching Promotions, with count_only or HEAD")
+    @replica_read
     def get(self):
         """Returns all of the Promotions"""
         app.logger.info("Request for promotion list")
+        args = promotions_args.parse_args()
+        count_only = args["count_only"] or request.method == "HEAD"
+        ndjson = not count_only and (args["stream"] or wants_ndjson())
+        fieldset = None if count_only else args["fields"]
+        variant = ("-count" if count_only else "-ndjson" if ndjson else "") + fields_variant(fieldset)
+        etag = f"r{PromotionRevision.current()}{variant}"
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag)
+        filters = {name: args[name] for name in FILTERS if args[name] is not None}
+        promotions = Promotion.find_by_filters(filters)
+        if args["overlaps"]:
+            promotions = promotions.filter(Promotion.overlaps(*args["overlaps"]))
+        if count_only:
+            return count_promotions(promotions, args, etag)
+        order = {"sort": args["sort"], "descending": args["order"] == "desc"}
+        headers = {}
+        if args["q"] is not None:
+            promotions = search_promotions(promotions, args, fieldset)
+        elif args["limit"] or args["cursor"]:
+            promotions, headers = paginate_promotions(
+                promotions, args["limit"], args["cursor"], order, fieldset
+            )
+        headers["ETag"] = quote_etag(etag)
+        if ndjson:
+            return stream_promotions(promotions, headers, order, fieldset)
+        if not isinstance(promotions, list):
+            promotions = Promotion.select_rows(promotions, fields=fieldset, **order)
+        results = [convert_row(row, fieldset) for row in promotions]
+        app.logger.info("Returning %d promotions", len(results))
+        return results, status.HTTP_200_OK, headers
+
+
+@api.route("/promotions/bulk")
+class PromotionBulk(Resource):
+    """Handles creating many promotions in one request"""
+
+    ######################################################################
+    #  CREATE MANY PROMOTIONS
+    ######################################################################
+    @api.doc("create_promotions_in_bulk")
+    @api.expect([create_model])
+    @api.response(201, "All Promotions created")
+    @api.response(400, "At least one Promotion was not valid, none were created")
+    def post(self):
+        """Create many Promotions from a JSON array or an NDJSON stream
+
+        Every item is validated first. If any item is not valid nothing is
+        created and the errors are reported per item, otherwise all of
+        them are inserted in one transaction.
+        """
+        app.logger.info("Request to create promotions in bulk")
+        items = read_bulk_items()
         promotions = []
-        message = request.args.get("message")
-        name = request.args.get("name")
-        start_date = request.args.get("start_date")
-        end_date = request.args.get("end_date")
-        if message:
-            promotions = Promotion.find_by_message(message)
-        elif name:
-            promotions = Promotion.find_by_name(name)
-        elif start_date:
-            promotions = Promotion.find_by_start_date(start_date)
-        elif end_date:
-            promotions = Promotion.find_by_end_date(end_date)
+        errors = []
+        for position, item in enumerate(items):
+            try:
+                promotions.append(Promotion().deserialize(item))
+            except DataValidationError as error:
+                errors.append({"index": position, "message": error.message})
+        if errors:
+            app.logger.warning("%d of %d promotions are not valid", len(errors), len(items))
+            return {
+                "status": status.HTTP_400_BAD_REQUEST,
+                "error": "Bad Request",
+                "message": f"{len(errors)} of {len(items)} promotions are not valid",
+                "errors": errors,
+            }, status.HTTP_400_BAD_REQUEST
+        ids = Promotion.create_many(promotions, app.config["BULK_INSERT_BATCH"])
+        app.logger.info("Created %d promotions in bulk", len(ids))
+        results = [
+            {"index": position, "id": promotion_id, "resource_url": f"{BASE_URL}/{promotion_id}"}
+            for position, promotion_id in enumerate(ids)
+        ]
+        return {"created": len(ids), "results": results}, status.HTTP_201_CREATED
+
+
+@api.route("/promotions/active")
+class ActivePromotions(Resource):
+    """Handles the collection of promotions that are currently running"""
+
+    ######################################################################
+    # LIST ACTIVE PROMOTIONS
+    ######################################################################
+    @api.doc("list_active_promotions")
+    @api.expect(active_args, validate=True)
+    @api.response(200, "Success", [promotion_model])
+    def get(self):
+        """Returns the Promotions running on a date"""
+        args = active_args.parse_args()
+        app.logger.info("Request for promotions active on %s", args["as_of"])
+        if args["as_of"] in (None, date.today()):
+            promotions = Promotion.active_set().rows
         else:
-            promotions = Promotion.all()
-        results = [promotion.serialize() for promotion in promotions]
+            promotions = Promotion.select_rows(Promotion.find_active(args["as_of"]))
+        results = [convert_row(row) for row in promotions]
         app.logger.info("Returning %d promotions", len(results))
         return results, status.HTTP_200_OK
 
 
+@api.route("/promotions/changes")
+class PromotionChanges(Resource):
+    """Handles the feed of changes to the promotions"""
+
+    ######################################################################
+    # LIST CHANGES
+    ######################################################################
+    @api.doc("list_promotion_changes")
+    @api.expect(changes_args, validate=True)
+    @api.response(200, "Success", [change_model])
+    @api.response(410, "Deletions after since were compacted away; read the whole list again")
+    def get(self):
+        """Returns the changes made to the Promotions after a point in the feed
+
+        Pass the X-Next-Since header of each answer as since on the next call
+        to receive every create, update, end date change, cancel and delete
+        once, in commit order. While CHANGES_WAITERS_MAX calls of this worker
+        are already waiting, a call with wait answers at once instead. A since
+        older than the newest compacted deletion answers 410 Gone; its
+        X-Next-Since is where to follow the feed from after reading the list.
+        """
+        args = changes_args.parse_args()
+        since = args["since"]
+        if PromotionChangeHorizon.covers(since):
+            message = f"Changes after {since} were compacted away; read the whole list again."
+            app.logger.info(message)
+            headers = {"X-Next-Since": str(PromotionChange.latest())}
+            body = {"status": status.HTTP_410_GONE, "error": "Gone", "message": message}
+            return body, status.HTTP_410_GONE, headers
+        limit = args["limit"] or app.config["PAGE_SIZE_DEFAULT"]
+        changes = PromotionChange.since(since, limit)
+        if not changes and args["wait"] and change_waiters.acquire(blocking=False):  # pylint: disable=consider-using-with
+            try:
+                if PromotionChange.wait(since, args["wait"], app.config["CHANGES_POLL_INTERVAL"]):
+                    changes = PromotionChange.since(since, limit)
+            finally:
+                change_waiters.release()
+        headers = {"X-Next-Since": str(changes[-1]["seq"] if changes else since)}
+        return [convert_change(row) for row in changes], status.HTTP_200_OK, headers
+
+
+@api.route("/promotions/stream")
+class PromotionStream(Resource):
+    """Handles the Server-Sent Events stream of the change feed"""
+
+    ######################################################################
+    # STREAM CHANGES
+    ######################################################################
+    @api.doc("stream_promotion_changes")
+    @api.produces(["text/event-stream"])
+    @api.response(200, "One event per change: id is the seq, event the kind, data the change")
+    @api.response(501, "The stream is only served by the ASGI app")
+    def get(self):
+        """Streams the changes to the Promotions as Server-Sent Events
+
+        Send Last-Event-ID to resume after an event. The stream is served by
+        the ASGI app (uvicorn service.asgi:app), where an open stream does
+        not hold a worker thread; this WSGI app does not serve it.
+        """
+        abort(
+            status.HTTP_501_NOT_IMPLEMENTED,
+            "The change stream is served by the ASGI app; poll /api/promotions/changes instead.",
+        )
+
+
 @api.route("/promotions/change_end_date/<int:promotion_id>")
 class ChangeEndDate(Resource):
     """End date actions on a promotion"""
@@ -274,7 +672,6 @@ class ChangeEndDate(Resource):
                 f"Promotion with id {promotion_id} was not found.",
             )
         json_data = request.get_json()
-        convert_data(json_data)
         promo.update_end_date(json_data)
         promo.update()
         data_out = promo.serialize()
@@ -283,6 +680,51 @@ class ChangeEndDate(Resource):
         return data_out, status.HTTP_200_OK
 
 
+@api.route("/promotions/change_end_date")
+class ChangeEndDates(Resource):
+    """End date actions on many promotions at once"""
+
+    ######################################################################
+    #  CHANGE THE END DATE OF MANY PROMOTIONS
+    ######################################################################
+    @api.doc("change_end_dates")
+    @api.response(400, "The selection or end date was not valid")
+    @api.expect(bulk_end_date_model)
+    @api.marshal_list_with(promotion_model)
+    def put(self):
+        """Change the end date of every selected Promotion
+
+        Promotions that would start after the new end date are left unchanged.
+        """
+        json_data = request.get_json()
+        selection = convert_selection(json_data)
+        end_date = validate_end_date(json_data)["end_date"]
+        app.logger.info("Request to change end dates to %s", end_date)
+        promotions = Promotion.change_end_dates(end_date, **selection)
+        app.logger.info("%d promotions end date updated.", len(promotions))
+        return promotions, status.HTTP_200_OK
+
+
+@api.route("/promotions/cancel")
+class CancelMany(Resource):
+    """Handle cancelling many promotions at once."""
+
+    ######################################################################
+    #  CANCEL MANY PROMOTIONS
+    ######################################################################
+    @api.doc("cancel_promotions")
+    @api.response(400, "The selection was not valid")
+    @api.expect(selection_model)
+    @api.marshal_list_with(promotion_model)
+    def put(self):
+        """Cancel every selected Promotion that has already started"""
+        selection = convert_selection(request.get_json())
+        app.logger.info("Request to cancel promotions")
+        promotions = Promotion.cancel_many(**selection)
+        app.logger.info("%d promotions cancelled.", len(promotions))
+        return promotions, status.HTTP_200_OK
+
+
 @api.route("/promotions/cancel/<int:promotion_id>")
 class Cancel(Resource):
     """Handle all cancel interactions with a promotion."""
@@ -315,6 +757,111 @@ class Cancel(Resource):
         return data_out, status.HTTP_200_OK
 
 
+######################################################################
+#  U T I L I T Y   F U N C T I O N S
+######################################################################
+
+
+def paginate_promotions(query, limit, cursor, order, fieldset=None):
+    """Returns one page of a promotion query and the headers linking to the next one"""
+    limit = limit or app.config["PAGE_SIZE_DEFAULT"]
+    after = decode_cursor(cursor) if cursor else None
+    page, next_key = Promotion.paginate(query, limit, after, fields=fieldset, **order)
+    headers = {}
+    if next_key is not None:
+        next_cursor = encode_cursor(next_key)
+        params = request.args.to_dict()
+        params.update(limit=limit, cursor=next_cursor)
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = f'<{request.base_url}?{urlencode(params)}>; rel="next"'
+    return page, headers
+
+
+def search_promotions(query, args, fieldset=None):
+    """Returns the best matches of a q search, which are ranked and not paged"""
+    ignored = sorted({"sort", "order", "cursor"}.intersection(request.args))
+    if ignored:
+        abort(
+            status.HTTP_400_BAD_REQUEST,
+            f"A search is ranked by relevance and capped by limit; it takes no {', '.join(ignored)}",
+        )
+    limit = args["limit"] or app.config["SEARCH_LIMIT_DEFAULT"]
+    return Promotion.search(args["q"], limit, query, prefix_only=args["match"] == "prefix", fields=fieldset)
+
+
+def count_promotions(query, args, etag):
+    """Returns the response to a count_only or HEAD request for the promotion list"""
+    if args["q"] is not None:
+        abort(status.HTTP_400_BAD_REQUEST, "A search can not be counted, only listed")
+    estimate_min = app.config["COUNT_ESTIMATE_MIN"] if args["estimate"] else None
+    total, estimated = Promotion.count(query, estimate_min)
+    app.logger.info("Counted %d promotions%s", total, " (estimated)" if estimated else "")
+    headers = {"X-Total-Count": str(total), "ETag": quote_etag(etag)}
+    if estimated:
+        headers["X-Total-Count-Estimated"] = "true"
+    return {"count": total, "estimated": estimated}, status.HTTP_200_OK, headers
+
+
+def read_bulk_items():
+    """Reads the items of a bulk request from a JSON array or an NDJSON body"""
+    if request.mimetype == NDJSON:
+        items = []
+        for number, line in enumerate(request.stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError as error:
+                raise DataValidationError(f"Invalid JSON on line {number}") from error
+    else:
+        items = request.get_json()
+        if not isinstance(items, list):
+            raise DataValidationError("Bulk create expects a JSON array of promotions")
+    if not items or len(items) > app.config["BULK_MAX_ITEMS"]:
+        raise DataValidationError(
+            f"Bulk create expects 1 to {app.config['BULK_MAX_ITEMS']} promotions"
+        )
+    return items
+
+
+def not_modified(etag):
+    """Returns an empty 304 Not Modified response carrying the current ETag"""
+    app.logger.info("Not modified since ETag %s", etag)
+    return Response(
+        status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": quote_etag(etag)}
+    )
+
+
+def sparse_model(fieldset):
+    """Returns the part of promotion_model that a ?fields= list asks for"""
+    if fieldset is None:
+        return promotion_model
+    return {name: promotion_model.resolved[name] for name in fieldset}
+
+
+def wants_ndjson():
+    """Checks if the client prefers newline delimited JSON over a JSON list"""
+    best = request.accept_mimetypes.best_match(["application/json", NDJSON])
+    return best == NDJSON
+
+
+def stream_promotions(promotions, headers, order, fieldset=None):
+    """Streams promotion rows as newline delimited JSON, one Promotion per line"""
+    if not isinstance(promotions, list):
+        promotions = Promotion.stream(promotions, app.config["STREAM_BATCH_SIZE"], fields=fieldset, **order)
+
+    def generate():
+        for row in promotions:
+            yield json.dumps(convert_row(row, fieldset)) + "\n"
+
+    return Response(
+        stream_with_context(generate()),
+        status=status.HTTP_200_OK,
+        mimetype=NDJSON,
+        headers=headers,
+    )
+
+
 ######################################################################
 #  HEALTH POINT
 ######################################################################
@@ -324,3 +871,28 @@ class Cancel(Resource):
 def health():
     """Let them know our heart is still beating"""
     return make_response(jsonify(status=200, message="OK"), status.HTTP_200_OK)
+
+
+######################################################################
+#  RUNTIME STATISTICS
+######################################################################
+
+
+@app.route("/stats")
+def stats():
+    """Returns the runtime counters of this worker process"""
+    return make_response(
+        jsonify(
+            cache=cache.stats(),
+            pool=pool_stats(db.engine.pool),
+            replica_pool=pool_stats(db.engines[REPLICA].pool) if REPLICA in db.engines else None,
+        ),
+        status.HTTP_200_OK,
+    )
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Returns the metrics of every worker process in the Prometheus text format"""
+    body, content_type = metrics.render()
+    return Response(body, status=status.HTTP_200_OK, content_type=content_type)
@@ -0,0 +1,151 @@
+"""
+Test cases for the ASGI entry point
+
+Test cases can be run with:
+    green
+    -vvv --run-coverage
+"""
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from unittest import TestCase
+from unittest.mock import patch
+from starlette.testclient import TestClient
+from service import app as flask_app
+from service.asgi import app, async_engine_options
+from service.models import Promotion, PromotionChange, PromotionChangeHorizon, db, cache
+from tests.factories import PromoFactory
+
+BASE_URL = "/api/promotions"
+
+
+class TestASGI(TestCase):
+    """Tests that the async routes answer like the Flask routes"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = TestClient(app)
+        cls.client.__enter__()  # pylint: disable=unnecessary-dunder-call
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.__exit__(None, None, None)
+
+    def setUp(self):
+        self.flask = flask_app.test_client()
+        db.session.query(Promotion).delete()
+        db.session.commit()
+        cache.clear()
+
+    def _create_promotions(self, count):
+        """Creates promotions through the ASGI app and returns their ids"""
+        ids = []
+        for number in range(count):
+            promotion = PromoFactory(name=f"Sale {number % 2}")
+            data = {k: str(v) for k, v in promotion.serialize().items()}
+            resp = self.client.post(BASE_URL, json=data)
+            self.assertEqual(resp.status_code, 201)
+            ids.append(resp.json()["id"])
+        return ids
+
+    def assertSameResponse(self, url, headers=None):  # pylint: disable=invalid-name
+        """Checks that the async route and Flask answer url alike"""
+        fast = self.client.get(url, headers=headers)
+        slow = self.flask.get(url, headers=headers)
+        self.assertEqual(fast.status_code, slow.status_code)
+        for header in ("ETag", "X-Next-Cursor"):
+            self.assertEqual(fast.headers.get(header), slow.headers.get(header))
+        if slow.status_code == 200:
+            self.assertEqual(fast.json(), slow.get_json())
+        return fast
+
+    def test_read_promotion(self):
+        """It should read a Promotion like the Flask route"""
+        promotion_id = self._create_promotions(1)[0]
+        resp = self.assertSameResponse(f"{BASE_URL}/{promotion_id}")
+        self.assertNotIn("X-Query-Count", resp.headers)
+        self.assertSameResponse(f"{BASE_URL}/{promotion_id}", {"If-None-Match": resp.headers["ETag"]})
+        self.assertSameResponse(f"{BASE_URL}/{promotion_id}?fields=name,id")
+        self.assertEqual(self.client.get(f"{BASE_URL}/{promotion_id}?fields=colour").status_code, 400)
+        resp = self.assertSameResponse(f"{BASE_URL}/0")
+        self.assertIn("was not found", resp.json()["message"])
+
+    def test_list_promotions(self):
+        """It should list, filter, sort and page Promotions like the Flask route"""
+        self._create_promotions(5)
+        self.assertSameResponse(BASE_URL)
+        self.assertSameResponse(f"{BASE_URL}?name=Sale%201&sort=start_date&order=desc")
+        resp = self.assertSameResponse(f"{BASE_URL}?limit=2&sort=name")
+        self.assertSameResponse(f"{BASE_URL}?limit=2&sort=name&cursor={resp.headers['X-Next-Cursor']}")
+        self.assertSameResponse(BASE_URL, {"If-None-Match": resp.headers["ETag"]})
+        resp = self.assertSameResponse(f"{BASE_URL}?fields=end_date&sort=name&limit=3")
+        self.assertNotIn("X-Query-Count", resp.headers)
+        self.assertSameResponse(f"{BASE_URL}?fields=end_date&sort=name&limit=3&cursor={resp.headers['X-Next-Cursor']}")
+        self.assertSameResponse(f"{BASE_URL}/active")
+
+    def test_fallback_to_flask(self):
+        """It should pass writes and unsupported reads to Flask"""
+        promotion_id = self._create_promotions(1)[0]
+        self.assertEqual(self.client.get(f"{BASE_URL}?limit=0").status_code, 400)
+        self.assertEqual(self.client.get(f"{BASE_URL}?sort=message").status_code, 400)
+        resp = self.client.get(f"{BASE_URL}?q=sale")
+        self.assertIn("X-Query-Count", resp.headers)
+        self.assertEqual(self.client.get(f"{BASE_URL}/{promotion_id}/nothing").status_code, 404)
+        self.assertEqual(self.client.get("/health").json()["message"], "OK")
+        self.assertEqual(self.client.delete(f"{BASE_URL}/{promotion_id}").status_code, 204)
+        self.assertEqual(self.client.get(f"{BASE_URL}/{promotion_id}").status_code, 404)
+
+    def test_stream_changes(self):
+        """It should replay changes after Last-Event-ID and push new ones"""
+        self._create_promotions(2)
+        first, second = self.flask.get(f"{BASE_URL}/changes?limit=1000").get_json()[-2:]
+
+        def create_later():
+            time.sleep(0.3)
+            self._create_promotions(1)
+
+        writer = threading.Thread(target=create_later)
+        writer.start()
+        started = time.monotonic()
+        with patch.dict(flask_app.config, {"SSE_MAX_SECONDS": 1.5}):
+            resp = self.client.get(f"{BASE_URL}/stream", headers={"Last-Event-ID": str(first["seq"])})
+        writer.join()
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(resp.headers["content-type"], "text/event-stream; charset=utf-8")
+        events = [block for block in resp.text.split("\n\n") if block.startswith("id:")]
+        self.assertEqual(len(events), 2)
+        self.assertTrue(events[0].startswith(f"id: {second['seq']}\nevent: create\ndata: "))
+        self.assertEqual(json.loads(events[0].split("data: ")[1]), second)
+        self.assertIn("event: create", events[1])
+
+    def test_stream_bad_request(self):
+        """It should reject a bad Last-Event-ID, and leave the stream to the ASGI app"""
+        resp = self.client.get(f"{BASE_URL}/stream", headers={"Last-Event-ID": "latest"})
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(self.flask.get(f"{BASE_URL}/stream").status_code, 501)
+
+    def test_stream_gone(self):
+        """It should answer 410 Gone to a Last-Event-ID older than a compacted deletion"""
+        self._create_promotions(2)
+        first, second = self.flask.get(f"{BASE_URL}/changes?limit=1000").get_json()[-2:]
+        self.flask.delete(f"{BASE_URL}/{second['id']}")
+        PromotionChange.compact(datetime.utcnow() + timedelta(1), datetime.utcnow() + timedelta(1))
+        db.session.commit()
+        resp = self.client.get(f"{BASE_URL}/stream", headers={"Last-Event-ID": str(first["seq"])})
+        self.assertEqual(resp.status_code, 410)
+        self.assertEqual(resp.headers["X-Next-Since"], str(PromotionChange.latest()))
+        with patch.dict(flask_app.config, {"SSE_MAX_SECONDS": 0.1}):
+            resp = self.client.get(
+                f"{BASE_URL}/stream", headers={"Last-Event-ID": str(PromotionChangeHorizon.current())}
+            )
+        self.assertEqual(resp.status_code, 200)
+
+    def test_async_engine_options(self):
+        """It should only pass pool sizes to PostgreSQL async engines"""
+        options = {"pool_size": 2, "pool_pre_ping": True, "poolclass": object}
+        self.assertEqual(async_engine_options("sqlite:////tmp/x.db", options), {"pool_pre_ping": True})
+        self.assertEqual(
+            async_engine_options("postgresql://localhost/db", options),
+            {"pool_size": 2, "pool_pre_ping": True},
+        )
@@ -0,0 +1,71 @@
+"""
+Test cases for the LRU cache
+
+Test cases can be run with:
+    green
+    -vvv --run-coverage
+"""
+from unittest import TestCase
+from service.common.cache import LRUCache, MISSING
+
+
+class FakeClock:  # pylint: disable=too-few-public-methods
+    """A clock that only moves when told to"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLRUCache(TestCase):
+    """Test Cases for LRUCache"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = LRUCache(maxsize=2, ttl=10, negative_ttl=1, clock=self.clock)
+
+    def test_get_and_set(self):
+        """It should return cached values and count hits and misses"""
+        self.assertIs(self.cache.get(1), MISSING)
+        self.cache.set(1, {"id": 1})
+        self.assertEqual(self.cache.get(1), {"id": 1})
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_evicts_least_recently_used(self):
+        """It should evict the least recently used entry when full"""
+        self.cache.set(1, "one")
+        self.cache.set(2, "two")
+        self.cache.get(1)
+        self.cache.set(3, "three")
+        self.assertIs(self.cache.get(2), MISSING)
+        self.assertEqual(self.cache.get(1), "one")
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+        self.assertEqual(self.cache.stats()["size"], 2)
+
+    def test_expires_entries(self):
+        """It should expire values after the ttl and None after the negative ttl"""
+        self.cache.set(1, "one")
+        self.cache.set(2, None)
+        self.clock.now = 5
+        self.assertEqual(self.cache.get(1), "one")
+        self.assertIs(self.cache.get(2), MISSING)
+        self.clock.now = 10
+        self.assertIs(self.cache.get(1), MISSING)
+
+    def test_invalidate_and_clear(self):
+        """It should forget invalidated and cleared entries"""
+        self.cache.set(1, "one")
+        self.cache.set(2, "two")
+        self.cache.invalidate(1)
+        self.assertIs(self.cache.get(1), MISSING)
+        self.cache.clear()
+        self.assertIs(self.cache.get(2), MISSING)
+
+    def test_disabled(self):
+        """It should cache nothing when the size is zero"""
+        self.cache.configure(0, 10, 1)
+        self.cache.set(1, "one")
+        self.assertIs(self.cache.get(1), MISSING)
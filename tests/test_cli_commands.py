@@ -2,10 +2,17 @@
 CLI Command Extensions for Flask
 """
 import os
+import subprocess
+import sys
+import tempfile
+from datetime import date, timedelta
 from unittest import TestCase
 from unittest.mock import patch, MagicMock
 from click.testing import CliRunner
-from service.common.cli_commands import db_create
+from sqlalchemy import inspect, text
+from service.common.cli_commands import activations_run, changes_compact, db_create, db_index, db_init
+from service import app
+from service.models import db
 
 
 class TestFlaskCLI(TestCase):
@@ -21,3 +28,91 @@ class TestFlaskCLI(TestCase):
         with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
             result = self.runner.invoke(db_create)
             self.assertEqual(result.exit_code, 0)
+
+    def test_db_init(self):
+        """It should create missing tables and keep existing ones with db-init"""
+        with db.engine.begin() as conn:
+            conn.execute(text("DROP TABLE IF EXISTS promotion_revision"))
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(db_init)
+            self.assertEqual(result.exit_code, 0)
+        names = inspect(db.engine).get_table_names()
+        self.assertIn("promotion_revision", names)
+        self.assertIn("promotion", names)
+
+    def test_start_without_create_all(self):
+        """It should leave the schema to db-init when DB_CREATE_ALL is off"""
+        script = "from service.models import db; print(sorted(db.inspect(db.engine).get_table_names()))"
+        with tempfile.TemporaryDirectory() as folder:
+            environ = dict(os.environ, DATABASE_URI=f"sqlite:///{folder}/start.db", DB_CREATE_ALL="false")
+            result = subprocess.run(
+                [sys.executable, "-c", script], env=environ, capture_output=True, text=True, check=True
+            )
+            self.assertEqual(result.stdout.strip(), "[]")
+            environ["FLASK_APP"] = "service:app"
+            subprocess.run(["flask", "db-init"], env=environ, capture_output=True, check=True)
+            result = subprocess.run(
+                [sys.executable, "-c", script], env=environ, capture_output=True, text=True, check=True
+            )
+            self.assertEqual(
+                result.stdout.strip(),
+                "['promotion', 'promotion_change', 'promotion_change_horizon', 'promotion_revision']",
+            )
+
+    def test_db_index(self):
+        """It should build missing indexes with the db-index command"""
+        with db.engine.begin() as conn:
+            conn.execute(text("DROP INDEX IF EXISTS ix_promotion_message"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_promotion_name_lower ON promotion (lower(name))"))
+        # db-init leaves the indexes of existing tables to db-index, and says so
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            with self.assertLogs(app.logger, "WARNING") as logs:
+                result = self.runner.invoke(db_init)
+            self.assertEqual(result.exit_code, 0)
+        self.assertIn("Missing indexes ix_promotion_message;", logs.output[0])
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(db_index)
+            self.assertEqual(result.exit_code, 0)
+        names = {index["name"] for index in inspect(db.engine).get_indexes("promotion")}
+        self.assertIn("ix_promotion_message", names)
+        self.assertIn("ix_promotion_active", names)
+        self.assertNotIn("ix_promotion_name_lower", names)
+
+    def test_db_init_adds_columns(self):
+        """It should add a column that an existing table lacks with db-init"""
+        db.session.remove()
+        with db.engine.begin() as conn:
+            conn.execute(text("DELETE FROM promotion"))
+            conn.execute(text("ALTER TABLE promotion DROP COLUMN version"))
+            conn.execute(text(
+                "INSERT INTO promotion (name, start_date, end_date, whole_store, has_been_extended,"
+                " original_end_date, message, promotion_changes_price)"
+                " VALUES ('Old', '2023-06-01', '2023-07-01', false, false, '2023-07-01', 'Old', false)"
+            ))
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(db_init)
+            self.assertEqual(result.exit_code, 0)
+        with db.engine.begin() as conn:
+            self.assertEqual(conn.execute(text("SELECT version FROM promotion")).scalars().all(), [1])
+            conn.execute(text("DELETE FROM promotion"))
+
+    @patch('service.common.cli_commands.PromotionChange')
+    def test_changes_compact(self, change_mock):
+        """It should compact the change feed with the configured ages"""
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(changes_compact)
+            self.assertEqual(result.exit_code, 0)
+        superseded_before, deleted_before = change_mock.compact.call_args.args
+        self.assertEqual(superseded_before - deleted_before, timedelta(days=6))
+
+    @patch('service.common.cli_commands.Promotion')
+    def test_activations_run(self, promotion_mock):
+        """It should report the transitions of today, or of the given day"""
+        promotion_mock.run_transitions.return_value = ([], [])
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(activations_run)
+            self.assertEqual(result.exit_code, 0)
+            promotion_mock.run_transitions.assert_called_with(date.today())
+            result = self.runner.invoke(activations_run, ["--day", "2024-03-01"])
+            self.assertEqual(result.exit_code, 0)
+            promotion_mock.run_transitions.assert_called_with(date(2024, 3, 1))
@@ -0,0 +1,99 @@
+"""
+Test cases for the gunicorn settings in gunicorn.conf.py
+
+Test cases can be run with:
+    green
+    -vvv --run-coverage
+"""
+import importlib.util
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+CONF_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "gunicorn.conf.py")
+MIB = 2**20
+
+
+def load_conf(**environ):
+    """Executes gunicorn.conf.py with extra environment variables and returns it"""
+    spec = importlib.util.spec_from_file_location("gunicorn_conf", CONF_PATH)
+    conf = importlib.util.module_from_spec(spec)
+    with tempfile.TemporaryDirectory() as metrics_dir:
+        environ.setdefault("PROMETHEUS_MULTIPROC_DIR", metrics_dir)
+        with patch.dict(os.environ, environ):
+            spec.loader.exec_module(conf)
+    return conf
+
+
+def write_files(root, files):
+    """Creates cgroup files under root from a {relative path: content} dict"""
+    for path, content in files.items():
+        path = os.path.join(root, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(content + "\n")
+
+
+class TestGunicornConf(TestCase):
+    """Test Cases for sizing gunicorn from the cgroup limits"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.conf = load_conf()
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(self.root.cleanup)
+
+    def test_cgroup_v2_limits(self):
+        """It should read the CPU quota and memory limit of cgroup v2"""
+        write_files(self.root.name, {"cpu.max": "50000 100000", "memory.max": str(128 * MIB)})
+        self.assertEqual(self.conf.cgroup_cpus(self.root.name), 0.5)
+        self.assertEqual(self.conf.cgroup_memory(self.root.name), 128 * MIB)
+        write_files(self.root.name, {"cpu.max": "max 100000", "memory.max": "max"})
+        self.assertIsNone(self.conf.cgroup_cpus(self.root.name))
+        self.assertIsNone(self.conf.cgroup_memory(self.root.name))
+
+    def test_cgroup_v1_limits(self):
+        """It should read the CPU quota and memory limit of cgroup v1"""
+        write_files(
+            self.root.name,
+            {
+                "cpu/cpu.cfs_quota_us": "150000",
+                "cpu/cpu.cfs_period_us": "100000",
+                "memory/memory.limit_in_bytes": str(512 * MIB),
+            },
+        )
+        self.assertEqual(self.conf.cgroup_cpus(self.root.name), 1.5)
+        self.assertEqual(self.conf.cgroup_memory(self.root.name), 512 * MIB)
+        write_files(
+            self.root.name,
+            {"cpu/cpu.cfs_quota_us": "-1", "memory/memory.limit_in_bytes": str(2**63 - 4096)},
+        )
+        self.assertIsNone(self.conf.cgroup_cpus(self.root.name))
+        self.assertIsNone(self.conf.cgroup_memory(self.root.name))
+
+    def test_no_cgroup(self):
+        """It should report no limits when there are no cgroup files"""
+        self.assertIsNone(self.conf.cgroup_cpus(self.root.name))
+        self.assertIsNone(self.conf.cgroup_memory(self.root.name))
+
+    def test_worker_and_thread_count(self):
+        """It should size workers by CPU, cap them by memory and add threads"""
+        self.assertEqual(self.conf.worker_count(0.5, 128 * MIB), 2)
+        self.assertEqual(self.conf.thread_count(0.5, 2), 2)
+        self.assertEqual(self.conf.worker_count(4, None), 9)
+        self.assertEqual(self.conf.worker_count(4, 256 * MIB), 5)
+        self.assertEqual(self.conf.worker_count(1, 64 * MIB), 1)
+        self.assertEqual(self.conf.thread_count(0.5, 1), 4)
+
+    def test_settings(self):
+        """It should export the worker count and honor the overrides"""
+        conf = load_conf(WEB_CONCURRENCY="3", GUNICORN_THREADS="1")
+        self.assertEqual(conf.workers, 3)
+        self.assertEqual(conf.worker_class, "sync")
+        self.assertTrue(conf.preload_app)
+        self.assertGreater(conf.max_requests_jitter, 0)
+        conf = load_conf(WEB_CONCURRENCY="2", GUNICORN_THREADS="4")
+        self.assertEqual(conf.worker_class, "gthread")
@@ -0,0 +1,100 @@
+"""
+Test cases for the change feed hub
+
+Test cases can be run with:
+    green
+    -vvv --run-coverage
+"""
+import asyncio
+from unittest import TestCase
+from service.common.hub import Hub
+
+
+class FakeFeed:
+    """A feed of numbered rows that counts how often it is read"""
+
+    def __init__(self, rows=0):
+        self.rows = [{"seq": seq} for seq in range(1, rows + 1)]
+        self.reads = 0
+
+    async def fetch(self, seq):
+        """Returns up to two rows numbered above seq"""
+        self.reads += 1
+        return [row for row in self.rows if row["seq"] > seq][:2]
+
+    async def latest(self):
+        """Returns the seq of the newest row"""
+        return len(self.rows)
+
+    def add(self, count):
+        """Appends count rows"""
+        self.rows.extend({"seq": len(self.rows) + 1} for _ in range(count))
+
+
+class TestHub(TestCase):
+    """Test Cases for Hub"""
+
+    def test_fan_out(self):
+        """It should read each new row once and give it to every subscriber"""
+
+        async def scenario():
+            feed = FakeFeed(3)
+            hub = Hub(feed.fetch, feed.latest, interval=60)
+            first, start = await hub.subscribe()
+            second, _ = await hub.subscribe()
+            self.assertEqual(start, 3)
+            await asyncio.sleep(0)
+            reads = feed.reads
+            feed.add(3)
+            hub.wake()
+            got = [(await first.queue.get())["seq"] for _ in range(3)]
+            self.assertEqual(got, [4, 5, 6])
+            self.assertEqual(second.queue.qsize(), 3)
+            # two pages of rows, and the empty read that ends them
+            self.assertEqual(feed.reads - reads, 3)
+            hub.unsubscribe(second)
+            self.assertEqual(hub.subscribers, {first})
+            await hub.stop()
+
+        asyncio.run(scenario())
+
+    def test_drop_slow_subscriber(self):
+        """It should drop a subscriber whose queue is full"""
+
+        async def scenario():
+            feed = FakeFeed()
+            hub = Hub(feed.fetch, feed.latest, interval=60, queue_size=2)
+            subscription, _ = await hub.subscribe()
+            feed.add(3)
+            with self.assertLogs("service.common.hub", "WARNING"):
+                hub.wake()
+                await asyncio.sleep(0.05)
+            self.assertTrue(subscription.dropped)
+            self.assertEqual(hub.subscribers, set())
+            await hub.stop()
+
+        asyncio.run(scenario())
+
+    def test_listen_and_wake_from_thread(self):
+        """It should read the feed when its listener or another thread wakes it"""
+
+        async def scenario():
+            feed = FakeFeed()
+            woken = asyncio.Event()
+
+            async def listen(wake):
+                await woken.wait()
+                wake()
+                await asyncio.Future()
+
+            hub = Hub(feed.fetch, feed.latest, interval=60, listen=listen)
+            subscription, _ = await hub.subscribe()
+            feed.add(1)
+            woken.set()
+            self.assertEqual((await asyncio.wait_for(subscription.queue.get(), 5))["seq"], 1)
+            feed.add(1)
+            await asyncio.get_running_loop().run_in_executor(None, hub.wake_threadsafe)
+            self.assertEqual((await asyncio.wait_for(subscription.queue.get(), 5))["seq"], 2)
+            await hub.stop()
+
+        asyncio.run(scenario())
@@ -0,0 +1,34 @@
+"""
+Test cases for the Prometheus metrics
+
+Test cases can be run with:
+    green
+    -vvv --run-coverage
+"""
+from unittest import TestCase
+from prometheus_client import Counter, CollectorRegistry
+from service.common.metrics import CounterSync, operation_name
+
+
+class TestMetrics(TestCase):
+    """Test Cases for the metrics helpers"""
+
+    def test_operation_name(self):
+        """It should label statements by their SQL verb"""
+        self.assertEqual(operation_name("SELECT promotion.id FROM promotion"), "SELECT")
+        self.assertEqual(operation_name("\n  update promotion SET name=?"), "UPDATE")
+        self.assertEqual(operation_name("PRAGMA main.table_info(promotion)"), "OTHER")
+        self.assertEqual(operation_name("  "), "OTHER")
+
+    def test_counter_sync(self):
+        """It should add only the growth of a running total to a counter"""
+        registry = CollectorRegistry()
+        counter = Counter("events", "Events", registry=registry)
+        sync = CounterSync()
+        sync(counter, "events", 3)
+        sync(counter, "events", 5)
+        self.assertEqual(registry.get_sample_value("events_total"), 5)
+        # a total that starts again from zero is followed from there
+        sync(counter, "events", 1)
+        sync(counter, "events", 2)
+        self.assertEqual(registry.get_sample_value("events_total"), 6)
@@ -9,11 +9,13 @@ Test cases can be run with:
 import os
 import logging
 import unittest
-from datetime import date, timedelta
+from unittest.mock import MagicMock, patch
+from datetime import date, datetime, timedelta
 
 from werkzeug.exceptions import NotFound
 
-from service.models import Promotion, DataValidationError, db
+from service.models import Promotion, PromotionChange, PromotionChangeHorizon, PromotionRevision, DataValidationError
+from service.models import db, cache, activations
 from service import app
 from tests.factories import PromoFactory
 
@@ -49,6 +51,7 @@ class TestPromotionModel(unittest.TestCase):
         """This runs before each test"""
         db.session.query(Promotion).delete()  # clean up the last tests
         db.session.commit()
+        cache.clear()  # the bulk delete above bypasses cache invalidation
 
     def tearDown(self):
         """This runs after each test"""
@@ -146,6 +149,41 @@ class TestPromotionModel(unittest.TestCase):
         self.assertEqual(found_promo.name, promo.name)
         self.assertEqual(found_promo.start_date, promo.start_date)
 
+    def test_create_many_promotions(self):
+        """It should Create many Promotions in one transaction"""
+        revision = PromotionRevision.current()
+        promos = PromoFactory.build_batch(5)
+        ids = Promotion.create_many(promos, batch_size=2)
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(PromotionRevision.current(), revision + 1)
+        for promo_id, promo in zip(ids, promos):
+            found = Promotion.find(promo_id)
+            self.assertEqual(found.name, promo.name)
+            self.assertEqual(found.original_end_date, promo.end_date)
+            self.assertEqual(found.version, 1)
+        self.assertEqual(Promotion.create_many([]), [])
+
+    def test_create_many_returning_order(self):
+        """It should give each Promotion its own id in whatever order RETURNING lists them"""
+        execute = db.session.execute
+
+        def reverse_returning(statement, *args, **kwargs):
+            result = execute(statement, *args, **kwargs)
+            if statement.is_insert and not args:
+                ids = list(reversed(result.scalars().all()))
+                return MagicMock(scalars=lambda: ids)
+            return result
+
+        promos = PromoFactory.build_batch(4)
+        since = PromotionChange.latest()
+        with patch.object(db.session, "execute", side_effect=reverse_returning):
+            ids = Promotion.create_many(promos, batch_size=3)
+        self.assertEqual(ids, sorted(ids))
+        changes = PromotionChange.since(since, 10)
+        for promo_id, promo, change in zip(ids, promos, changes):
+            self.assertEqual(Promotion.find(promo_id).name, promo.name)
+            self.assertEqual((change["promotion_id"], change["data"]["name"]), (promo_id, promo.name))
+
     def test_update_a_promotion(self):
         """It should Update a Promotion"""
         promo = PromoFactory()
@@ -175,6 +213,20 @@ class TestPromotionModel(unittest.TestCase):
         promo.id = None
         self.assertRaises(DataValidationError, promo.update)
 
+    def test_update_bumps_versions(self):
+        """It should bump the row version and table revision on every write"""
+        revision = PromotionRevision.current()
+        promo = PromoFactory()
+        promo.create()
+        self.assertEqual(promo.version, 1)
+        self.assertEqual(PromotionRevision.current(), revision + 1)
+        promo.cancel()
+        promo.update()
+        self.assertEqual(promo.version, 2)
+        self.assertEqual(PromotionRevision.current(), revision + 2)
+        promo.delete()
+        self.assertEqual(PromotionRevision.current(), revision + 3)
+
     def test_delete_a_promotion(self):
         """It should Delete a Promotion"""
         promo = PromoFactory()
@@ -196,6 +248,95 @@ class TestPromotionModel(unittest.TestCase):
         promos = Promotion.all()
         self.assertEqual(len(promos), 5)
 
+    def test_paginate_promotions(self):
+        """It should page through Promotions in id order"""
+        for promo in PromoFactory.create_batch(5):
+            promo.create()
+        page, after = Promotion.paginate(Promotion.query, 3)
+        self.assertEqual(len(page), 3)
+        self.assertEqual(after, page[-1]["id"])
+        rest, after = Promotion.paginate(Promotion.query, 3, after)
+        self.assertEqual(len(rest), 2)
+        self.assertIsNone(after)
+        ids = [row["id"] for row in page + rest]
+        self.assertEqual(ids, sorted(ids))
+
+    def test_paginate_sorted(self):
+        """It should page through Promotions sorted by a column in either order"""
+        for number in range(5):
+            PromoFactory(name=f"Sale {number % 3}").create()
+        for descending in (False, True):
+            expected = Promotion.select_rows(sort="name", descending=descending)
+            page, after = Promotion.paginate(Promotion.query, 2, sort="name", descending=descending)
+            self.assertEqual(after, [page[-1]["name"], page[-1]["id"]])
+            rest, after = Promotion.paginate(
+                Promotion.query, 5, after, sort="name", descending=descending
+            )
+            self.assertIsNone(after)
+            self.assertEqual(page + rest, expected)
+            names = [row["name"] for row in expected]
+            self.assertEqual(names, sorted(names, reverse=descending))
+        page, after = Promotion.paginate(Promotion.query, 2, sort="start_date")
+        self.assertEqual(after[0], page[-1]["start_date"].isoformat())
+        rest, _ = Promotion.paginate(Promotion.query, 5, after, sort="start_date")
+        self.assertEqual(len(page + rest), 5)
+
+    def test_paginate_bad_keyset(self):
+        """It should reject a key that does not belong to the sort order"""
+        for sort, key in (
+            ("id", ["Sale", 1]),
+            ("name", 1),
+            ("name", [1, 1]),
+            ("start_date", ["not a date", 1]),
+            ("end_date", ["2023-01-01"]),
+        ):
+            self.assertRaises(
+                DataValidationError, Promotion.paginate, Promotion.query, 2, key, sort
+            )
+
+    def test_find_by_filters(self):
+        """It should find Promotions matching every filter"""
+        first = PromoFactory(name="Sale", start_date=date(2023, 6, 1), whole_store=True)
+        second = PromoFactory(name="Sale", start_date=date(2023, 7, 1), whole_store=False)
+        third = PromoFactory(name="Other", start_date=date(2023, 7, 1), whole_store=True)
+        for promo in (first, second, third):
+            promo.create()
+
+        def ids(filters):
+            return sorted(promo.id for promo in Promotion.find_by_filters(filters))
+
+        self.assertEqual(ids({}), sorted([first.id, second.id, third.id]))
+        self.assertEqual(ids({"name": "Sale", "whole_store": True}), [first.id])
+        self.assertEqual(ids({"start_date_gte": date(2023, 7, 1)}), sorted([second.id, third.id]))
+        self.assertEqual(ids({"name": "Sale", "start_date_lt": date(2023, 7, 1)}), [first.id])
+        self.assertRaises(DataValidationError, Promotion.find_by_filters, {"colour": "red"})
+
+    def test_select_rows(self):
+        """It should select the serialized columns of matching Promotions"""
+        promos = PromoFactory.create_batch(4)
+        for promo in promos:
+            promo.create()
+        rows = Promotion.select_rows()
+        self.assertEqual([dict(row) for row in rows], [promo.serialize() for promo in promos])
+        rows = Promotion.select_rows(Promotion.find_by_name("nothing"))
+        self.assertEqual(rows, [])
+        streamed = Promotion.stream(Promotion.find_by_name(promos[0].name), 2)
+        self.assertEqual([row["id"] for row in streamed], [promo.id for promo in promos])
+
+    def test_select_fields(self):
+        """It should only select the requested columns, and the id"""
+        promos = PromoFactory.create_batch(3)
+        for promo in promos:
+            promo.create()
+        rows = Promotion.select_rows(fields=("name", "end_date"), sort="name")
+        self.assertEqual(set(rows[0].keys()), {"id", "name", "end_date"})
+        self.assertEqual([row["name"] for row in rows], sorted(promo.name for promo in promos))
+        page, after = Promotion.paginate(Promotion.query, 2, sort="start_date", fields=("name",))
+        self.assertEqual(set(page[0].keys()), {"id", "name", "start_date"})
+        self.assertEqual(after, Promotion.keyset(page[1], "start_date"))
+        streamed = Promotion.stream(Promotion.query, 2, fields=("message",))
+        self.assertEqual([set(row.keys()) for row in streamed], [{"id", "message"}] * 3)
+
     def test_serialize_a_promotion(self):
         """It should serialize a Promotion"""
         promo = PromoFactory()
@@ -376,6 +517,39 @@ class TestPromotionModel(unittest.TestCase):
             promo.promotion_changes_price, promos[1].promotion_changes_price
         )
 
+    def test_find_serialized_is_cached(self):
+        """It should serve repeated lookups of a Promotion from the cache"""
+        promo = PromoFactory()
+        promo.create()
+        self.assertEqual(
+            Promotion.find_serialized(promo.id), dict(promo.serialize(), version=1)
+        )
+        hits = cache.stats()["hits"]
+        self.assertEqual(Promotion.find_serialized(promo.id)["name"], promo.name)
+        self.assertEqual(cache.stats()["hits"], hits + 1)
+        # writes invalidate the cached copy
+        promo.name = "Changed"
+        promo.update()
+        self.assertEqual(Promotion.find_serialized(promo.id)["name"], "Changed")
+        promo_id = promo.id
+        promo.delete()
+        self.assertIsNone(Promotion.find_serialized(promo_id))
+        self.assertIsNone(Promotion.find_serialized("not-an-id"))
+
+    def test_find_caches_not_found(self):
+        """It should remember ids that were not found on reads, but not for writes"""
+        self.assertIsNone(Promotion.find_serialized(1))
+        hits = cache.stats()["hits"]
+        self.assertIsNone(Promotion.find_serialized(1))
+        self.assertEqual(cache.stats()["hits"], hits + 1)
+        # another worker creates the Promotion behind the cached miss
+        promo = PromoFactory(id=1)
+        db.session.add(promo)
+        db.session.commit()
+        hits = cache.stats()["hits"]
+        self.assertEqual(Promotion.find(1).id, 1)
+        self.assertEqual(cache.stats()["hits"], hits)
+
     def test_find_by_name(self):
         """It should Find a Promotion by Name"""
         promos = PromoFactory.create_batch(10)
@@ -438,6 +612,26 @@ class TestPromotionModel(unittest.TestCase):
         for promo in found:
             self.assertEqual(promo.message, message)
 
+    def test_change_end_dates(self):
+        """It should change the end dates of selected Promotions in one UPDATE"""
+        today = date.today()
+        early = Promotion(name="early", start_date=today, end_date=today + timedelta(5))
+        late = Promotion(name="late", start_date=today + timedelta(3), end_date=today + timedelta(5))
+        early.create()
+        late.create()
+        revision = PromotionRevision.current()
+        Promotion.find_serialized(early.id)  # cache it
+        rows = Promotion.change_end_dates(today + timedelta(2), ending_on=today + timedelta(5))
+        self.assertEqual([row["id"] for row in rows], [early.id])
+        self.assertEqual(PromotionRevision.current(), revision + 1)
+        found = Promotion.find_serialized(early.id)
+        self.assertEqual(found["end_date"], today + timedelta(2))
+        self.assertEqual(found["version"], 2)
+        self.assertEqual(Promotion.find(late.id).end_date, today + timedelta(5))
+        rows = Promotion.cancel_many(ids=[early.id, late.id])
+        self.assertEqual([row["end_date"] for row in rows], [today])
+        self.assertRaises(DataValidationError, Promotion.change_end_dates, today)
+
     def test_is_active(self):
         """It should set a Promotion as active if it was created before or on today's date"""
         today = date.today()
@@ -466,6 +660,122 @@ class TestPromotionModel(unittest.TestCase):
         )
         self.assertFalse(promo.is_active())
 
+    def test_find_active(self):
+        """It should Find the Promotions running on a date"""
+        today = date.today()
+        windows = [(-5, -1), (-5, 0), (-5, 1), (0, 1), (1, 5)]
+        for start, end in windows:
+            Promotion(
+                name=f"{start},{end}",
+                start_date=today + timedelta(start),
+                end_date=today + timedelta(end),
+            ).create()
+        found = Promotion.find_active()
+        self.assertEqual(sorted(promo.name for promo in found), ["-5,1", "0,1"])
+        for promo in Promotion.all():
+            self.assertEqual(promo in found.all(), promo.is_active())
+        found = Promotion.find_active(today + timedelta(2))
+        self.assertEqual([promo.name for promo in found], ["1,5"])
+
+    def test_active_set(self):
+        """It should keep today's running Promotions in the activation schedule"""
+        today = date.today()
+        for start, end in [(-5, -1), (-5, 1), (0, 1), (1, 5)]:
+            Promotion(
+                name=f"{start},{end}",
+                start_date=today + timedelta(start),
+                end_date=today + timedelta(end),
+            ).create()
+        active = Promotion.active_set()
+        self.assertEqual(active.day, today)
+        self.assertEqual([row["name"] for row in active.rows], ["-5,1", "0,1"])
+        self.assertIs(Promotion.active_set(), active)
+        self.assertEqual(activations.next_transition(), today + timedelta(1))
+        promo = Promotion.find_by_name("1,5").first()
+        promo.start_date = today
+        promo.update()
+        self.assertEqual(len(Promotion.active_set().rows), 3)
+        self.assertEqual(promo.id in Promotion.active_set().ids, promo.is_active())
+
+    def test_run_transitions(self):
+        """It should report the starts and expiries of a day once, without a read of /active"""
+        day = date(2024, 3, 1)
+        for start, end in [(-5, 0), (-5, 1), (0, 1), (0, 0), (1, 5)]:
+            Promotion(
+                name=f"{start},{end}", start_date=day + timedelta(start), end_date=day + timedelta(end)
+            ).create()
+        since = PromotionChange.latest()
+        with self.assertLogs(app.logger, "INFO") as logs:
+            activated, expired = Promotion.run_transitions(day)
+        self.assertEqual([row["name"] for row in activated], ["0,1"])
+        self.assertEqual([row["name"] for row in expired], ["-5,0"])
+        hooks = [line.split(":", 2)[2] for line in logs.output if "(" in line]
+        self.assertEqual(
+            hooks,
+            [f"Promotion {expired[0]['id']} (-5,0) ended on {day}", f"Promotion {activated[0]['id']} (0,1) started on {day}"],
+        )
+        changes = PromotionChange.since(since, 10)
+        self.assertEqual([(row["kind"], row["data"]["name"]) for row in changes], [("expire", "-5,0"), ("activate", "0,1")])
+        # a second run reports nothing new
+        self.assertEqual(Promotion.run_transitions(day), ([], []))
+        self.assertEqual(PromotionChange.latest(), changes[-1]["seq"])
+
+    def test_run_transitions_lock(self):
+        """It should hold the revision row lock before recording transitions"""
+        day = date(2024, 4, 1)
+        Promotion(name="starts", start_date=day, end_date=day + timedelta(1)).create()
+        revision = PromotionRevision.current()
+        calls = []
+        lock, record = PromotionRevision.lock, PromotionChange.record
+        with patch.object(PromotionRevision, "lock", side_effect=lambda: calls.append("lock") or lock()), \
+                patch.object(PromotionChange, "record", side_effect=lambda *args: calls.append("record") or record(*args)):
+            Promotion.run_transitions(day)
+        self.assertEqual(calls, ["lock", "record"])
+        # the lock leaves the revision, and so the list ETag, alone
+        self.assertEqual(PromotionRevision.current(), revision)
+
+    def test_find_overlapping(self):
+        """It should Find the Promotions overlapping a window of days"""
+        windows = [(1, 5), (5, 10), (8, 20), (20, 25), (12, 12), (15, 9)]
+        for start, end in windows:
+            Promotion(
+                name=f"{start},{end}",
+                start_date=date(2023, 6, start),
+                end_date=date(2023, 6, end),
+            ).create()
+        found = Promotion.find_overlapping(date(2023, 6, 5), date(2023, 6, 12))
+        self.assertEqual(sorted(promo.name for promo in found), ["5,10", "8,20"])
+        found = Promotion.find_overlapping(date(2023, 6, 4), date(2023, 6, 5))
+        self.assertEqual([promo.name for promo in found], ["1,5"])
+        found = Promotion.find_overlapping(date(2023, 5, 1), date(2023, 7, 1))
+        self.assertEqual(len(found.all()), 4)
+        self.assertRaises(
+            DataValidationError, Promotion.find_overlapping, date(2023, 6, 5), date(2023, 6, 5)
+        )
+
+    def test_search(self):
+        """It should search names and messages, best match first"""
+        texts = [("Summer Sale", "Everything must go"), ("Clearance", "Summer 50% sale"), ("Sale", None)]
+        promos = [PromoFactory(name=name, message=message) for name, message in texts]
+        for promo in promos:
+            promo.create()
+        ids = [row["id"] for row in Promotion.search("SALE", 10)]
+        self.assertEqual(ids, [promos[2].id, promos[0].id, promos[1].id])
+        ids = [row["id"] for row in Promotion.search("sale", 1)]
+        self.assertEqual(ids, [promos[2].id])
+        ids = [row["id"] for row in Promotion.search("summer", 10, prefix_only=True)]
+        self.assertEqual(ids, [promos[0].id, promos[1].id])
+        ids = [row["id"] for row in Promotion.search("50%", 10)]
+        self.assertEqual(ids, [promos[1].id])
+        self.assertEqual(Promotion.search("5_%", 10), [])
+        self.assertEqual(Promotion.search(" ", 10), [])
+        # the in-memory index follows changes to the table
+        promos[1].name = "Summer Sale Clearance"
+        promos[1].update()
+        query = Promotion.find_by_name("Summer Sale Clearance")
+        ids = [row["id"] for row in Promotion.search("sale", 10, query)]
+        self.assertEqual(ids, [promos[1].id])
+
     def test_find_or_404_found(self):
         """It should Find or return 404 not found"""
         promos = PromoFactory.create_batch(3)
@@ -497,3 +807,51 @@ class TestPromotionModel(unittest.TestCase):
         self.assertTrue(promo.is_active())
         promo.cancel()
         self.assertFalse(promo.is_active())
+
+    def test_count(self):
+        """It should count Promotions exactly, or from the planner's estimate"""
+        for promotion in PromoFactory.create_batch(6):
+            promotion.create()
+        whole_store = Promotion.find_by_filters({"whole_store": True})
+        self.assertEqual(Promotion.count(), (6, False))
+        self.assertEqual(Promotion.count(whole_store), (whole_store.count(), False))
+        self.assertEqual(Promotion.count(whole_store, estimate_min=10**9), (whole_store.count(), False))
+        total, estimated = Promotion.count(whole_store, estimate_min=0)
+        self.assertEqual(estimated, db.engine.dialect.name == "postgresql")
+        self.assertGreaterEqual(total, 0)
+
+    def test_compact_changes(self):
+        """It should drop superseded changes and old deletions from the change feed"""
+        db.session.query(PromotionChange).delete()
+        db.session.commit()
+        kept, deleted = PromoFactory(), PromoFactory()
+        kept.create()
+        deleted.create()
+        kept.update()
+        deleted.delete()
+        self.assertEqual(len(PromotionChange.since(0, 10)), 4)
+        # nothing is old enough to go yet
+        self.assertEqual(PromotionChange.compact(datetime(2000, 1, 1), datetime(2000, 1, 1)), 0)
+        later = datetime.utcnow() + timedelta(1)
+        self.assertEqual(PromotionChange.compact(later, datetime(2000, 1, 1)), 2)
+        self.assertEqual(
+            [(row["kind"], row["promotion_id"]) for row in PromotionChange.since(0, 10)],
+            [("update", kept.id), ("delete", deleted.id)],
+        )
+        deletion = PromotionChange.latest()
+        self.assertFalse(PromotionChangeHorizon.covers(deletion - 1))
+        self.assertEqual(PromotionChange.compact(later, later), 1)
+        db.session.commit()
+        changes = PromotionChange.since(0, 10)
+        self.assertEqual([row["kind"] for row in changes], ["update"])
+        # readers that may have missed the deletion are told so
+        self.assertEqual(PromotionChangeHorizon.current(), deletion)
+        self.assertTrue(PromotionChangeHorizon.covers(deletion - 1))
+        self.assertFalse(PromotionChangeHorizon.covers(deletion))
+        self.assertFalse(PromotionChangeHorizon.covers(0))
+        # the horizon never moves back
+        self.assertEqual(PromotionChange.compact(later, later), 0)
+        self.assertEqual(PromotionChangeHorizon.current(), deletion)
+        # the seq of the compacted deletion is not used again
+        PromoFactory().create()
+        self.assertEqual(PromotionChange.latest(), changes[0]["seq"] + 2)
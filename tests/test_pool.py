@@ -0,0 +1,75 @@
+"""
+Test cases for the connection pool settings and statistics
+
+Test cases can be run with:
+    green
+    -vvv --run-coverage
+"""
+import sqlite3
+from unittest import TestCase
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.pool import StaticPool
+from service.common.pool import InstrumentedQueuePool, engine_options, pool_stats
+
+OPTIONS = {"pool_size": 2, "max_overflow": 1, "pool_timeout": 5, "pool_pre_ping": True}
+
+
+class TestEngineOptions(TestCase):
+    """Test Cases for engine_options"""
+
+    def test_queue_pool_options(self):
+        """It should use an InstrumentedQueuePool for server databases"""
+        options = engine_options("postgresql://postgres@localhost/postgres", OPTIONS)
+        self.assertIs(options["poolclass"], InstrumentedQueuePool)
+        self.assertEqual(options["pool_size"], 2)
+        self.assertNotIn("poolclass", OPTIONS)
+
+    def test_sqlite_memory_options(self):
+        """It should drop the queue pool options for in-memory SQLite"""
+        options = engine_options("sqlite://", OPTIONS)
+        self.assertEqual(options, {"pool_pre_ping": True})
+
+
+class TestInstrumentedQueuePool(TestCase):
+    """Test Cases for InstrumentedQueuePool and pool_stats"""
+
+    def setUp(self):
+        self.pool = InstrumentedQueuePool(
+            lambda: sqlite3.connect(":memory:", check_same_thread=False),
+            pool_size=1,
+            max_overflow=0,
+            timeout=0.01,
+        )
+
+    def tearDown(self):
+        self.pool.dispose()
+
+    def test_counts_checkouts(self):
+        """It should count checkouts and report the pool state"""
+        conn = self.pool.connect()
+        stats = pool_stats(self.pool)
+        self.assertEqual(stats["class"], "InstrumentedQueuePool")
+        self.assertEqual(stats["checked_out"], 1)
+        self.assertEqual(stats["checkouts"], 1)
+        conn.close()
+        self.pool.connect().close()
+        stats = pool_stats(self.pool)
+        self.assertEqual(stats["checked_out"], 0)
+        self.assertEqual(stats["checkouts"], 2)
+        self.assertGreaterEqual(stats["max_wait_seconds"], 0)
+
+    def test_counts_timeouts(self):
+        """It should count checkouts that timed out waiting"""
+        conn = self.pool.connect()
+        self.assertRaises(exc.TimeoutError, self.pool.connect)
+        conn.close()
+        stats = pool_stats(self.pool)
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertGreaterEqual(stats["wait_seconds"], 0.01)
+
+    def test_other_pools(self):
+        """It should report only the class of pools it can not inspect"""
+        engine = create_engine("sqlite://", poolclass=StaticPool)
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        self.assertEqual(pool_stats(engine.pool), {"class": "StaticPool"})
@@ -0,0 +1,79 @@
+"""
+Test cases for the query log
+
+Test cases can be run with:
+    green
+    -vvv --run-coverage
+"""
+from unittest import TestCase
+from flask import Flask
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from service.common.query_log import (
+    MAX_PARAMETERS_LENGTH,
+    count_queries,
+    format_parameters,
+    init_query_log,
+)
+
+
+def make_app(slow_ms):
+    """Returns a Flask app whose only route runs two statements"""
+    app = Flask(__name__)
+    engine = create_engine("sqlite://")
+    init_query_log(app, engine, slow_ms)
+
+    @app.route("/")
+    def two_queries():
+        with engine.connect() as conn:
+            conn.execute(text("SELECT :value"), {"value": 1})
+            conn.execute(text("SELECT 2"))
+        return "OK"
+
+    return app, engine
+
+
+class TestQueryLog(TestCase):
+    """Test Cases for the query log"""
+
+    def test_response_headers(self):
+        """It should report the statements of a request in its headers"""
+        app, _ = make_app(float("inf"))
+        resp = app.test_client().get("/")
+        self.assertEqual(resp.headers["X-Query-Count"], "2")
+        self.assertRegex(resp.headers["Server-Timing"], r'^db;dur=[0-9.]+;desc="2 queries"$')
+
+    def test_slow_query_log(self):
+        """It should log slow statements with their parameters"""
+        app, _ = make_app(0)
+        with self.assertLogs(app.logger, "WARNING") as logs:
+            app.test_client().get("/")
+        self.assertEqual(len(logs.output), 2)
+        self.assertIn("SELECT ?; parameters: (1,)", logs.output[0])
+
+    def test_count_queries(self):
+        """It should count the statements of a block outside of any request"""
+        _, engine = make_app(float("inf"))
+        with count_queries() as queries:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+        self.assertEqual(queries.count, 1)
+        self.assertGreater(queries.seconds, 0)
+
+    def test_format_parameters(self):
+        """It should shorten long parameter lists"""
+        self.assertEqual(format_parameters((1, "a")), "(1, 'a')")
+        text_out = format_parameters(list(range(1000)))
+        self.assertEqual(len(text_out), MAX_PARAMETERS_LENGTH + 3)
+        self.assertTrue(text_out.endswith("..."))
+
+    def test_failed_statement(self):
+        """It should forget the start time of a statement that failed"""
+        _, engine = make_app(float("inf"))
+        with engine.connect() as conn:
+            self.assertRaises(OperationalError, conn.execute, text("SELECT * FROM nothing"))
+            self.assertEqual(conn.info["query_started"], [])
+            with count_queries() as queries:
+                conn.execute(text("SELECT 1"))
+        self.assertEqual(queries.count, 1)
+        self.assertLess(queries.seconds, 1)
@@ -0,0 +1,115 @@
+"""
+Test cases for reading from the read replica
+
+Test cases can be run with:
+    green
+    -vvv --run-coverage
+"""
+import os
+import tempfile
+from unittest import TestCase
+from sqlalchemy import create_engine
+from service import app
+from service.models import REPLICA, Promotion, PromotionRevision, db, cache, replica_reads
+from service.common import status
+from service.helpers import CONSISTENCY_TOKEN
+from tests.factories import PromoFactory
+
+BASE_URL = "/api/promotions"
+
+
+class TestReadReplica(TestCase):
+    """Tests that GET requests read from the replica and writes from the primary"""
+
+    def setUp(self):
+        # A separate SQLite file stands in for the replica; it only gets the
+        # rows the tests copy into it, as if replication lagged behind
+        handle, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+        self.replica = create_engine(f"sqlite:///{self.path}")
+        db.metadata.create_all(self.replica)
+        db.engines[REPLICA] = self.replica
+        db.session.query(Promotion).delete()
+        db.session.commit()
+        cache.clear()
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        del db.engines[REPLICA]
+        self.replica.dispose()
+        os.remove(self.path)
+
+    def _create_promotion(self):
+        """Creates a Promotion and returns its id and the consistency token"""
+        data = {k: str(v) for k, v in PromoFactory().serialize().items()}
+        resp = self.client.post(BASE_URL, json=data)
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        return int(resp.get_json()["id"]), resp.headers[CONSISTENCY_TOKEN]
+
+    def _replicate(self):
+        """Copies the Promotions and the revision of the primary to the replica"""
+        with self.replica.begin() as conn:
+            for model in (Promotion, PromotionRevision):
+                conn.execute(model.__table__.delete())
+                rows = db.session.execute(db.select(model.__table__)).mappings().all()
+                if rows:
+                    conn.execute(model.__table__.insert(), [dict(row) for row in rows])
+        db.session.commit()
+
+    def test_reads_from_replica(self):
+        """It should answer GET requests from the replica"""
+        promotion_id, _ = self._create_promotion()
+        self.assertEqual(self.client.get(BASE_URL).get_json(), [])
+        resp = self.client.get(f"{BASE_URL}/{promotion_id}")
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+        self._replicate()
+        self.assertEqual(len(self.client.get(BASE_URL).get_json()), 1)
+        resp = self.client.get(f"{BASE_URL}/{promotion_id}")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+    def test_write_after_lagging_read(self):
+        """It should update and delete on the primary after the replica missed the row"""
+        promotion_id, _ = self._create_promotion()
+        resp = self.client.get(f"{BASE_URL}/{promotion_id}")
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+        data = {k: str(v) for k, v in Promotion.find(promotion_id).serialize().items()}
+        resp = self.client.put(f"{BASE_URL}/{promotion_id}", json=dict(data, name="Renamed"))
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(Promotion.find(promotion_id).name, "Renamed")
+        # the replica does not refill the cache with its stale copy either
+        self._replicate()
+        with self.replica.begin() as conn:
+            conn.execute(Promotion.__table__.update().values(name="Stale"))
+        self.assertEqual(self.client.get(f"{BASE_URL}/{promotion_id}").get_json()["name"], "Stale")
+        self.assertEqual(Promotion.find_serialized(promotion_id)["name"], "Renamed")
+        resp = self.client.delete(f"{BASE_URL}/{promotion_id}")
+        self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+        db.session.expire_all()
+        self.assertIsNone(Promotion.find(promotion_id))
+
+    def test_consistency_token(self):
+        """It should read from the primary until the replica reaches the token"""
+        promotion_id, token = self._create_promotion()
+        self.assertEqual(token, str(PromotionRevision.current()))
+        headers = {CONSISTENCY_TOKEN: token}
+        resp = self.client.get(f"{BASE_URL}/{promotion_id}", headers=headers)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(self.client.get(BASE_URL, headers=headers).get_json()), 1)
+        self._replicate()
+        with replica_reads(int(token)) as on_replica:
+            self.assertTrue(on_replica)
+        resp = self.client.delete(f"{BASE_URL}/{promotion_id}")
+        self.assertGreater(int(resp.headers[CONSISTENCY_TOKEN]), int(token))
+        with replica_reads(int(resp.headers[CONSISTENCY_TOKEN])) as on_replica:
+            self.assertFalse(on_replica)
+
+    def test_bad_consistency_token(self):
+        """It should reject a consistency token that is not a revision"""
+        resp = self.client.get(BASE_URL, headers={CONSISTENCY_TOKEN: "soon"})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_stats(self):
+        """It should report the pool of the replica"""
+        resp = self.client.get("/stats")
+        self.assertIn("checked_out", resp.get_json()["replica_pool"])
@@ -5,13 +5,18 @@ Test cases can be run with the following:
   nosetests -v --with-spec --spec-color
   coverage report -m
 """
+import json
 import logging
-from datetime import date, timedelta
+import threading
+import time
+from datetime import date, datetime, timedelta
 from unittest import TestCase
+from flask_restx import marshal
 from service import app
-from service.models import Promotion, DataValidationError, db
+from service.models import Promotion, PromotionChange, PromotionChangeHorizon, DataValidationError, db, cache
 from service.common import status  # HTTP Status Codes
-from service.helpers import convert_data, convert_data_back
+from service.helpers import convert_data_back, convert_row
+from service.routes import promotion_model
 from tests.factories import PromoFactory
 
 BASE_URL = "/api/promotions"
@@ -43,10 +48,16 @@ class TestYourResourceServer(TestCase):
         self.client = app.test_client()
         db.session.query(Promotion).delete()  # clean up the last tests
         db.session.commit()
+        cache.clear()  # the bulk delete above bypasses cache invalidation
 
     def tearDown(self):
         """This runs after each test"""
 
+    def assertMaxQueries(self, response, maximum):  # pylint: disable=invalid-name
+        """Checks that the request of a response ran at most maximum SQL statements"""
+        count = int(response.headers["X-Query-Count"])
+        self.assertLessEqual(count, maximum, f"{count} queries, over the budget of {maximum}")
+
     def _create_promotions(self, count):
         """Factory method to create promotions in bulk"""
         promotions = []
@@ -134,6 +145,18 @@ class TestYourResourceServer(TestCase):
             )
             self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_create_with_json_types(self):
+        """It should create a Promotion from native JSON booleans and reject long names"""
+        data = {k: str(v) for k, v in PromoFactory().serialize().items()}
+        data.update(whole_store=True, has_been_extended=False, promotion_changes_price=True)
+        resp = self.client.post(BASE_URL, json=data)
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(resp.get_json()["whole_store"], "True")
+        data["name"] = "x" * 64
+        resp = self.client.post(BASE_URL, json=data)
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("longer than 63", resp.get_json()["message"])
+
     def test_create_with_start_and_end_mismatch(self):
         """It should return 400 is the end date is before the start date"""
         promo = PromoFactory()
@@ -154,17 +177,59 @@ class TestYourResourceServer(TestCase):
         )
         self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def _bulk_data(self, count):
+        """Returns count promotions in the format the create endpoint accepts"""
+        items = []
+        for promo in PromoFactory.build_batch(count):
+            data = promo.serialize()
+            del data["id"]
+            items.append({k: str(v) for k, v in data.items()})
+        return items
+
+    def test_create_bulk(self):
+        """It should create many Promotions from one JSON array"""
+        items = self._bulk_data(5)
+        resp = self.client.post(f"{BASE_URL}/bulk", json=items)
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        data = resp.get_json()
+        self.assertEqual(data["created"], 5)
+        for item, result in zip(items, data["results"]):
+            promo = self.client.get(result["resource_url"]).get_json()
+            self.assertEqual(promo["name"], item["name"])
+            self.assertEqual(promo["end_date"], item["end_date"])
+
+    def test_create_bulk_ndjson(self):
+        """It should create many Promotions from an NDJSON stream"""
+        body = "\n".join(json.dumps(item) for item in self._bulk_data(3)) + "\n"
+        resp = self.client.post(
+            f"{BASE_URL}/bulk", data=body, content_type="application/x-ndjson"
+        )
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(self.client.get(BASE_URL).get_json()), 3)
+        resp = self.client.post(
+            f"{BASE_URL}/bulk", data="{not json\n", content_type="application/x-ndjson"
+        )
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_create_bulk_with_bad_items(self):
+        """It should create nothing and report every bad item of a bulk create"""
+        items = self._bulk_data(4)
+        del items[1]["name"]
+        items[3]["end_date"] = "never"
+        items.append("not a promotion")
+        resp = self.client.post(f"{BASE_URL}/bulk", json=items)
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = resp.get_json()["errors"]
+        self.assertEqual([error["index"] for error in errors], [1, 3, 4])
+        self.assertEqual(self.client.get(BASE_URL).get_json(), [])
+        resp = self.client.post(f"{BASE_URL}/bulk", json={"name": "not a list"})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.client.post(f"{BASE_URL}/bulk", json=[])
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_helpers(self):
         """It should return an error when converting data that does not conform"""
         promo = PromoFactory()
-        data = promo.serialize()
-        data["start_date"] = data["start_date"].strftime("%m-%d-%Y")
-        self.assertRaises((DataValidationError, ValueError), convert_data, data)
-
-        data = promo.serialize()
-        data["whole_store"] = "None"
-        self.assertRaises((DataValidationError, ValueError), convert_data, data)
-
         data = promo.serialize()
         data["start_date"] = None
         self.assertRaises((DataValidationError, ValueError), convert_data_back, data)
@@ -173,6 +238,12 @@ class TestYourResourceServer(TestCase):
         data["whole_store"] = None
         self.assertRaises((DataValidationError, ValueError), convert_data_back, data)
 
+    def test_convert_row(self):
+        """It should format rows exactly like the promotion model marshals them"""
+        for promo in PromoFactory.build_batch(3) + [Promotion(id=7, name="sparse")]:
+            data = promo.serialize()
+            self.assertEqual(convert_row(data), marshal(data, promotion_model))
+
     def test_get_promotion(self):
         """It should Get a single Promotion"""
         # get the id of a promotion
@@ -184,6 +255,69 @@ class TestYourResourceServer(TestCase):
         data = response.get_json()
         self.assertEqual(data["name"], test_promotion.name)
 
+    def test_sparse_fieldsets(self):
+        """It should only return the fields asked for"""
+        promotions = self._create_promotions(3)
+        url = f"{BASE_URL}/{promotions[0].id}"
+        full = self.client.get(url)
+        response = self.client.get(url, query_string="fields=end_date,name, id")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(data, {key: full.get_json()[key] for key in ("id", "name", "end_date")})
+        self.assertNotEqual(response.headers["ETag"], full.headers["ETag"])
+        response = self.client.get(url, query_string="fields=name", headers={"If-None-Match": full.headers["ETag"]})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(response.get_json()), ["name"])
+        # lists, pages, NDJSON and searches are narrowed alike
+        response = self.client.get(BASE_URL, query_string="fields=name&sort=end_date")
+        self.assertEqual([set(row) for row in response.get_json()], [{"name"}] * 3)
+        response = self.client.get(BASE_URL, query_string="fields=whole_store&sort=name&limit=2")
+        self.assertEqual([set(row) for row in response.get_json()], [{"whole_store"}] * 2)
+        self.assertIn("fields=whole_store", response.headers["Link"])
+        query = f"fields=whole_store&sort=name&limit=2&cursor={response.headers['X-Next-Cursor']}"
+        response = self.client.get(BASE_URL, query_string=query)
+        self.assertEqual([set(row) for row in response.get_json()], [{"whole_store"}])
+        response = self.client.get(BASE_URL, query_string="fields=id&stream=1")
+        self.assertEqual(response.get_data(as_text=True).splitlines()[0], json.dumps({"id": str(promotions[0].id)}))
+        response = self.client.get(BASE_URL, query_string={"fields": "id", "q": promotions[0].name})
+        self.assertIn({"id": str(promotions[0].id)}, response.get_json())
+        for fields in ("colour", "name,colour", ","):
+            response = self.client.get(BASE_URL, query_string={"fields": fields})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(url, query_string="fields=version")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_promotion_conditional(self):
+        """It should answer a matching If-None-Match with 304 Not Modified"""
+        test_promotion = self._create_promotions(1)[0]
+        url = f"{BASE_URL}/{test_promotion.id}"
+        response = self.client.get(url)
+        etag = response.headers["ETag"]
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.data, b"")
+        # a change gives the promotion a new ETag
+        self.client.get(f"{BASE_URL}/cancel/{test_promotion.id}")
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_list_promotion_conditional(self):
+        """It should answer an unchanged list with 304 Not Modified"""
+        self._create_promotions(2)
+        response = self.client.get(BASE_URL)
+        etag = response.headers["ETag"]
+        response = self.client.get(BASE_URL, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(
+            BASE_URL, headers={"If-None-Match": etag, "Accept": "application/x-ndjson"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self._create_promotions(1)
+        response = self.client.get(BASE_URL, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.get_json()), 3)
+
     def test_get_promotion_not_found(self):
         """It should not Get a Promotion thats not found"""
         response = self.client.get(f"{BASE_URL}/0")
@@ -205,6 +339,94 @@ class TestYourResourceServer(TestCase):
         data = response.get_json()
         self.assertEqual(len(data), 5)
 
+    def test_list_promotion_paginated(self):
+        """It should page through the list of Promotions with a cursor"""
+        promotions = self._create_promotions(5)
+        seen = []
+        response = self.client.get(BASE_URL, query_string="limit=2")
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            data = response.get_json()
+            self.assertLessEqual(len(data), 2)
+            seen.extend(int(promotion["id"]) for promotion in data)
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+            self.assertIn('rel="next"', response.headers["Link"])
+            response = self.client.get(
+                BASE_URL, query_string={"limit": 2, "cursor": cursor}
+            )
+        self.assertEqual(seen, sorted(promotion.id for promotion in promotions))
+
+    def test_list_promotion_bad_cursor(self):
+        """It should not page the list of Promotions with a bad cursor"""
+        response = self.client.get(BASE_URL, query_string="cursor=not-a-cursor")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(BASE_URL, query_string="limit=0")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_count_promotions(self):
+        """It should count the matching Promotions with count_only and HEAD"""
+        promotions = self._create_promotions(5)
+        whole_store = len([promo for promo in promotions if promo.whole_store])
+        response = self.client.get(BASE_URL, query_string="count_only=1")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json(), {"count": 5, "estimated": False})
+        self.assertEqual(response.headers["X-Total-Count"], "5")
+        self.assertMaxQueries(response, 2)
+        response = self.client.head(BASE_URL, query_string="whole_store=true&limit=1")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.headers["X-Total-Count"], str(whole_store))
+        self.assertEqual(response.data, b"")
+        response = self.client.get(
+            BASE_URL, query_string="count_only=1", headers={"If-None-Match": response.headers["ETag"]}
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        # small counts are exact even when an estimate is allowed
+        response = self.client.get(BASE_URL, query_string="count_only=1&estimate=1")
+        self.assertEqual(response.headers["X-Total-Count"], "5")
+        self.assertNotIn("X-Total-Count-Estimated", response.headers)
+        response = self.client.get(BASE_URL, query_string="count_only=1&q=sale")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_promotion_ndjson(self):
+        """It should stream the list of Promotions as NDJSON"""
+        promotions = self._create_promotions(3)
+        response = self.client.get(BASE_URL, headers={"Accept": "application/x-ndjson"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual(len(lines), 3)
+        listed = self.client.get(BASE_URL).get_json()
+        self.assertEqual([json.loads(line) for line in lines], listed)
+        response = self.client.get(
+            BASE_URL, query_string={"stream": 1, "name": promotions[0].name, "limit": 2}
+        )
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        self.assertEqual(len(response.get_data(as_text=True).splitlines()), 2)
+        self.assertIn("X-Next-Cursor", response.headers)
+
+    def test_list_active_promotions(self):
+        """It should list only the Promotions running on a date"""
+        promotions = self._create_promotions(5)
+        as_of = date.today() + timedelta(days=3)
+        response = self.client.get(f"{BASE_URL}/active", query_string={"as_of": str(as_of)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = sorted(promo.id for promo in promotions if promo.is_active(as_of))
+        self.assertEqual(sorted(int(promo["id"]) for promo in response.get_json()), expected)
+        response = self.client.get(f"{BASE_URL}/active", query_string="as_of=never")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_promotions_active_today(self):
+        """It should list today's Promotions from the activation schedule"""
+        promotions = self._create_promotions(5)
+        expected = sorted(promo.id for promo in promotions if promo.is_active())
+        response = self.client.get(f"{BASE_URL}/active")
+        self.assertEqual(sorted(int(promo["id"]) for promo in response.get_json()), expected)
+        response = self.client.get(f"{BASE_URL}/active", query_string={"as_of": str(date.today())})
+        self.assertEqual(sorted(int(promo["id"]) for promo in response.get_json()), expected)
+        self.assertMaxQueries(response, 1)
+
     def test_query_promotion_list_by_name(self):
         """ It should query Promotions by Name """
         promotions = self._create_promotions(10)
@@ -221,6 +443,86 @@ class TestYourResourceServer(TestCase):
         for promotion in data:
             self.assertEqual(promotion["name"], test_name)
 
+    def test_query_promotion_list_combined(self):
+        """It should combine filters, date ranges and flags with AND"""
+        for start, whole_store in ((1, True), (10, True), (20, False), (20, True)):
+            promotion = PromoFactory(
+                name="Sale" if start < 20 or whole_store else "Other",
+                start_date=date(2023, 6, start),
+                end_date=date(2023, 7, start),
+                whole_store=whole_store,
+            )
+            data = {k: str(v) for k, v in promotion.serialize().items()}
+            self.client.post(BASE_URL, json=data)
+        resp = self.client.get(
+            BASE_URL, query_string="name=Sale&start_date_gte=2023-06-10&whole_store=true"
+        )
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [row["start_date"] for row in resp.get_json()], ["2023-06-10", "2023-06-20"]
+        )
+        resp = self.client.get(BASE_URL, query_string="end_date_lt=2023-07-20&whole_store=false")
+        self.assertEqual(resp.get_json(), [])
+        resp = self.client.get(BASE_URL, query_string="start_date_lte=2023-06-10&end_date_gt=2023-07-01")
+        self.assertEqual([row["start_date"] for row in resp.get_json()], ["2023-06-10"])
+        resp = self.client.get(BASE_URL, query_string="start_date_gte=June")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_query_promotion_list_overlaps(self):
+        """It should list the Promotions overlapping a window of days"""
+        for start, end in ((1, 5), (5, 10), (20, 25)):
+            promotion = PromoFactory(start_date=date(2023, 6, start), end_date=date(2023, 6, end))
+            data = {k: str(v) for k, v in promotion.serialize().items()}
+            self.client.post(BASE_URL, json=data)
+        resp = self.client.get(BASE_URL, query_string="overlaps=2023-06-05,2023-06-21&sort=start_date")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [row["start_date"] for row in resp.get_json()], ["2023-06-05", "2023-06-20"]
+        )
+        for window in ("2023-06-05", "2023-06-05,2023-06-05", "June,July"):
+            resp = self.client.get(BASE_URL, query_string=f"overlaps={window}")
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_query_promotion_list_search(self):
+        """It should search Promotions by name and message with q"""
+        for name in ("Summer Sale", "Big Summer", "Winter"):
+            data = {k: str(v) for k, v in PromoFactory(name=name).serialize().items()}
+            self.client.post(BASE_URL, json=data)
+        resp = self.client.get(BASE_URL, query_string="q=summer")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual([row["name"] for row in resp.get_json()], ["Summer Sale", "Big Summer"])
+        resp = self.client.get(BASE_URL, query_string="q=summer&limit=1")
+        self.assertEqual([row["name"] for row in resp.get_json()], ["Summer Sale"])
+        resp = self.client.get(BASE_URL, query_string="q=summer&match=prefix")
+        self.assertEqual([row["name"] for row in resp.get_json()], ["Summer Sale"])
+        resp = self.client.get(BASE_URL, query_string="q=TEST&name=Winter")
+        self.assertEqual([row["name"] for row in resp.get_json()], ["Winter"])
+        # a search is ranked and not paged, so sorting or paging it is an error
+        for name, value in (("sort", "name"), ("order", "desc"), ("cursor", "MQ")):
+            resp = self.client.get(BASE_URL, query_string={"q": "summer", name: value})
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn(name, resp.get_json()["message"])
+
+    def test_query_promotion_list_sorted(self):
+        """It should sort Promotions and page through them in that order"""
+        for number in (3, 1, 2, 1):
+            data = {k: str(v) for k, v in PromoFactory(name=f"Sale {number}").serialize().items()}
+            self.client.post(BASE_URL, json=data)
+        resp = self.client.get(BASE_URL, query_string="sort=name&order=desc")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        names = [row["name"] for row in resp.get_json()]
+        self.assertEqual(names, ["Sale 3", "Sale 2", "Sale 1", "Sale 1"])
+        resp = self.client.get(BASE_URL, query_string="sort=name&limit=3")
+        self.assertEqual([row["name"] for row in resp.get_json()], ["Sale 1", "Sale 1", "Sale 2"])
+        self.assertIn("sort=name", resp.headers["Link"])
+        cursor = resp.headers["X-Next-Cursor"]
+        resp = self.client.get(BASE_URL, query_string=f"sort=name&limit=3&cursor={cursor}")
+        self.assertEqual([row["name"] for row in resp.get_json()], ["Sale 3"])
+        resp = self.client.get(BASE_URL, query_string=f"sort=end_date&cursor={cursor}")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.client.get(BASE_URL, query_string="sort=message")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_query_promotion_list_by_message(self):
         """ It should query Promotions by Message """
         promotions = self._create_promotions(10)
@@ -301,6 +603,165 @@ class TestYourResourceServer(TestCase):
         response = self.client.get(f"{BASE_URL}/cancel/0", content_type=CONTENT_TYPE_JSON)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+    def test_change_end_dates(self):
+        """It should change the end date of every selected Promotion at once"""
+        promotions = self._create_promotions(4)
+        new_end_date = str(date.today() + timedelta(days=400))
+        ids = [promo.id for promo in promotions[:2]]
+        response = self.client.put(
+            f"{BASE_URL}/change_end_date", json={"ids": ids, "end_date": new_end_date}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(sorted(int(promo["id"]) for promo in data), sorted(ids))
+        for promo in self.client.get(BASE_URL).get_json():
+            changed = int(promo["id"]) in ids
+            self.assertEqual(promo["end_date"] == new_end_date, changed)
+        # selectors can be combined, and a date before the start changes nothing
+        response = self.client.put(
+            f"{BASE_URL}/change_end_date",
+            json={"name": promotions[0].name, "ending_on": new_end_date, "end_date": "2000-01-01"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json(), [])
+
+    def test_change_end_dates_bad_request(self):
+        """It should not change end dates without a valid selection and end date"""
+        self._create_promotions(1)
+        url = f"{BASE_URL}/change_end_date"
+        for body in [
+            {"end_date": "2030-01-01"},
+            {"ids": "1", "end_date": "2030-01-01"},
+            {"ids": [1]},
+            {"ids": [1], "end_date": "never"},
+            {"ending_on": "never", "end_date": "2030-01-01"},
+            ["not", "an", "object"],
+        ]:
+            response = self.client.put(url, json=body)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, body)
+
+    def test_cancel_many(self):
+        """It should cancel every selected Promotion at once"""
+        promotions = self._create_promotions(3)
+        response = self.client.put(
+            f"{BASE_URL}/cancel", json={"name": promotions[0].name}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(len(data), 3)
+        for promo in data:
+            self.assertEqual(promo["end_date"], str(date.today()))
+        response = self.client.put(f"{BASE_URL}/cancel", json={})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_changes_gone(self):
+        """It should answer 410 Gone to a since older than a compacted deletion"""
+        promotion = self._create_promotions(1)[0]
+        since = PromotionChange.latest()
+        self.client.delete(f"{BASE_URL}/{promotion.id}")
+        PromotionChange.compact(datetime.utcnow() + timedelta(1), datetime.utcnow() + timedelta(1))
+        db.session.commit()
+        horizon = PromotionChangeHorizon.current()
+        self.assertGreater(horizon, since)
+        response = self.client.get(f"{BASE_URL}/changes", query_string={"since": since})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+        self.assertIn("read the whole list again", response.get_json()["message"])
+        self.assertEqual(response.headers["X-Next-Since"], str(PromotionChange.latest()))
+        response = self.client.get(f"{BASE_URL}/changes", query_string={"since": horizon})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(f"{BASE_URL}/changes", query_string={"since": 0})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_list_changes(self):
+        """It should list every change to the Promotions in commit order"""
+        since = PromotionChange.latest()
+        promotions = self._create_promotions(2)
+        first, second = promotions[0], promotions[1]
+        data = {k: str(v) for k, v in first.serialize().items()}
+        self.client.put(f"{BASE_URL}/{first.id}", json=dict(data, name="Renamed"))
+        end_date = str(date.today() + timedelta(days=400))
+        self.client.put(f"{BASE_URL}/change_end_date/{first.id}", json={"end_date": end_date})
+        self.client.get(f"{BASE_URL}/cancel/{first.id}")
+        self.client.put(f"{BASE_URL}/cancel", json={"ids": [second.id]})
+        self.client.delete(f"{BASE_URL}/{second.id}")
+        response = self.client.get(f"{BASE_URL}/changes", query_string={"since": since})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        changes = response.get_json()
+        self.assertEqual(
+            [(change["kind"], int(change["id"])) for change in changes],
+            [
+                ("create", first.id),
+                ("create", second.id),
+                ("update", first.id),
+                ("end_date", first.id),
+                ("cancel", first.id),
+                ("cancel", second.id),
+                ("delete", second.id),
+            ],
+        )
+        self.assertEqual(changes[2]["promotion"]["name"], "Renamed")
+        self.assertEqual(changes[3]["promotion"]["end_date"], end_date)
+        self.assertEqual(changes[4]["promotion"]["id"], str(first.id))
+        self.assertIsNone(changes[-1]["promotion"])
+        self.assertEqual(response.headers["X-Next-Since"], str(changes[-1]["seq"]))
+        # paging with the X-Next-Since header
+        response = self.client.get(f"{BASE_URL}/changes", query_string={"since": since, "limit": 4})
+        self.assertEqual(response.get_json(), changes[:4])
+        response = self.client.get(
+            f"{BASE_URL}/changes", query_string={"since": response.headers["X-Next-Since"]}
+        )
+        self.assertEqual(response.get_json(), changes[4:])
+        response = self.client.get(f"{BASE_URL}/changes", query_string="since=-1")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_wait_for_changes(self):
+        """It should hold a request with wait until a change arrives"""
+        since = PromotionChange.latest()
+        started = time.monotonic()
+        response = self.client.get(f"{BASE_URL}/changes", query_string={"since": since, "wait": 1})
+        self.assertEqual(response.get_json(), [])
+        self.assertEqual(response.headers["X-Next-Since"], str(since))
+        self.assertGreaterEqual(time.monotonic() - started, 1)
+
+        def create_later():
+            time.sleep(0.2)
+            with app.app_context():
+                PromoFactory().create()
+                db.session.remove()
+
+        writer = threading.Thread(target=create_later)
+        writer.start()
+        started = time.monotonic()
+        response = self.client.get(f"{BASE_URL}/changes", query_string={"since": since, "wait": 10})
+        writer.join()
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual([change["kind"] for change in response.get_json()], ["create"])
+
+    def test_limit_waiters(self):
+        """It should answer at once when the worker's waiters are all busy"""
+        since = PromotionChange.latest()
+        self.assertEqual(app.config["CHANGES_WAITERS_MAX"], 1)
+        elapsed = []
+
+        def wait():
+            client = app.test_client()
+            started = time.monotonic()
+            client.get(f"{BASE_URL}/changes", query_string={"since": since, "wait": 3})
+            elapsed.append(time.monotonic() - started)
+
+        waiters = [threading.Thread(target=wait) for _ in range(2)]
+        for waiter in waiters:
+            waiter.start()
+        time.sleep(0.2)
+        started = time.monotonic()
+        self.assertEqual(self.client.get(BASE_URL).status_code, status.HTTP_200_OK)
+        self.assertLess(time.monotonic() - started, 1)
+        for waiter in waiters:
+            waiter.join()
+        # one call waited the full 3 seconds, the other one answered at once
+        self.assertLess(min(elapsed), 1)
+        self.assertGreaterEqual(max(elapsed), 3)
+
     def test_health(self):
         """It should be healthy"""
         resp = self.client.get("/health")
@@ -309,6 +770,53 @@ class TestYourResourceServer(TestCase):
         self.assertEqual(data["status"], 200)
         self.assertEqual(data["message"], "OK")
 
+    def test_stats(self):
+        """It should report the cache and connection pool counters"""
+        test_promotion = self._create_promotions(1)[0]
+        self.client.get(f"{BASE_URL}/{test_promotion.id}")
+        self.client.get(f"{BASE_URL}/{test_promotion.id}")
+        resp = self.client.get("/stats")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertGreaterEqual(data["cache"]["hits"], 1)
+        self.assertGreaterEqual(data["cache"]["size"], 1)
+        self.assertIn("class", data["pool"])
+
+    def test_metrics(self):
+        """It should export request, query, cache and pool metrics for Prometheus"""
+        test_promotion = self._create_promotions(1)[0]
+        self.client.get(f"{BASE_URL}/{test_promotion.id}")
+        resp = self.client.get("/metrics")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertTrue(resp.content_type.startswith("text/plain"))
+        body = resp.get_data(as_text=True)
+        self.assertIn(
+            'promotions_http_requests_total{method="GET",resource="PromotionResource",status="200"}',
+            body,
+        )
+        self.assertIn('promotions_http_request_duration_seconds_bucket{le="0.001"', body)
+        self.assertIn('promotions_db_queries_total{operation="INSERT"}', body)
+        self.assertIn('promotions_cache_events_total{event="misses"}', body)
+        self.assertIn("promotions_cache_entries", body)
+        self.assertIn("promotions_db_pool_checked_out", body)
+
+    def test_query_budgets(self):
+        """It should stay within the query budget of each endpoint"""
+        test_promotion = self._create_promotions(3)[0]
+        data = {k: str(v) for k, v in test_promotion.serialize().items()}
+        # Every write also adds its row to the change feed
+        self.assertMaxQueries(self.client.post(BASE_URL, json=data), 5)
+        self.assertMaxQueries(self.client.get(f"{BASE_URL}/{test_promotion.id}"), 1)
+        self.assertMaxQueries(self.client.get(f"{BASE_URL}/{test_promotion.id}"), 0)
+        self.assertMaxQueries(self.client.get(BASE_URL), 2)
+        self.assertMaxQueries(self.client.get(BASE_URL, query_string="limit=2"), 2)
+        self.assertMaxQueries(self.client.put(f"{BASE_URL}/{test_promotion.id}", json=data), 5)
+        self.assertMaxQueries(self.client.delete(f"{BASE_URL}/{test_promotion.id}"), 4)
+        self.assertMaxQueries(self.client.get(f"{BASE_URL}/changes"), 1)
+        resp = self.client.get("/health")
+        self.assertEqual(resp.headers["X-Query-Count"], "0")
+        self.assertIn("db;dur=", resp.headers["Server-Timing"])
+
 
 class TestJustDateExtensions(TestCase):
     """class for date extensions"""
@@ -317,6 +825,7 @@ class TestJustDateExtensions(TestCase):
         self.client = app.test_client()
         db.session.query(Promotion).delete()  # clean up the last tests
         db.session.commit()
+        cache.clear()  # the bulk delete above bypasses cache invalidation
 
         promo = PromoFactory()
         data_orig = promo.serialize()
@@ -0,0 +1,96 @@
+"""
+Test cases for the activation schedule
+
+Test cases can be run with:
+    green
+    -vvv --run-coverage
+"""
+import threading
+from datetime import date, datetime, timedelta
+from unittest import TestCase
+from service.common.scheduler import ActivationSchedule, seconds_to_midnight
+
+DAY = date(2024, 3, 1)
+
+
+def row(key, start, end):
+    """Returns a promotion row starting and ending so many days after DAY"""
+    return {"id": key, "start_date": DAY + timedelta(start), "end_date": DAY + timedelta(end)}
+
+
+class TestActivationSchedule(TestCase):
+    """Test Cases for ActivationSchedule"""
+
+    def setUp(self):
+        self.day = DAY
+        self.schedule = ActivationSchedule(today=lambda: self.day)
+        self.events = []
+        self.schedule.on_activate(lambda row, day: self.events.append(("start", row["id"], day)))
+        self.schedule.on_expire(lambda row, day: self.events.append(("end", row["id"], day)))
+        self.schedule.load(
+            [row(1, -5, 1), row(2, 0, 3), row(3, 1, 2), row(4, 2, 9), row(5, -9, 0), row(6, 4, 4)],
+            version=7,
+        )
+
+    def test_load(self):
+        """It should load the promotions running today and skip ended ones"""
+        active = self.schedule.current()
+        self.assertEqual(active.day, DAY)
+        self.assertEqual(active.version, 7)
+        self.assertEqual([item["id"] for item in active.rows], [1, 2])
+        self.assertEqual(active.ids, {1, 2})
+        self.assertEqual(self.schedule.next_transition(), DAY + timedelta(1))
+        self.assertEqual(self.events, [])
+
+    def test_advance(self):
+        """It should move the running set on and call the hooks at each boundary"""
+        self.day = DAY + timedelta(1)
+        self.assertEqual(self.schedule.current().ids, {2, 3})
+        self.assertEqual(self.events, [("end", 1, self.day), ("start", 3, self.day)])
+        self.day = DAY + timedelta(2)
+        activated, expired = self.schedule.advance()
+        self.assertEqual([item["id"] for item in activated], [4])
+        self.assertEqual([item["id"] for item in expired], [3])
+        self.assertEqual(self.schedule.current().ids, {2, 4})
+        self.assertEqual(self.schedule.advance(), ([], []))
+        self.assertEqual(self.schedule.current().version, 7)
+
+    def test_advance_over_several_days(self):
+        """It should catch up on missed days without reporting promotions that came and went"""
+        self.day = DAY + timedelta(5)
+        self.assertEqual(self.schedule.current().ids, {4})
+        self.assertEqual(
+            sorted(self.events),
+            [("end", 1, self.day), ("end", 2, self.day), ("start", 4, self.day)],
+        )
+        self.day = DAY + timedelta(30)
+        self.assertEqual(self.schedule.current().ids, frozenset())
+        self.assertIsNone(self.schedule.next_transition())
+
+    def test_failing_hook(self):
+        """It should log a failing hook and still run the others"""
+        self.schedule.on_expire(lambda row, day: 1 / 0)
+        self.schedule.on_expire(lambda row, day: self.events.append(("after", row["id"], day)))
+        self.day = DAY + timedelta(1)
+        with self.assertLogs("service.common.scheduler", "ERROR"):
+            self.schedule.advance()
+        self.assertIn(("after", 1, self.day), self.events)
+
+    def test_not_loaded(self):
+        """It should have no running set before it is loaded"""
+        schedule = ActivationSchedule()
+        self.assertIsNone(schedule.current().day)
+        self.assertEqual(schedule.advance(), ([], []))
+
+    def test_thread(self):
+        """It should start one midnight thread per process and stop it"""
+        before = threading.active_count()
+        self.schedule.ensure_running()
+        self.schedule.ensure_running()
+        self.assertEqual(threading.active_count(), before + 1)
+        self.schedule.stop()
+
+    def test_seconds_to_midnight(self):
+        """It should count the seconds left in the day"""
+        self.assertEqual(seconds_to_midnight(datetime(2024, 3, 1, 23, 59, 30)), 30)
+        self.assertEqual(seconds_to_midnight(datetime(2024, 3, 1)), 86400)
@@ -0,0 +1,78 @@
+"""
+Test cases for the compiled validation schema
+
+Test cases can be run with:
+    green
+    -vvv --run-coverage
+"""
+from datetime import date
+from unittest import TestCase
+from service.common.schema import Field, compile_schema
+
+
+def check_order(data):
+    """Fails when low is greater than high"""
+    if data["low"] > data["high"]:
+        return "low > high"
+    return None
+
+
+class TestCompileSchema(TestCase):
+    """Test Cases for compile_schema"""
+
+    def setUp(self):
+        self.validate = compile_schema(
+            [
+                Field("name", "string", max_length=5),
+                Field("note", "string", nullable=True),
+                Field("low", "date"),
+                Field("high", "date"),
+                Field("flag", "bool"),
+            ],
+            checks=(check_order,),
+            label="thing",
+        )
+        self.data = {
+            "name": "abc",
+            "note": None,
+            "low": "2023-01-01",
+            "high": date(2023, 2, 1),
+            "flag": "True",
+            "ignored": 1,
+        }
+
+    def test_coerces_valid_data(self):
+        """It should coerce every declared field and drop the others"""
+        self.assertEqual(
+            self.validate(self.data),
+            {
+                "name": "abc",
+                "note": None,
+                "low": date(2023, 1, 1),
+                "high": date(2023, 2, 1),
+                "flag": True,
+            },
+        )
+        for value, expected in [(False, False), ("false", False), ("true", True)]:
+            self.assertEqual(self.validate(dict(self.data, flag=value))["flag"], expected)
+
+    def test_rejects_bad_data(self):
+        """It should raise the first problem it finds"""
+        for key, value, message in [
+            ("name", "too long", "longer than 5"),
+            ("name", 5, "Invalid type for string [name]"),
+            ("name", None, "[name] can not be null"),
+            ("low", "01-01-2023", "Invalid type for date [low]"),
+            ("low", 20230101, "Invalid type for date [low]"),
+            ("flag", "1", "Invalid type for bool [flag]"),
+            ("low", "2023-03-01", "low > high"),
+        ]:
+            with self.assertRaises(ValueError) as context:
+                self.validate(dict(self.data, **{key: value}))
+            self.assertIn(message, str(context.exception))
+
+    def test_rejects_missing_and_non_objects(self):
+        """It should reject payloads that are not objects or miss a field"""
+        del self.data["flag"]
+        self.assertRaisesRegex(ValueError, "Invalid thing: missing flag", self.validate, self.data)
+        self.assertRaisesRegex(ValueError, "expected an object", self.validate, ["a list"])
@@ -0,0 +1,57 @@
+"""
+Test cases for the in-memory n-gram search index
+
+Test cases can be run with:
+    green
+    -vvv --run-coverage
+"""
+from unittest import TestCase
+from service.common.search import NgramIndex, rank
+
+DOCUMENTS = [
+    (1, ("Summer Sale", "Everything must go")),
+    (2, ("Clearance", "Summer stock sale")),
+    (3, ("Back to School", None)),
+    (4, ("Sale on salsa", "Spicy")),
+]
+
+
+class TestSearchIndex(TestCase):
+    """Test Cases for NgramIndex"""
+
+    def setUp(self):
+        self.index = NgramIndex()
+        self.index.rebuild(DOCUMENTS, version=7)
+
+    def test_rank(self):
+        """It should rank prefix matches before substring matches, field by field"""
+        fields = ("summer sale", "everything must go")
+        self.assertEqual(rank(fields, "sum"), 0)
+        self.assertEqual(rank(fields, "sale"), 1)
+        self.assertEqual(rank(fields, "every"), 2)
+        self.assertEqual(rank(fields, "must"), 3)
+        self.assertIsNone(rank(fields, "must", prefix_only=True))
+        self.assertIsNone(rank(fields, "winter"))
+
+    def test_search(self):
+        """It should find documents by any part of their fields, best match first"""
+        self.assertEqual(self.index.version, 7)
+        self.assertEqual(self.index.search("SALE"), [4, 1, 2])
+        self.assertEqual(self.index.search("summer"), [1, 2])
+        self.assertEqual(self.index.search("sal"), [4, 1, 2])
+        self.assertEqual(self.index.search("s"), [1, 4, 3, 2])
+        self.assertEqual(self.index.search("to sch"), [3])
+        self.assertEqual(self.index.search("summer sale stock"), [])
+        self.assertEqual(self.index.search("xyz"), [])
+        self.assertEqual(self.index.search(""), [])
+
+    def test_search_prefix_only(self):
+        """It should only match the start of a field when asked to"""
+        self.assertEqual(self.index.search("sale", prefix_only=True), [4])
+        self.assertEqual(self.index.search("summer", prefix_only=True), [1, 2])
+
+    def test_rebuild(self):
+        """It should replace the indexed documents"""
+        self.index.rebuild([(9, ("Winter Sale", ""))], version=8)
+        self.assertEqual(self.index.search("sale"), [9])
+        self.assertEqual(self.index.version, 8)